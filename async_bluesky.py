@@ -0,0 +1,293 @@
+"""AsyncBlueSky class to interact with the Blue Sky API concurrently via atproto's
+   AsyncClient"""
+
+import asyncio
+import contextlib
+import logging
+
+from bluesky import (normalize_handle, BlueSky, NotificationSelection,
+                     ORIGINAL_POST, PostSelection, search_matches, search_params)
+from lazyimport import lazy_import
+from records import LikeLite
+
+atproto = lazy_import("atproto")
+atproto_client = lazy_import("atproto_client")
+
+# pylint: disable=R0913,R0917
+
+
+class AsyncBlueSky:
+    """Async generator equivalents of the BlueSky fan-out methods. The number of
+       requests in flight at any time is limited by a semaphore. It uses the
+       session of the given (synchronous) BlueSky instance rather than logging in
+       again. Use iterate() to consume any of its async generators from
+       synchronous code. The posts, notifications and search results to return
+       are selected as by BlueSky, see PostSelection, only the pages are fetched
+       here."""
+    MAX_CONCURRENCY = 8
+
+    def __init__(self, bs, max_concurrency=MAX_CONCURRENCY):
+        self.bs = bs
+        self.max_concurrency = max_concurrency
+        self.logger = logging.getLogger(__name__)
+        self.loop = asyncio.new_event_loop()
+        self._client = None
+        self._request = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def handle(self):
+        """The handle of the authenticated user"""
+        return self.bs.handle
+
+    async def client(self):
+        """Return the async client, importing the session of the synchronous
+           client the first time it is needed. The session is saved when the
+           async client refreshes it, as it is for the synchronous client."""
+        if not self._client:
+            if self.bs.cassette:
+                request = self.bs.cassette.async_request(self.bs.transport)
+            else:
+                request = self.bs.transport.async_request()
+            client = atproto.AsyncClient(request=request)
+            self._request = request
+            # pylint: disable=W0212 (protected-access)
+            # login(session_string=...) makes a getProfile request we don't need
+            await client._import_session_string(self.bs.client.export_session_string())
+            self.bs.save_session_changes(client)
+            self._client = client
+        return self._client
+
+    async def _call(self, method_name, *args, **kwargs):
+        """Call the given async client method, limiting the number of requests in
+           flight and retrying on failure with the BlueSky instance's retrier.
+           The backoff between attempts doesn't hold a request slot."""
+        client = await self.client()
+        method = self._resolve(client, method_name)
+
+        async def attempt():
+            async with self._semaphore:
+                return await method(*args, **kwargs)
+
+        return await self.bs.retrier.call_async(attempt)
+
+    def _pages(self, fetch):
+        """Return an async generator of the pages returned by the awaitable
+           fetch(cursor) for each cursor until a page has no cursor, closed when
+           used as an async context manager"""
+        async def pages():
+            cursor = None
+            while True:
+                rsp = await fetch(cursor)
+                yield rsp
+                if not rsp.cursor:
+                    return
+                self.logger.info("Cursor found, retrieving next page...")
+                cursor = rsp.cursor
+
+        return contextlib.aclosing(pages())
+
+    @staticmethod
+    def _resolve(client, method_name):
+        """Return the client method for the given dotted name, e.g.
+           app.bsky.feed.search_posts"""
+        obj = client
+        for name in method_name.split("."):
+            obj = getattr(obj, name)
+        return obj
+
+    def normalize_handle_value(self, handle):
+        """See BlueSky.normalize_handle_value()"""
+        return self.bs.normalize_handle_value(handle)
+
+    def iterate(self, agen):
+        """A generator to yield the items of the given async generator from
+           synchronous code. Concurrent requests started by the async generator
+           run while we wait for each item."""
+        while True:
+            try:
+                item = self.loop.run_until_complete(anext(agen))
+            except StopAsyncIteration:
+                return
+            try:
+                yield item
+            except GeneratorExit:
+                # Our caller stopped early, let the async generator clean up
+                self.loop.run_until_complete(agen.aclose())
+                raise
+
+    def run(self, coro):
+        """Run the given coroutine to completion from synchronous code and return
+           its result"""
+        return self.loop.run_until_complete(coro)
+
+    def close(self):
+        """Close the async client's connections, if it was created, and the
+           event loop"""
+        if self._request:
+            self.loop.run_until_complete(self._request.close())
+            self._request = None
+        self.loop.close()
+
+    @normalize_handle
+    async def get_posts(self, handle=None, date_limit_str=None, count_limit=None,
+                        post_filter=ORIGINAL_POST, stored=False):
+        """An async generator to return an entry for posts for the given user
+           handle, see BlueSky.get_posts(). Stored posts are read from the post
+           store once it's synced."""
+        if stored:
+            for post in self.bs.get_posts(handle, date_limit_str, count_limit,
+                                          post_filter, stored=True):
+                yield post
+            return
+
+        selection = PostSelection(handle, date_limit_str, count_limit, post_filter,
+                                  self.logger)
+        async with self._pages(lambda cursor: self._call(
+                "get_author_feed", actor=handle, cursor=cursor)) as pages:
+            async for feed in pages:
+                for post in selection.page(feed):
+                    yield post
+                if selection.done:
+                    return
+
+    async def get_post_likes(self, uri, lean=False):
+        """An async generator to yield details of the likes for a given post uri,
+           as LikeLite records if lean"""
+        async with self._pages(lambda cursor: self._call(
+                "get_likes", uri, cursor=cursor)) as pages:
+            async for rsp in pages:
+                for like in rsp.likes:
+                    yield LikeLite.from_like(like) if lean else like
+
+    async def get_posts_likes(self, posts, ordered=True, lean=False):
+        """An async generator to yield (post, likes) for each post of the given
+           async iterable of posts. The likes of up to max_concurrency posts are
+           retrieved concurrently while further posts stream in. The results are
+           yielded in post order or, if ordered is False, as soon as each post's
+           likes are complete. lean gives the likes as LikeLite records."""
+        async def post_likes(post):
+            return post, [like async for like in self.get_post_likes(post.uri,
+                                                                     lean)]
+
+        pending = []
+        try:
+            async for post in posts:
+                pending.append(asyncio.ensure_future(post_likes(post)))
+                if len(pending) >= self.max_concurrency:
+                    if ordered:
+                        yield await pending.pop(0)
+                    else:
+                        for result in await self._completed(pending):
+                            yield result
+            while pending:
+                if ordered:
+                    yield await pending.pop(0)
+                else:
+                    for result in await self._completed(pending):
+                        yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _completed(pending):
+        """Wait for at least one of the given tasks to complete. Remove the
+           completed tasks from the pending list and return their results"""
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            pending.remove(task)
+        return [task.result() for task in done]
+
+    @normalize_handle
+    async def follows(self, handle):
+        """An async generator to return an entry for each user that the given
+           user handle follows"""
+        async for profile in self._graph("follows", handle):
+            yield profile
+
+    @normalize_handle
+    async def followers(self, handle):
+        """An async generator to return an entry for each user that follows the
+           given user handle"""
+        async for profile in self._graph("followers", handle):
+            yield profile
+
+    async def _graph(self, kind, handle):
+        """An async generator to return an entry for each of the follows or
+           followers (kind) of the given user handle"""
+        method_name = "get_follows" if kind == "follows" else "get_followers"
+        async with self._pages(lambda cursor: self._call(
+                method_name, handle, cursor=cursor)) as pages:
+            async for rsp in pages:
+                for profile in getattr(rsp, kind):
+                    yield profile
+
+    async def get_post(self, uri):
+        """Get details of the post at the given uri, None if it doesn't exist"""
+        did, rkey = BlueSky.at_uri_to_did_rkey(uri)
+        try:
+            return await self._call("get_post", rkey, profile_identify=did)
+        except atproto_client.exceptions.BadRequestError as ex:
+            if ex.response.content.error == "RecordNotFound":
+                return None
+            raise
+
+    async def get_notifications(self, date_limit_str=None, count_limit=None,
+                                mark_read=False, get_all=False):
+        """An async generator to yield (notification, post) for the authenticated
+           handle, see BlueSky.get_notifications()"""
+        selection = NotificationSelection(date_limit_str, count_limit, get_all,
+                                          self.logger)
+        try:
+            async with self._pages(lambda cursor: self._call(
+                    "app.bsky.notification.list_notifications",
+                    params={"cursor": cursor})) as pages:
+                async for rsp in pages:
+                    notifs = selection.page(rsp)
+                    posts = await self.get_posts_by_uri(selection.subjects(notifs))
+                    for pair in selection.pairs(notifs, posts):
+                        yield pair
+                    if selection.done:
+                        return
+        finally:
+            if mark_read:
+                client = await self.client()
+                await self._call("app.bsky.notification.update_seen",
+                                 {"seen_at": client.get_current_time_iso()})
+
+    async def get_posts_by_uri(self, uris):
+        """Return a dict of post views keyed by URI for the given post URIs, see
+           BlueSky.get_posts_by_uri(). The batches are retrieved concurrently."""
+        uris = list(dict.fromkeys(uri for uri in uris if uri))
+        batch_size = BlueSky.GET_POSTS_BATCH_SIZE
+        rsps = await asyncio.gather(*[
+                self._call("app.bsky.feed.get_posts",
+                           params={"uris": uris[i:i + batch_size]})
+                for i in range(0, len(uris), batch_size)])
+        return {post.uri: post for rsp in rsps for post in rsp.posts}
+
+    async def search(self, term, author, date_limit_str, sort_order, is_follow,
+                     is_follower):
+        """An async generator to yield posts that match the given search terms,
+           see BlueSky.search(). The follows and followers are retrieved
+           concurrently if needed."""
+        params = search_params(term, author and self.normalize_handle_value(author),
+                               date_limit_str, sort_order)
+
+        async def handles(profiles_fn, needed):
+            if not needed:
+                return []
+            return [entry.handle async for entry in profiles_fn(self.handle)]
+
+        follows, followers = await asyncio.gather(
+                handles(self.follows, is_follow is not None),
+                handles(self.followers, is_follower is not None))
+
+        async with self._pages(lambda cursor: self._call(
+                "app.bsky.feed.search_posts",
+                params={**params, "cursor": cursor})) as pages:
+            async for rsp in pages:
+                for match in search_matches(rsp.posts, follows, followers, is_follow,
+                                            is_follower):
+                    yield match
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 """BlueSky command line interface: Base class for command classes"""
 
+import sys
+
 import dateparse
+from lazyimport import lazy_import
+import outputformat
+
+# Only commands that fan out requests need asyncio and the async client
+async_bluesky = lazy_import("async_bluesky")
 
 
 class BaseCmd:
@@ -11,14 +18,46 @@ class BaseCmd:
         self.bs = bs
         self.ns = ns
         self.config = config
+        self._async_bs = None
+        # The --format jsonl/csv/tsv formatter, None to print text
+        self.formatter = outputformat.create(
+                getattr(ns, "format", outputformat.TEXT),
+                outputformat.parse_fields(getattr(ns, "fields", None)))
+
+    @property
+    def async_bs(self):
+        """Dynamic AsyncBlueSky attribute for commands that fan out many
+           requests. Created when first needed, it shares the session of self.bs.
+           The [concurrency] requests config value limits requests in flight."""
+        if not self._async_bs:
+            cls = async_bluesky.AsyncBlueSky
+            max_concurrency = self.config.getint("concurrency", "requests",
+                                                 fallback=cls.MAX_CONCURRENCY)
+            self._async_bs = cls(self.bs, max_concurrency)
+        return self._async_bs
 
     def run(self):
         """Run the command for the given command details passed to constructor"""
         method_name = self.ns.cmd.name.replace("-", '_')
-        getattr(self, method_name)(*self.ns.cmd.func_args(self.ns))
+        try:
+            getattr(self, method_name)(*self.ns.cmd.func_args(self.ns))
+        finally:
+            if self.formatter:
+                self.formatter.close()
+            if self._async_bs:
+                self._async_bs.close()
+                self._async_bs = None
+
+    def print_summary(self, text):
+        """Print a summary line, to stderr when records are formatted so that
+           stdout only has records"""
+        print(text, file=sys.stderr if self.formatter else sys.stdout)
 
     def print_profile(self, profile, label="Profile", full=False):
         """Print details of the given profile structure"""
+        if self.formatter:
+            self.formatter.write("profile", profile)
+            return
         print(self.profile_name(profile, label))
         if full:
             print(self.profile_link(profile))
@@ -45,6 +84,14 @@ class BaseCmd:
 
     def print_post_entry(self, post, follows=None, followers=None):
         """Print details of the given post structure"""
+        if self.formatter:
+            extra = {}
+            if follows:
+                extra["follows"] = post.author.handle in follows
+            if followers:
+                extra["follower"] = post.author.handle in followers
+            self.formatter.write("post", post, **extra)
+            return
         print(self.profile_name(post.author))
         print(self.profile_link(post.author))
         if follows:
@@ -54,7 +101,7 @@ class BaseCmd:
             is_follower = post.author.handle in followers
             print(f"Follower: {is_follower}")
         print(f"Date: {dateparse.humanise_date_string(post.record.created_at)}")
-        if hasattr(post, "repost_date"):
+        if getattr(post, "repost_date", None):
             print(f"Repost Date: "
                   f"{dateparse.humanise_date_string(post.repost_date)}")
         print(f"Post URI: {post.uri}")
@@ -65,6 +112,9 @@ class BaseCmd:
         print(f"Text: {post.record.text}")
         print("-----")
 
-    def print_like_entry(self, like, full=False):
+    def print_like_entry(self, like, full=False, post_uri=None):
         """Print details of the given post like"""
+        if self.formatter:
+            self.formatter.write("like", like, post_uri=post_uri)
+            return
         self.print_profile(like.actor, label="Liked By", full=full)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+
+"""Offline throughput benchmarks of the BlueSky generators
+
+Each benchmark feeds one of the BlueSky generators synthetic pages from a
+FakeClient, with an optional simulated latency per API call, and reports the
+items processed per second, the number of API calls made and the peak memory
+allocated while consuming the generator. Timing and memory are measured in
+separate runs since tracing allocations slows everything down.
+
+Save the results of one commit with --save and compare another commit against
+them with --compare to catch performance regressions, e.g.
+
+    ./benchmark.py --items 100000 --save before.json
+    ./benchmark.py --items 100000 --compare before.json
+
+--footprint reports the memory each atproto model kept in a result set takes
+and that of its lean record, see records.py."""
+
+import argparse
+import collections
+import json
+import sys
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from atproto import models
+
+from bluesky import BlueSky
+from records import LikeLite, PostLite, ProfileLite
+from retry import Retrier
+import tid
+
+# pylint: disable=R0913,R0917
+
+HANDLE = "bench.bsky.social"
+AUTHOR_DID = "did:plc:benchbenchbenchbenchbenc"
+# Fixtures are dated a second apart going back from here
+NEWEST = datetime(2025, 1, 1, tzinfo=timezone.utc)
+# Older than every fixture so that the date limit checks run for every item
+DATE_LIMIT = "2000-01-01"
+REPOSTERS_PER_POST = 10
+
+
+class FakeClient:
+    """Stand in for atproto.Client that returns synthetic pages of items
+       numbered 0 to items - 1, newest first, sleeping for latency seconds per
+       call. Items are created as each page is requested so that the memory
+       measured is what the code under test keeps, not the fixtures. The number
+       of calls of each method is counted in calls."""
+    def __init__(self, items, page_size=100, latency=0.0):
+        self.items = items
+        self.page_size = page_size
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.app = SimpleNamespace(bsky=SimpleNamespace(
+            feed=SimpleNamespace(get_actor_likes=self.get_actor_likes,
+                                 get_posts=self.get_posts,
+                                 search_posts=self.search_posts,
+                                 like=SimpleNamespace(get=self.get_like)),
+            notification=SimpleNamespace(list_notifications=self.list_notifications,
+                                         update_seen=self.update_seen)))
+
+    def _call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _page(self, cursor, make_item, total=None):
+        """Return the items of the page at the given cursor and the next
+           cursor, None for the last page"""
+        total = self.items if total is None else total
+        start = int(cursor or 0)
+        end = min(start + self.page_size, total)
+        return [make_item(i) for i in range(start, end)], \
+            str(end) if end < total else None
+
+    @staticmethod
+    def created_at(i):
+        """The creation date of item i"""
+        return NEWEST - timedelta(seconds=i)
+
+    @staticmethod
+    def profile(i):
+        """A synthetic profile"""
+        return SimpleNamespace(did=f"did:plc:{i:024d}", handle=f"user{i}.bsky.social",
+                               display_name=f"User {i}")
+
+    def post(self, i, handle=HANDLE):
+        """A synthetic post by the given author"""
+        dt = self.created_at(i)
+        rkey = tid.from_datetime(dt)
+        return SimpleNamespace(
+                uri=f"at://{AUTHOR_DID}/app.bsky.feed.post/{rkey}",
+                cid=f"cid{i}",
+                author=SimpleNamespace(did=AUTHOR_DID, handle=handle),
+                record=SimpleNamespace(created_at=dt.isoformat(), text=f"Post {i}"),
+                like_count=i % 50, repost_count=i % 3, reply_count=0,
+                indexed_at=dt.isoformat(),
+                viewer=SimpleNamespace(like=f"at://{AUTHOR_DID}/app.bsky.feed.like/"
+                                            f"{rkey}"))
+
+    def get_author_feed(self, actor, cursor=None, **_):
+        """app.bsky.feed.getAuthorFeed"""
+        self._call("get_author_feed")
+        views, cursor = self._page(
+                cursor, lambda i: SimpleNamespace(post=self.post(i, actor),
+                                                  reply=None, reason=None))
+        return SimpleNamespace(feed=views, cursor=cursor)
+
+    def get_actor_likes(self, params):
+        """app.bsky.feed.getActorLikes"""
+        self._call("get_actor_likes")
+        likes, cursor = self._page(params.get("cursor"),
+                                   lambda i: SimpleNamespace(post=self.post(i)))
+        return SimpleNamespace(feed=likes, cursor=cursor)
+
+    def get_like(self, did, rkey):
+        """app.bsky.feed.like.get"""
+        self._call("like.get")
+        return SimpleNamespace(value=SimpleNamespace(
+                created_at=tid.to_datetime(rkey).isoformat()))
+
+    def get_posts(self, params):
+        """app.bsky.feed.getPosts"""
+        self._call("get_posts")
+        return SimpleNamespace(posts=[SimpleNamespace(uri=uri)
+                                      for uri in params["uris"]])
+
+    def search_posts(self, params):
+        """app.bsky.feed.searchPosts"""
+        self._call("search_posts")
+        posts, cursor = self._page(params.get("cursor"), self.post)
+        return SimpleNamespace(posts=posts, cursor=cursor)
+
+    def list_notifications(self, params):
+        """app.bsky.notification.listNotifications"""
+        self._call("list_notifications")
+
+        def notification(i):
+            # Several notifications refer to each post
+            post = self.post(i // 4)
+            return SimpleNamespace(reason="like", reason_subject=post.uri,
+                                   is_read=False, author=self.profile(i),
+                                   record=SimpleNamespace(
+                                       created_at=self.created_at(i).isoformat()))
+        notifs, cursor = self._page(params.get("cursor"), notification)
+        return SimpleNamespace(notifications=notifs, cursor=cursor)
+
+    def update_seen(self, data):
+        """app.bsky.notification.updateSeen"""
+        self._call("update_seen")
+
+    def get_follows(self, actor, cursor=None, **_):
+        """app.bsky.graph.getFollows: items 0 to items - 1"""
+        self._call("get_follows")
+        profiles, cursor = self._page(cursor, self.profile)
+        return SimpleNamespace(follows=profiles, cursor=cursor,
+                               subject=SimpleNamespace(did=AUTHOR_DID, handle=actor))
+
+    def get_followers(self, actor, cursor=None, **_):
+        """app.bsky.graph.getFollowers: items items / 2 to items * 3 / 2 - 1, so
+           half of them are mutuals"""
+        self._call("get_followers")
+        offset = self.items // 2
+        profiles, cursor = self._page(cursor, lambda i: self.profile(i + offset))
+        return SimpleNamespace(followers=profiles, cursor=cursor,
+                               subject=SimpleNamespace(did=AUTHOR_DID, handle=actor))
+
+    def get_reposted_by(self, uri, cursor=None, **_):
+        """app.bsky.feed.getRepostedBy: a few of a pool of profiles"""
+        self._call("get_reposted_by")
+        first = zlib.crc32(uri.encode()) % 1000
+        profiles, cursor = self._page(
+                cursor, lambda i: self.profile(first + i), total=REPOSTERS_PER_POST)
+        return SimpleNamespace(reposted_by=profiles, cursor=cursor, uri=uri)
+
+
+# Users of each side get_mutuals_spilled holds in memory
+SPILL_RUN_SIZE = 1000
+# Each benchmark returns the generator to consume
+BENCHMARKS = {
+    "get_posts": lambda bs: bs.get_posts(HANDLE, date_limit_str=DATE_LIMIT),
+    "get_likes": lambda bs: bs.get_likes(DATE_LIMIT, get_date=True),
+    "get_notifications": lambda bs: bs.get_notifications(date_limit_str=DATE_LIMIT,
+                                                         get_all=True),
+    "search": lambda bs: bs.search("term", None, DATE_LIMIT, "latest", None, None),
+    "get_mutuals": lambda bs: bs.get_mutuals(HANDLE, "both"),
+    "get_reposters": lambda bs: bs.get_reposters(HANDLE, date_limit_str=DATE_LIMIT),
+    "get_mutuals_lean": lambda bs: bs.get_mutuals(HANDLE, "both", lean=True),
+    "get_reposters_lean": lambda bs: bs.get_reposters(HANDLE,
+                                                      date_limit_str=DATE_LIMIT,
+                                                      lean=True),
+    "get_mutuals_spilled": lambda bs: bs.get_mutuals(HANDLE, "both",
+                                                     run_size=SPILL_RUN_SIZE),
+}
+
+
+def model_profile(i):
+    """A profile view model as returned by getFollows, getFollowers etc."""
+    created_at = FakeClient.created_at(i).isoformat()
+    return models.AppBskyActorDefs.ProfileView(
+            did=f"did:plc:{i:024d}", handle=f"user{i}.bsky.social",
+            display_name=f"User {i}", description=f"The profile of user {i}",
+            avatar=f"https://cdn.bsky.app/img/avatar/plain/did:plc:{i:024d}/"
+                   f"bafkrei{i:052d}@jpeg",
+            created_at=created_at, indexed_at=created_at,
+            viewer=models.AppBskyActorDefs.ViewerState(muted=False,
+                                                       blocked_by=False),
+            labels=[])
+
+
+def model_post(i):
+    """A post view model as returned by getAuthorFeed"""
+    dt = FakeClient.created_at(i)
+    profile = model_profile(i)
+    return models.AppBskyFeedDefs.PostView(
+            uri=f"at://{AUTHOR_DID}/app.bsky.feed.post/{tid.from_datetime(dt)}",
+            cid=f"bafyrei{i:052d}",
+            author=models.AppBskyActorDefs.ProfileViewBasic(
+                did=profile.did, handle=profile.handle,
+                display_name=profile.display_name, avatar=profile.avatar,
+                viewer=profile.viewer, labels=[]),
+            record=models.AppBskyFeedPost.Record(text=f"Post number {i}",
+                                                 created_at=dt.isoformat(),
+                                                 langs=["en"]),
+            indexed_at=dt.isoformat(), like_count=i % 50, repost_count=i % 3,
+            reply_count=0, quote_count=0,
+            viewer=models.AppBskyFeedDefs.ViewerState(), labels=[])
+
+
+def model_like(i):
+    """A like model as returned by getLikes"""
+    created_at = FakeClient.created_at(i).isoformat()
+    return models.AppBskyFeedGetLikes.Like(actor=model_profile(i),
+                                           created_at=created_at,
+                                           indexed_at=created_at)
+
+
+# The model of each kind of record and its lean record
+FOOTPRINTS = {"profile": (model_profile, ProfileLite.from_profile),
+              "post": (model_post, PostLite.from_post),
+              "like": (model_like, LikeLite.from_like)}
+
+
+def retained_bytes(make, count):
+    """Return the memory (bytes) taken by a list of count items made by
+       make(i), including everything they refer to that is made with them"""
+    tracemalloc.start()
+    try:
+        items = [make(i) for i in range(count)]
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del items
+    return current
+
+
+def footprint(count=1000):
+    """Return a dict of the average memory (bytes) of each kind of record kept
+       as an atproto model and as a lean record"""
+    return {kind: {"model": retained_bytes(make, count) / count,
+                   "lean": retained_bytes(lambda i, m=make, c=lean: c(m(i)),
+                                          count) / count}
+            for kind, (make, lean) in FOOTPRINTS.items()}
+
+
+def print_footprint(results):
+    """Print a table of the given footprint() results"""
+    print(f"{'record':<10}{'model B':>10}{'lean B':>10}{'saving':>9}")
+    for kind, sizes in results.items():
+        print(f"{kind:<10}{sizes['model']:>10.0f}{sizes['lean']:>10.0f}"
+              f"{sizes['model'] / sizes['lean']:>8.1f}x")
+
+
+def make_bluesky(client):
+    """Return a BlueSky instance using the given fake client"""
+    bs = BlueSky(HANDLE, "", retrier=Retrier(base_delay=0))
+    bs._client = client     # pylint: disable=W0212 (protected-access)
+    return bs
+
+
+def run(name, items, page_size=100, latency=0.0, memory=True):
+    """Run the named benchmark, return a dict of its results"""
+    client = FakeClient(items, page_size, latency)
+    start = time.perf_counter()
+    yielded = sum(1 for _ in BENCHMARKS[name](make_bluesky(client)))
+    elapsed = time.perf_counter() - start
+
+    result = {"benchmark": name,
+              "items": items,
+              "yielded": yielded,
+              "seconds": elapsed,
+              "items_per_sec": items / elapsed if elapsed else 0.0,
+              "calls": sum(client.calls.values()),
+              "peak_mb": None}
+
+    if memory:
+        client = FakeClient(items, page_size, latency)
+        tracemalloc.start()
+        try:
+            for _ in BENCHMARKS[name](make_bluesky(client)):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_mb"] = peak / 2 ** 20
+    return result
+
+
+def print_results(results, baseline=None):
+    """Print a table of the given results, with the throughput relative to the
+       baseline results if given"""
+    header = f"{'benchmark':<20}{'items':>10}{'yielded':>10}{'seconds':>10}" \
+             f"{'items/s':>12}{'calls':>8}{'peak MB':>9}"
+    print(header + (f"{'vs base':>9}" if baseline else ""))
+    for result in results:
+        peak = f"{result['peak_mb']:.1f}" if result["peak_mb"] is not None else "-"
+        line = f"{result['benchmark']:<20}{result['items']:>10}" \
+               f"{result['yielded']:>10}{result['seconds']:>10.3f}" \
+               f"{result['items_per_sec']:>12.0f}{result['calls']:>8}{peak:>9}"
+        if baseline and result["benchmark"] in baseline:
+            base = baseline[result["benchmark"]]["items_per_sec"]
+            line += f"{result['items_per_sec'] / base:>8.2f}x"
+        print(line)
+
+
+def regressions(results, baseline, tolerance):
+    """Return the names of the benchmarks whose throughput is more than
+       tolerance (a fraction) below the baseline"""
+    return [result["benchmark"] for result in results
+            if result["benchmark"] in baseline and
+            result["items_per_sec"] <
+            baseline[result["benchmark"]]["items_per_sec"] * (1 - tolerance)]
+
+
+def main(argv=None):
+    """Run the benchmarks given on the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"Benchmarks to run: {', '.join(BENCHMARKS)} "
+                             f"[default: all]")
+    parser.add_argument("--items", "-n", type=int, default=10000,
+                        help="Number of items to feed each generator")
+    parser.add_argument("--page-size", type=int, default=100,
+                        help="Number of items per page")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Simulated latency of each API call in seconds")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Timing runs of each benchmark, the fastest is used")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Don't measure peak memory")
+    parser.add_argument("--save", metavar="PATH", help="Save the results as JSON")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="Compare with results saved by --save, exit with "
+                             "status 1 if any benchmark is slower than tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed fractional throughput drop for --compare")
+    parser.add_argument("--footprint", action="store_true",
+                        help="Show the memory of each kind of record as a model "
+                             "and as a lean record instead")
+    args = parser.parse_args(argv)
+    if args.footprint:
+        print_footprint(footprint(args.items))
+        return 0
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = []
+    for name in args.benchmarks or BENCHMARKS:
+        runs = [run(name, args.items, args.page_size, args.latency, memory=False)
+                for _ in range(args.repeat - 1)]
+        runs.append(run(name, args.items, args.page_size, args.latency,
+                        memory=not args.no_memory))
+        result = min(runs, key=lambda r: r["seconds"])
+        result["peak_mb"] = runs[-1]["peak_mb"]
+        results.append(result)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {result["benchmark"]: result for result in json.load(f)}
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            print(f"Regressions: {', '.join(slower)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
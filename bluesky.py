@@ -2,17 +2,37 @@
 
 # pylint: disable=W0511 (fixme)
 
+import bisect
+import concurrent.futures
 import functools
+import heapq
 import inspect
+import json
 import logging
+import os
+import queue
+import threading
+import time
 
-import atproto
-import atproto_core
-import atproto_client
-from wand.image import Image
-import dateutil
+import atproto_core.exceptions
 
+import cleanup
 import dateparse
+import extsort
+from handles import HandleResolver
+import images
+from lazyimport import lazy_import
+import paginate
+from profilecache import LRUCache
+from records import LikeLite, PostLite, ProfileLite
+from retry import Retrier, retried
+import session
+import tid
+import timestamp
+from transport import Transport
+
+atproto = lazy_import("atproto")
+atproto_client = lazy_import("atproto_client")
 
 # pylint: disable=R0912,R0913,R0914,R0917,R0904
 # Ignore pylint peevishness. These kinds of restrictions are what ruined many
@@ -23,18 +43,24 @@ import dateparse
 
 def normalize_handle(func):
     """Decorator to normalize a handle argument, see normalize_handle_value()"""
+    # Find where the 'handle' argument is once rather than binding the
+    # arguments of every call. Its index excludes self.
+    param = inspect.signature(func).parameters["handle"]
+    index = list(inspect.signature(func).parameters).index("handle") - 1
+
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
-        # Get method signature and bind the given arguments to it
-        sig = inspect.signature(func)
-        bound_args = sig.bind(self, *args, **kwargs)
-
-        # Assume we have a 'handle' argument and replace with its normalized value
-        handle = bound_args.arguments["handle"]
-        bound_args.arguments["handle"] = self.normalize_handle_value(handle)
+        # Replace the handle argument with its normalized value
+        if "handle" in kwargs:
+            kwargs["handle"] = self.normalize_handle_value(kwargs["handle"])
+        elif len(args) > index:
+            args = (*args[:index], self.normalize_handle_value(args[index]),
+                    *args[index + 1:])
+        elif param.default is not param.empty:
+            kwargs["handle"] = self.normalize_handle_value(param.default)
 
         # Call the original wrapped method
-        return func(*bound_args.args, **bound_args.kwargs)
+        return func(self, *args, **kwargs)
     return wrapper
 
 
@@ -70,60 +96,386 @@ REPLY_POST = PostType(PostType.REPLY)
 ALL_POST = PostType(PostType.ALL)
 
 
+def is_original_post(view, handle):
+    """Return whether the given feed view of the given user's feed is an original
+       post by the user"""
+    return view.post.author.handle == handle and not view.reply
+
+
+def is_reply_post(view, handle):
+    """Return whether the given feed view of the given user's feed is a reply by
+       the user"""
+    return view.post.author.handle == handle and view.reply
+
+
+def is_repost_post(view, handle):
+    """Return whether the given feed view of the given user's feed is a repost"""
+    return view.post.author.handle != handle
+
+
+def filter_post(filter_post_type, view, handle):
+    """Ignore this post if it's not one of the following:
+        - requested type is repost and the author handle is not ours
+        - requested type is reply and there is a reply structure and the
+            author's handle is our own
+        - requested type is original and there is no reply structure and
+            the author's handle is our own"""
+    return not ((filter_post_type.repost() and
+                 view.post.author.handle != handle) or
+                (filter_post_type.reply() and
+                 view.reply and view.post.author.handle == handle) or
+                (filter_post_type.original() and not view.reply and
+                 view.post.author.handle == handle))
+
+
+def view_date(view, handle):
+    """Return the datetime of the given feed view: when it was reposted for
+       reposts, otherwise when the post was created"""
+    if is_repost_post(view, handle):
+        return timestamp.parse(view.reason.indexed_at)
+    return timestamp.parse(view.post.record.created_at)
+
+
+def date_cutoff(views, handle, date_limit):
+    """Return the index of the first of the given feed views older than the
+       date limit, len(views) if there is no date limit"""
+    if not date_limit:
+        return len(views)
+    return timestamp.cutoff(views, date_limit, lambda view: view_date(view, handle))
+
+
+def feed_post(view, handle):
+    """Return the post of the given feed view with its reply details and,
+       for reposts, the repost date"""
+    view.post.reply = view.reply
+    if is_repost_post(view, handle):
+        view.post.repost_date = view.reason.indexed_at
+    return view.post
+
+
+def feed_key(view):
+    """Return the post store key of the given feed view. A repost of a post
+       is a different entry to the post."""
+    if view.reason and getattr(view.reason, "indexed_at", None):
+        return f"{view.post.uri} {view.reason.indexed_at}"
+    return view.post.uri
+
+
+def notification_cutoff(notifs, date_limit):
+    """Return the index of the first of the given notifications older than
+       the date limit, len(notifs) if there is no date limit"""
+    if not date_limit:
+        return len(notifs)
+    return timestamp.cutoff(notifs, date_limit,
+                            lambda notif: timestamp.parse(notif.record.created_at))
+
+
+def search_params(term, author, date_limit_str, sort_order):
+    """Return the app.bsky.feed.searchPosts parameters of a search for the given
+       term, optionally by the given (normalized) author handle and since the
+       date limit"""
+    params = {"q": term,
+              "limit": 100,
+              "sort": sort_order}
+    if author:
+        params["author"] = author
+    if date_limit_str:
+        params["since"] = dateparse.parse(date_limit_str).strftime(
+                "%Y-%m-%dT%H:%M:%SZ")
+    return params
+
+
+def search_matches(posts, follows, followers, is_follow, is_follower):
+    """A generator to yield (post, follows, followers) for each of the given
+       search results whose author is, or isn't, one of the given follows and
+       followers handles as is_follow and is_follower require, if they're set"""
+    for post in posts:
+        if is_follow is not None and (post.author.handle in follows) != is_follow:
+            continue
+        if is_follower is not None and \
+           (post.author.handle in followers) != is_follower:
+            continue
+        yield (post, follows, followers)
+
+
+def notification_subject(notif):
+    """Return the URI of the post that the given notification refers to, None
+       if it doesn't refer to a post"""
+    if notif.reason == "reply":
+        return notif.record.reply.parent.uri
+    if notif.reason in ["like", "repost"]:
+        return notif.reason_subject
+    return None
+
+
+class PostSelection:
+    """Select the posts to return from a user's author feed, a page at a time:
+       those of the post_filter types up to the date and count limits. done is
+       set once a limit is reached so that no more pages are needed. Shared by
+       BlueSky and AsyncBlueSky, which only fetch the pages."""
+    def __init__(self, handle, date_limit_str=None, count_limit=None,
+                 post_filter=ORIGINAL_POST, logger=None):
+        self.handle = handle
+        self.date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
+        self.count_limit = count_limit
+        self.post_filter = post_filter
+        self.logger = logger or logging.getLogger(__name__)
+        self.count = 0
+        self.done = False
+
+    def page(self, feed):
+        """Return the posts of the given page of the feed"""
+        # The feed is newest first, so the posts older than the date limit are at
+        # the end of the page and any further pages are older
+        end = date_cutoff(feed.feed, self.handle, self.date_limit)
+        posts = list(self.select(feed.feed[:end]))
+        if not self.done and end < len(feed.feed):
+            self.logger.info("Date limit reached")
+            self.done = True
+        return posts
+
+    def select(self, views):
+        """A generator to yield the posts of the given feed views of the
+           post_filter types, up to the count limit"""
+        for view in views:
+            if filter_post(self.post_filter, view, self.handle):
+                continue
+
+            # Apply count check after filter checks above.
+            if self.count_limit:
+                self.count += 1
+                if self.count > self.count_limit:
+                    self.logger.info("Count limit reached")
+                    self.done = True
+                    return
+
+            yield feed_post(view, self.handle)
+
+
+class NotificationSelection:
+    """Select the notifications to return a page at a time: up to the date and
+       count limits and, unless get_all, until the first one that's already
+       read. done is set once the rest aren't needed. Shared by BlueSky and
+       AsyncBlueSky, which only fetch the pages and the posts they refer to."""
+    def __init__(self, date_limit_str=None, count_limit=None, get_all=False,
+                 logger=None):
+        self.date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
+        self.count_limit = count_limit
+        self.get_all = get_all
+        self.logger = logger or logging.getLogger(__name__)
+        self.count = 0
+        self.done = False
+
+    def page(self, rsp):
+        """Return the notifications of the given page"""
+        notifs = []
+        # Once we get to notifications older than the date limit, we assume the
+        # rest of the notifications are older
+        end = notification_cutoff(rsp.notifications, self.date_limit)
+        for notif in rsp.notifications[:end]:
+            if self.count_limit:
+                self.count += 1
+                if self.count > self.count_limit:
+                    self.logger.info("Count limit reached")
+                    self.done = True
+                    return notifs
+
+            # If we're not returning all (already read) notificiations then we're
+            # done when we hit the first already read notification.
+            if not self.get_all and notif.is_read:
+                self.done = True
+                return notifs
+
+            notifs.append(notif)
+
+        if end < len(rsp.notifications):
+            self.logger.info("Date limit reached")
+            self.done = True
+        return notifs
+
+    @staticmethod
+    def subjects(notifs):
+        """Return the URIs of the posts that the given notifications refer to"""
+        return [notification_subject(notif) for notif in notifs]
+
+    @staticmethod
+    def pairs(notifs, posts):
+        """Return (notification, post) for each of the given notifications, with
+           the post it refers to from the given dict of posts by URI"""
+        return [(notif, posts.get(notification_subject(notif))) for notif in notifs]
+
+
 class BlueSky:
     """Command line client for Blue Sky"""
-    BLUESKY_MAX_IMAGE_SIZE = 976.56 * 1024
+    BLUESKY_MAX_IMAGE_SIZE = images.MAX_SIZE
+    MAX_IMAGES = 4
     FAILURE_LIMIT = 10
+    # Maximum number of URIs per app.bsky.feed.getPosts request
+    GET_POSTS_BATCH_SIZE = 25
+    # Maximum number of actors per app.bsky.actor.getProfiles request
+    GET_PROFILES_BATCH_SIZE = 25
+    # Posts whose reposters are retrieved concurrently by get_reposters()
+    REPOSTERS_CONCURRENCY = 8
     PROFILE_URL = "https://bsky.app/profile/"
-
-    def __init__(self, handle, password):
+    # get_mutuals() flags and the side that must be complete before entries of
+    # the other side can be yielded
+    MUTUALS_REFERENCE = {"both": None,
+                         "follows-not-followers": "followers",
+                         "followers-not-follows": "follows"}
+
+    def __init__(self, handle, password, session_path=None, graph_cache=None,
+                 profile_store=None, profile_cache_size=LRUCache.DEFAULT_SIZE,
+                 retrier=None, cassette=None, handle_store=None, post_store=None,
+                 image_cache=None, cleanup_store=None,
+                 read_ahead=paginate.DEFAULT_READ_AHEAD, transport=None):
         self.handle = handle
         self._password = password
         self.logger = logging.getLogger(__name__)
         self._client = None
+        # Threads wait for the first of them to create and log in the client
+        self._client_lock = threading.RLock()
+        self._session_file = (session.SessionFile(session_path)
+                              if session_path else None)
+        self._graph_cache = graph_cache
+        self._profile_cache = LRUCache(profile_cache_size)
+        self._profile_store = profile_store
+        # Author feeds synced incrementally, see sync_posts()
+        self._post_store = post_store
+        # Images already prepared for posting, see images.py
+        self._image_cache = image_cache
+        # Progress of interrupted cleanups, see cleanup.py
+        self._cleanup_store = cleanup_store
+        # Pages of lists fetched ahead of the caller, see paginate.py
+        self.read_ahead = read_ahead
+        # Connection pool and transport settings, see transport.py
+        self.transport = transport or Transport()
+        # Record or replay the session's requests, see cassette.py
+        self.cassette = cassette
+        # Handles are resolved to DIDs by the resolver, see handles.py
+        self.resolver = HandleResolver(
+                self._resolve_handle, store=handle_store,
+                ttl=handle_store.ttl if handle_store else HandleResolver.DEFAULT_TTL)
+        # Failed requests are retried by the retrier, see retry.py
+        self.retrier = retrier or Retrier(max_attempts=self.FAILURE_LIMIT)
+        if not self.retrier.on_error:
+            self.retrier.on_error = self._print_at_protocol_error
 
     @property
     def client(self):
         """Dynamic client attribute. Used to defer logging into BlueSky until
-           the client is actually needed."""
+           the client is actually needed. A session saved by a previous run is
+           resumed if possible, otherwise we login. The client, and its
+           connection pool, is shared by all threads."""
         if not self._client:
-            self._client = atproto.Client()
-            self._login()
+            with self._client_lock:
+                if not self._client:
+                    self._client = self._create_client()
         return self._client
 
-    def get_likes(self, date_limit_str, count_limit=None, get_date=False):
-        """A generator to yield posts that the given user handle has liked"""
+    def _create_client(self):
+        """Return a new client with the transport settings, logged in"""
+        if self.cassette:
+            request = self.cassette.request(self.transport)
+        else:
+            request = self.transport.request()
+        client = atproto.Client(request=request)
+        self.save_session_changes(client)
+        if not self._resume_session(client):
+            self._login(client)
+        return client
+
+    def save_session_changes(self, client):
+        """Save the session of the given atproto client, a Client or an
+           AsyncClient, whenever it creates or refreshes it, if sessions are
+           saved between runs"""
+        if self._session_file:
+            client.on_session_change(self._session_changed_callback())
+
+    def _session_changed_callback(self):
+        """Return a callback to save the session whenever the atproto client
+           creates or refreshes it. atproto only accepts plain functions as
+           callbacks, not bound methods."""
+        def save_session(event, new_session):
+            if event in (atproto.SessionEvent.CREATE, atproto.SessionEvent.REFRESH):
+                self.logger.info("Saving session (%s)", event.value)
+                self._session_file.save(new_session.export())
+        return save_session
+
+    def _resume_session(self, client):
+        """Resume the session saved by a previous run in the given client,
+           refreshing it only if it has expired. Return False if there is no
+           usable session and a full login is needed."""
+        if not self._session_file:
+            return False
+
+        session_string = self._session_file.load()
+        if not session_string:
+            return False
+
+        # pylint: disable=W0212 (protected-access)
+        # atproto's login(session_string=...) also makes a getProfile request
+        # that we don't need, so import the session directly.
+        try:
+            saved = client._import_session_string(session_string)
+            if self.normalize_handle_value(self.handle) not in (saved.handle,
+                                                                saved.did):
+                self.logger.info("Saved session is for %s, ignoring", saved.handle)
+                return False
+
+            if client._should_refresh_session():
+                self.logger.info("Saved session expired, refreshing...")
+                client._refresh_and_set_session()
+            # login() sets the profile of the logged in user, which send_post()
+            # and other calls need for the user's repo DID
+            client.me = atproto.models.AppBskyActorDefs.ProfileViewDetailed(
+                    did=saved.did, handle=saved.handle)
+        except (atproto_core.exceptions.AtProtocolError, ValueError) as ex:
+            self.logger.info("Unable to resume saved session: %s", ex)
+            return False
+
+        self.logger.info("Resumed saved session")
+        return True
+
+    def get_likes(self, date_limit_str, count_limit=None, get_date=False,
+                  exact_date=False):
+        """A generator to yield posts that the given user handle has liked. The
+           like date is read from the TID record key of each like. If exact_date
+           is set, or the record key isn't a TID, the like record is fetched to
+           get its createdAt field instead, which costs a request per like."""
         params = {"actor": self.handle}
         params['limit'] = count_limit if count_limit else 100
-        cursor = None
         date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
-        num_failures = 0
         count = 0
+        # Each like is only dated once, possibly while finding the date cutoff
+        dates = {}
 
-        while num_failures < self.FAILURE_LIMIT:
-            params["cursor"] = cursor
-            try:
-                # Get a batch of like data
-                rsp = self.client.app.bsky.feed.get_actor_likes(params=params)
+        def like_date(like):
+            if id(like) not in dates:
+                dates[id(like)] = self._like_created_at(like, exact_date)
+            return dates[id(like)]
+
+        def fetch(cursor):
+            return self.retrier.call(self.client.app.bsky.feed.get_actor_likes,
+                                     params={**params, "cursor": cursor})
+
+        with self._paginator(fetch) as pages:
+            for rsp in pages:
                 if not rsp.feed:
                     break
 
+                # Likes are returned newest first so the likes older than the date
+                # limit are at the end of the page, and any further pages are older.
+                dates.clear()
+                end = len(rsp.feed)
+                if date_limit:
+                    end = timestamp.cutoff(rsp.feed, date_limit,
+                                           lambda like: like_date(like)[1])
+
                 # Iterate through the like data
-                for like in rsp.feed:
+                for like in rsp.feed[:end]:
                     # Retrieve extra data info if needed
-                    if date_limit or get_date:
-                        like_rsp = self.client.app.bsky.feed.like.get(
-                                      *self.at_uri_to_did_rkey(like.post.viewer.like))
-                        like.created_at = like_rsp.value.created_at
-                    else:
-                        like.created_at = None
-
-                    # Apply data limit if needed
-                    if date_limit:
-                        dt = dateutil.parser.isoparse(like.created_at)
-                        if dt < date_limit:
-                            self.logger.info("Date limit reached")
-                            return []
+                    like.created_at = like_date(like)[0] if date_limit or get_date \
+                        else None
 
                     # Apply count limit if needed
                     if count_limit:
@@ -135,164 +487,484 @@ class BlueSky:
                     # Return the like data
                     yield like
 
-                # If we have a cursor there is more data available, otherwise
-                # we're at the end of the like data, so we're done.
-                if rsp.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = rsp.cursor
-                else:
-                    break
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-        else:
-            raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+                if end < len(rsp.feed):
+                    self.logger.info("Date limit reached")
+                    return []
 
         return []
 
+    def _like_created_at(self, like, exact_date=False):
+        """Return the creation date of the given like as both a string and a
+           datetime. Decode it from the like's TID record key unless exact_date is
+           set or the record key isn't a TID, in which case fetch the like record"""
+        if not exact_date:
+            dt = tid.rkey_to_datetime(like.post.viewer.like)
+            if dt:
+                return dt.isoformat(), dt
+
+        like_rsp = self.retrier.call(self.client.app.bsky.feed.like.get,
+                                     *self.at_uri_to_did_rkey(like.post.viewer.like))
+        created_at = like_rsp.value.created_at
+        return created_at, timestamp.parse(created_at)
+
     @normalize_handle
-    def get_mutuals(self, handle, flag):
+    def get_mutuals(self, handle, flag, lean=False, run_size=None, spill_dir=None):
         """A generator to yield entries for users that the given user follows
            and who are also followers of the given user, if flag == both.
            If flag == follows-not-followers yield entries of users that the user
            follows who don't follow back.
            If flag = followers-not-follows yield entries of users that follow
-           this user that this user does not follow back"""
-
-        # hmm, I suppose this could be kind of heavyweight
-        dfollows = {entry.handle: entry for entry in self.follows(handle)}
-        dfollowers = {entry.handle: entry for entry in self.followers(handle)}
-
-        follows = set(dfollows.keys())
-        followers = set(dfollowers.keys())
-
-        if flag == "both":
-            for mutual in follows & followers:
-                yield dfollows[mutual]
-        elif flag == "follows-not-followers":
-            for mutual in follows - followers:
-                yield dfollows[mutual]
-        elif flag == "followers-not-follows":
-            for mutual in followers - follows:
-                yield dfollowers[mutual]
-        else:
+           this user that this user does not follow back
+
+           The follows and followers are retrieved concurrently. Once one side
+           is complete (the followers for follows-not-followers, the follows for
+           followers-not-follows, either for both) entries from the other side
+           are yielded as they arrive. Only the profiles of the side that is
+           yielded are kept, as ProfileLite records if lean.
+
+           If run_size is set neither side is held in memory, for accounts with
+           millions of follows or followers, see _spilled_mutuals()."""
+        if flag not in self.MUTUALS_REFERENCE:
             raise ValueError(f"Invalid flag: `{flag}`. Expected `both`, "
                              f"`follows-not-followers`, or `followers-not-follows`.")
+        if run_size is not None:
+            yield from self._spilled_mutuals(handle, flag, run_size, spill_dir)
+            return
+
+        # Handle -> profile of each side, None for the side that isn't yielded
+        seen = {"follows": {}, "followers": {}}
+        other = {"follows": "followers", "followers": "follows"}
+        kept = "followers" if flag == "followers-not-follows" else "follows"
+        yielded = set()
+
+        def matching(source, handles):
+            # Entries of the source side that are (for both) or are not in the
+            # other, complete, side. Always yield the follows entry for both.
+            reference = seen[other[source]]
+            for h in handles:
+                if h not in yielded and (h in reference) == (flag == "both"):
+                    yielded.add(h)
+                    yield seen[kept][h]
+
+        streaming = None
+        for name, item in self._crawl_graphs(handle):
+            if item is None:
+                if streaming is None and self.MUTUALS_REFERENCE[flag] in (None, name):
+                    streaming = other[name]
+                    yield from matching(streaming, list(seen[streaming]))
+            else:
+                if name != kept:
+                    profile = None
+                elif lean:
+                    profile = ProfileLite.from_profile(item)
+                else:
+                    profile = item
+                seen[name][item.handle] = profile
+                if name == streaming:
+                    yield from matching(name, [item.handle])
+
+    def _spilled_mutuals(self, handle, flag, run_size, spill_dir=None):
+        """A generator to yield the get_mutuals() ProfileLite entries of the given
+           flag holding at most run_size DIDs of each side in memory. Each side is
+           spilled to sorted runs of DIDs on disk, in spill_dir if set, as it's
+           retrieved, with the few profile fields of the yielded side. Once both
+           are complete the runs are merged and joined by DID, so entries are
+           yielded in DID order."""
+        kept = "followers" if flag == "followers-not-follows" else "follows"
+        with extsort.SortedRuns(run_size, spill_dir) as follows, \
+                extsort.SortedRuns(run_size, spill_dir) as followers:
+            runs = {"follows": follows, "followers": followers}
+            for name, item in self._crawl_graphs(handle, maxsize=run_size):
+                if item is None:
+                    continue
+                fields = None
+                if name == kept:
+                    fields = json.dumps(ProfileLite.from_profile(item).values())
+                runs[name].add(item.did, fields)
+
+            for _, follow, follower in extsort.merge_join(follows, followers):
+                if flag == "both":
+                    record = follow if follower else None
+                elif flag == "follows-not-followers":
+                    record = follow if not follower else None
+                else:
+                    record = follower if not follow else None
+                if record:
+                    yield ProfileLite.from_values(json.loads(record[1]))
+
+    def _crawl_graphs(self, handle, maxsize=0):
+        """A generator to yield ("follows", profile) and ("followers", profile)
+           for the follows and followers of the given user, retrieved
+           concurrently, and (name, None) when each side is complete. Raise the
+           exception of a side that fails. A maxsize holds the crawlers back once
+           that many profiles are waiting to be yielded."""
+        results = queue.Queue(maxsize=maxsize)
+        stop = threading.Event()
+        done = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(self._crawl_profiles, "follows", self.follows, handle,
+                            results, stop)
+            executor.submit(self._crawl_profiles, "followers", self.followers, handle,
+                            results, stop)
+            try:
+                while done < 2:
+                    name, item = results.get()
+                    if isinstance(item, Exception):
+                        raise item
+                    if item is None:
+                        done += 1
+                    yield name, item
+            finally:
+                # Stop the crawlers if our caller stops early or there's an error
+                stop.set()
+
+    def _crawl_profiles(self, name, profiles_fn, handle, results, stop):
+        """Thread worker for _crawl_graphs(). Put (name, profile) on the results
+           queue for each profile yielded by profiles_fn(handle), then (name, None)
+           when complete or (name, exception) on failure."""
+        start = time.monotonic()
+        count = 0
+        try:
+            for profile in profiles_fn(handle):
+                if not self._put_result(results, (name, profile), stop):
+                    return
+                count += 1
+        except Exception as ex:     # pylint: disable=broad-except
+            self._put_result(results, (name, ex), stop)
+            return
+
+        elapsed = time.monotonic() - start
+        self.logger.info("Retrieved %d %s in %.2fs (%.1f/s)", count, name, elapsed,
+                         count / elapsed if elapsed else 0.0)
+        self._put_result(results, (name, None), stop)
+
+    @staticmethod
+    def _put_result(results, result, stop):
+        """Put the given result on the results queue, waiting while it's full
+           until stop is set. Return whether it was put."""
+        while not stop.is_set():
+            try:
+                results.put(result, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
 
-    # TODO: Finish test_get_reposters()
     @normalize_handle
-    def get_reposters(self, handle, date_limit_str=None):
-        """A generator to yield people that have reposts posts for the given user
-           handle"""
-        repost_info = {}
-
-        for post in self.get_posts(handle, date_limit_str=date_limit_str,
-                                   post_filter=ORIGINAL_POST):
-            if post.repost_count:
-                reposters = self.client.get_reposted_by(post.uri)
-                for profile in reposters.reposted_by:
-                    if profile.handle in repost_info:
-                        repost_info[profile.handle]["count"] += 1
-                        repost_info[profile.handle]["posts"].append(post)
-                    else:
-                        repost_info[profile.handle] = {
-                                "count": 1,
-                                "profile": profile,
-                                "posts": [post]
-                        }
-
-        sorted_items = sorted(repost_info.values(),
-                              key=lambda item: item["count"], reverse=True)
-
-        yield from sorted_items
+    def get_reposters(self, handle, date_limit_str=None, stored=False, top=None,
+                      max_concurrency=REPOSTERS_CONCURRENCY, lean=False):
+        """A generator to yield a dict of the profile, repost count and reposted
+           post URIs of each user that has reposted posts by the given user
+           handle, most reposts first, optionally only the top N users. The
+           reposters of up to max_concurrency posts are retrieved concurrently
+           while further posts stream in. Only one profile and the post URIs are
+           kept for each reposter, a ProfileLite if lean. stored reads the posts
+           from the post store, see get_posts()"""
+        # DID -> (profile, reposted post URIs)
+        reposters = {}
+
+        def post_reposters(uri):
+            return uri, list(self.get_reposted_by(uri))
+
+        def add(futures):
+            for future in futures:
+                uri, profiles = future.result()
+                for profile in profiles:
+                    if profile.did not in reposters:
+                        reposters[profile.did] = (
+                                ProfileLite.from_profile(profile) if lean
+                                else profile, [])
+                    reposters[profile.did][1].append(uri)
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_concurrency) as executor:
+            pending = set()
+            try:
+                for post in self.get_posts(handle, date_limit_str=date_limit_str,
+                                           post_filter=ORIGINAL_POST, stored=stored):
+                    if not post.repost_count:
+                        continue
+                    pending.add(executor.submit(post_reposters, post.uri))
+                    if len(pending) >= max_concurrency:
+                        done, pending = concurrent.futures.wait(
+                                pending,
+                                return_when=concurrent.futures.FIRST_COMPLETED)
+                        add(done)
+                add(concurrent.futures.as_completed(pending))
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        def count(item):
+            return len(item[1])
+
+        # nlargest() keeps a heap of only the top N entries
+        if top:
+            most_reposts = heapq.nlargest(top, reposters.values(), key=count)
+        else:
+            most_reposts = sorted(reposters.values(), key=count, reverse=True)
+
+        for profile, uris in most_reposts:
+            # Post URIs end in TIDs, sort them newest first
+            uris.sort(key=lambda uri: uri.rsplit("/", 1)[-1], reverse=True)
+            yield {"count": len(uris), "profile": profile, "post_uris": uris}
+
+    def get_reposted_by(self, uri):
+        """A generator to yield the profile of each user that reposted the post
+           at the given uri"""
+        with self._paginator(lambda cursor: self.retrier.call(
+                self.client.get_reposted_by, uri, cursor=cursor)) as pages:
+            for rsp in pages:
+                yield from rsp.reposted_by
 
     def post_text(self, text):
         """Post the given text and return the resulting post uri"""
-        num_failures = 0
-        while num_failures < self.FAILURE_LIMIT:
-            try:
-                post = self.client.send_post(text)
-                return post.uri
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        return self.retrier.call(self.client.send_post, text).uri
 
     def post_rich(self, text, mentions):
         """Post the given text with the given user handle mentions"""
         details = self.build_post(text, mentions)
-
-        num_failures = 0
-        while num_failures < self.FAILURE_LIMIT:
-            try:
-                post = self.client.send_post(details)
-                return post.uri
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        return self.retrier.call(self.client.send_post, details).uri
 
     def build_post(self, text, mentions):
         """Insert the given text and user mentions into an atproto TextBuilder"""
         tb = atproto.client_utils.TextBuilder()
         tb.text(f"{text}\n")
+        dids = self.profile_dids(mentions)
         for handle in mentions:
-            tb.mention(f"@{handle}", self.profile_did(handle))
+            tb.mention(f"@{handle}", dids[handle])
             tb.text("\n")
         return tb
 
-    # TODO: implement retries
     def post_image(self, text, filename, alt):
         """Post the given image with the given text and given alt-text"""
-        img_data = self._get_image_data(filename)
-
-        # Add image aspect ratio to prevent default 1:1 aspect ratio
-        # Replace with your desired aspect ratio
-        aspect_ratio = atproto.models.AppBskyEmbedDefs.AspectRatio(
-                            height=100, width=100)
-
-        self.logger.info("Posting image...")
-        rsp = self.client.send_image(text=text,
-                                     image=img_data,
-                                     image_alt=alt or "",
-                                     image_aspect_ratio=aspect_ratio)
+        return self.post_images(text, [filename], [alt])
+
+    def post_images(self, text, filenames, alts=None):
+        """Post the given images, at most MAX_IMAGES, with the given text and
+           alt-texts in the same order. Several images are prepared in parallel
+           processes and each is uploaded as soon as it's ready, so posting takes
+           about as long as the slowest image rather than all of them. The post
+           is created once all the blobs are uploaded."""
+        if not 1 <= len(filenames) <= self.MAX_IMAGES:
+            raise ValueError(f"Between 1 and {self.MAX_IMAGES} images can be "
+                             f"posted, not {len(filenames)}")
+        alts = list(alts or [])
+        if len(alts) > len(filenames):
+            raise ValueError(f"{len(alts)} alt-texts given for "
+                             f"{len(filenames)} images")
+        alts += [None] * (len(filenames) - len(alts))
+
+        embeds = [None] * len(filenames)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(filenames)) as uploader:
+            uploads = {uploader.submit(self._upload_image, image): (index, image)
+                       for index, image in self._prepare_images(filenames)}
+            for future in concurrent.futures.as_completed(uploads):
+                index, image = uploads[future]
+                # Without an aspect ratio the image is shown as a square
+                embeds[index] = atproto.models.AppBskyEmbedImages.Image(
+                        alt=alts[index] or "", image=future.result(),
+                        aspect_ratio=atproto.models.AppBskyEmbedDefs.AspectRatio(
+                            height=image.height, width=image.width))
+
+        self.logger.info("Posting %d image(s)...", len(embeds))
+        rsp = self.retrier.call(self.client.send_post, text,
+                                embed=atproto.models.AppBskyEmbedImages.Main(
+                                    images=embeds))
         return rsp.uri
 
+    def _prepare_images(self, filenames):
+        """A generator to yield the (index, ImageData) of each of the given image
+           files as soon as it's prepared. More than one image is prepared in a
+           process pool, see images.prepare()."""
+        if len(filenames) == 1:
+            yield 0, self._get_image_data(filenames[0])
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(len(filenames), os.cpu_count() or 1)) as pool:
+            futures = {pool.submit(images.prepare, filename, self._image_cache,
+                                   self.BLUESKY_MAX_IMAGE_SIZE): index
+                       for index, filename in enumerate(filenames)}
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.result()
+
+    def _upload_image(self, image):
+        """Upload the given ImageData and return its blob reference"""
+        self.logger.info("Uploading %dx%d image...", image.width, image.height)
+        return self.retrier.call(self.client.upload_blob, image.data).blob
+
+    @retried
     def delete_post(self, uri):
         """Delete the post at the given uri"""
-        num_failures = 0
-
-        while num_failures < self.FAILURE_LIMIT:
-            try:
-                rsp = self.client.delete_post(uri)
-                if rsp:
-                    return rsp
-                num_failures += 1
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
+        rsp = self.client.delete_post(uri)
+        if not rsp:
+            # Treat an unsuccessful delete like any other failed request
+            raise atproto_core.exceptions.AtProtocolError(
+                    f"Failed to delete post {uri}")
+        return rsp
 
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+    def cleanup(self, criteria, dry_run=False,
+                batch_size=cleanup.DEFAULT_BATCH_SIZE, pacer=None):
+        """A generator to delete the authenticated user's records selected by the
+           given cleanup.Criteria in batches of batch_size, paced by the given
+           cleanup.Pacer. Each record is yielded once its batch is deleted. A dry
+           run deletes nothing and yields the records that would be deleted. An
+           interrupted cleanup carries on from its last batch, see cleanup.py."""
+        if not 1 <= batch_size <= cleanup.MAX_BATCH_SIZE:
+            raise ValueError(f"Invalid batch size: {batch_size}. Expected 1 to "
+                             f"{cleanup.MAX_BATCH_SIZE}.")
+        did = self.profile_did(self.handle)
+        since = dateparse.parse(criteria.since) if criteria.since else None
+        before = dateparse.parse(criteria.before) if criteria.before else None
+        # Records are listed newest first from the record key of the before date
+        # until one is older than the since date
+        cursor = tid.from_datetime(before) if before else None
+        stop = tid.from_datetime(since) if since else None
+
+        key = criteria.key(did)
+        store = self._cleanup_store
+        progress = store.get(key) if store else None
+        deleted = 0
+        if progress is not None:
+            resume_at, deleted = progress
+            self.logger.info("Resuming cleanup at %s, %d records already deleted",
+                             resume_at, deleted)
+            cursor = min(cursor, resume_at) if cursor else resume_at
+
+        batch = []
+        records = self.list_records(criteria.nsid, did, cursor)
+        while True:
+            record = next(records, None)
+            rkey = record.uri.rsplit("/", 1)[-1] if record else None
+            if rkey and stop and rkey < stop:
+                rkey = None
+            if rkey and criteria.matches(record.value):
+                batch.append(record)
+            if batch and (not rkey or len(batch) >= batch_size):
+                if not dry_run:
+                    self._delete_records(did, criteria.nsid, batch, pacer)
+                    deleted += len(batch)
+                    if store:
+                        store.put(key, rkey or batch[-1].uri.rsplit("/", 1)[-1],
+                                  deleted)
+                yield from batch
+                batch = []
+            if not rkey:
+                break
+
+        if store and not dry_run:
+            store.remove(key)
+        self.logger.info("Cleanup complete, %d records deleted", deleted)
+
+    def list_records(self, collection, did, cursor=None):
+        """A generator to yield the records of the given collection of the given
+           user's repo, newest first, starting after the given record key"""
+        while True:
+            rsp = self.retrier.call(
+                    self.client.com.atproto.repo.list_records,
+                    atproto.models.ComAtprotoRepoListRecords.Params(
+                        repo=did, collection=collection, cursor=cursor,
+                        limit=100))
+            yield from rsp.records
+            if not rsp.cursor or not rsp.records:
+                return
+            self.logger.info("Cursor found, retrieving next page...")
+            cursor = rsp.cursor
+
+    def _delete_records(self, did, collection, records, pacer=None):
+        """Delete the given records of the given collection from the given user's
+           repo in one applyWrites request, once the pacer allows"""
+        if pacer:
+            pacer.wait(len(records))
+        self.logger.info("Deleting %d records...", len(records))
+        self.retrier.call(
+                self.client.com.atproto.repo.apply_writes,
+                atproto.models.ComAtprotoRepoApplyWrites.Data(
+                    repo=did,
+                    writes=[atproto.models.ComAtprotoRepoApplyWrites.Delete(
+                                collection=collection,
+                                rkey=record.uri.rsplit("/", 1)[-1])
+                            for record in records]))
 
     @normalize_handle
     def get_profile(self, handle):
-        """Return the profile of the given user handle"""
-        num_failures = 0
-
-        while num_failures < self.FAILURE_LIMIT:
-            try:
-                return self.client.get_profile(handle)
-            except atproto_client.exceptions.BadRequestError as ex:
-                # Could they not just return a 404 like everyone else. FFS.
-                if ex.response.status_code == 400:
-                    return None
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
+        """Return the profile of the given user handle, see get_profiles()"""
+        return self.get_profiles([handle])[handle]
+
+    def get_profiles(self, actors):
+        """Return a dict of the profiles of the given handles and/or DIDs keyed by
+           the actor given, None if the profile isn't found. Profiles are taken
+           from the in-process cache or the profile store if possible, the rest
+           are retrieved with app.bsky.actor.getProfiles GET_PROFILES_BATCH_SIZE
+           at a time."""
+        profiles = {}
+        missing = []
+        for actor in actors:
+            profile = self._cached_profile(self.normalize_handle_value(actor))
+            if profile:
+                profiles[actor] = profile
+            else:
+                missing.append(actor)
+
+        normalized = {actor: self.normalize_handle_value(actor) for actor in missing}
+        to_fetch = list(dict.fromkeys(normalized.values()))
+        fetched = {}
+        for i in range(0, len(to_fetch), self.GET_PROFILES_BATCH_SIZE):
+            for profile in self._fetch_profiles(
+                    to_fetch[i:i + self.GET_PROFILES_BATCH_SIZE]):
+                fetched[self._profile_key(profile.did)] = profile
+                fetched[self._profile_key(profile.handle)] = profile
+
+        for actor, norm in normalized.items():
+            profiles[actor] = fetched.get(self._profile_key(norm))
+        return profiles
+
+    def _fetch_profiles(self, actors):
+        """Retrieve, cache and return the profiles of the given handles/DIDs"""
+        try:
+            rsp = self.retrier.call(self.client.app.bsky.actor.get_profiles,
+                                    params={"actors": actors})
+        except atproto_client.exceptions.BadRequestError:
+            # The whole batch fails if any actor isn't a valid handle or DID,
+            # retry the actors individually to find the valid ones. A lone
+            # invalid actor isn't found.
+            if len(actors) > 1:
+                return [profile for actor in actors
+                        for profile in self._fetch_profiles([actor])]
+            return []
+
+        for profile in rsp.profiles:
+            self._profile_cache.put(self._profile_key(profile.did), profile)
+            self._profile_cache.put(self._profile_key(profile.handle), profile)
+        self.resolver.put_many({profile.handle: profile.did
+                                for profile in rsp.profiles})
+        if self._profile_store and rsp.profiles:
+            self._profile_store.put_many(
+                    (profile.did, self._profile_key(profile.handle),
+                     self._profile_to_json(profile)) for profile in rsp.profiles)
+        return rsp.profiles
+
+    def _cached_profile(self, actor):
+        """Return the profile of the given handle/DID from the in-process cache
+           or the profile store, None if it isn't cached"""
+        key = self._profile_key(actor)
+        profile = self._profile_cache.get(key)
+        if profile is None and self._profile_store:
+            stored = self._profile_store.get(key)
+            if stored:
+                profile = atproto.models.AppBskyActorDefs.ProfileViewDetailed \
+                    .model_validate_json(stored)
+                self._profile_cache.put(self._profile_key(profile.did), profile)
+                self._profile_cache.put(self._profile_key(profile.handle), profile)
+        return profile
 
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+    @staticmethod
+    def _profile_key(actor):
+        """Handles are case insensitive"""
+        return actor if actor.startswith("did:") else actor.lower()
 
     def get_post(self, uri=None, did=None, rkey=None, likes=False):
         """Get details of the post at the given uri"""
@@ -301,216 +973,203 @@ class BlueSky:
         elif not (did and rkey):
             raise ValueError("Must supply either `uri` or both `did` and `rkey`")
 
-        num_failures = 0
-
-        while num_failures < self.FAILURE_LIMIT:
-            try:
-                rsp = self.client.get_post(rkey, profile_identify=did)
-                if rsp:
-                    if likes:
-                        rsp.likes = list(self.get_post_likes(rsp.uri))
-                        rsp.like_count = len(rsp.likes)
-                    break
-            except atproto_client.exceptions.BadRequestError as ex:
-                # Could they not just return a 404 like everyone else. FFS.
-                if ex.response.content.error == "RecordNotFound":
-                    rsp = None
-                    break
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-        else:
-            raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        try:
+            rsp = self.retrier.call(self.client.get_post, rkey, profile_identify=did)
+        except atproto_client.exceptions.BadRequestError as ex:
+            # Could they not just return a 404 like everyone else. FFS.
+            if ex.response.content.error == "RecordNotFound":
+                return None
+            raise
 
+        if rsp and likes:
+            rsp.likes = list(self.get_post_likes(rsp.uri))
+            rsp.like_count = len(rsp.likes)
         return rsp
 
-    @staticmethod
-    def _is_original_post(view, handle):
-        return view.post.author.handle == handle and not view.reply
-
-    @staticmethod
-    def _is_reply_post(view, handle):
-        return view.post.author.handle == handle and view.reply
-
-    @staticmethod
-    def _is_repost_post(view, handle):
-        return view.post.author.handle != handle
-
-    @staticmethod
-    def _filter_post(filter_post_type, view, handle):
-        """Ignore this post if it's not one of the following:
-            - requested type is repost and the author handle is not ours
-            - requested type is reply and there is a reply structure and the
-                author's handle is our own
-            - requested type is original and there is no reply structure and
-                the author's handle is our own"""
-        return not ((filter_post_type.repost() and
-                     view.post.author.handle != handle) or
-                    (filter_post_type.reply() and
-                     view.reply and view.post.author.handle == handle) or
-                    (filter_post_type.original() and not view.reply and
-                     view.post.author.handle == handle))
-
-    @staticmethod
-    def _date_limit_reached(view, handle, date_limit):
-        if BlueSky._is_repost_post(view, handle):
-            date_at = view.reason.indexed_at
-        else:
-            date_at = view.post.record.created_at
-
-        return dateutil.parser.isoparse(date_at) < date_limit
-
     @normalize_handle
     def get_posts(self, handle=None, date_limit_str=None, count_limit=None,
-                  post_filter=ORIGINAL_POST):
-        """A generator to return an entry for posts for the given user handle"""
-        date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
-        cursor = None
-        count = 0
-        num_failures = 0
-
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                feed = self.client.get_author_feed(actor=handle, cursor=cursor)
-                for view in feed.feed:
-                    if date_limit and self._date_limit_reached(view, handle,
-                                                               date_limit):
-                        self.logger.info("Date limit reached")
-                        return None
-
-                    if self._filter_post(post_filter, view, handle):
-                        continue
+                  post_filter=ORIGINAL_POST, stored=False, since_last=False,
+                  lean=False):
+        """A generator to return an entry for posts for the given user handle.
+           stored syncs the user's feed to the post store and reads the posts
+           from there, see sync_posts(). since_last only returns the posts that
+           are new since the previous since_last call. lean returns PostLite
+           records."""
+        if lean:
+            for post in self.get_posts(handle, date_limit_str, count_limit,
+                                       post_filter, stored, since_last):
+                yield PostLite.from_post(post)
+            return None
+
+        if stored or since_last:
+            yield from self._stored_posts(handle, date_limit_str, count_limit,
+                                          post_filter, since_last)
+            return None
+
+        selection = PostSelection(handle, date_limit_str, count_limit, post_filter,
+                                  self.logger)
+        with self._paginator(lambda cursor: self.retrier.call(
+                self.client.get_author_feed, actor=handle, cursor=cursor)) as pages:
+            for feed in pages:
+                yield from selection.page(feed)
+                if selection.done:
+                    return None
+        return None
 
-                    # Apply count check after filter checks above.
-                    if count_limit:
-                        count += 1
-                        if count > count_limit:
-                            self.logger.info("Count limit reached")
-                            return None
+    @normalize_handle
+    def sync_posts(self, handle=None, date_limit_str=None):
+        """Fetch the new entries of the given user's author feed into the post
+           store and return the date (epoch seconds) of the newest entry stored
+           before, None if there wasn't one. Only pages newer than that
+           checkpoint, less the store's refresh period, are fetched. The first
+           sync, or one with a date limit further back than the feed is stored,
+           fetches the feed back to the date limit. The checkpoint only moves
+           once the sync completes, an interrupted sync is just repeated."""
+        if not self._post_store:
+            raise ValueError("No post store configured. Set the [post_store] "
+                             "path in the config file.")
+        did = self.profile_did(handle)
+        if not did:
+            raise ValueError(f"User not found: {handle}")
 
-                    view.post.reply = view.reply
-                    if self._is_repost_post(view, handle):
-                        view.post.repost_date = view.reason.indexed_at
-                    yield view.post
+        date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
+        since_at = date_limit.timestamp() if date_limit else None
+        state = self._post_store.get_state(did)
+        # Entries dated at the checkpoint are already stored, those dated at the
+        # date limit are needed
+        at_checkpoint = bool(state and state.covers(since_at))
+        if at_checkpoint:
+            since_at = state.since_at
+            stop_at = None if state.newest_at is None \
+                else state.newest_at - self._post_store.refresh
+        else:
+            stop_at = since_at
 
-                if feed.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = feed.cursor
-                else:
-                    return None
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
+        def sort_at(view):
+            return view_date(view, handle).timestamp()
 
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        def is_old(view):
+            if at_checkpoint:
+                return sort_at(view) <= stop_at
+            return sort_at(view) < stop_at
 
-    def get_post_likes(self, uri):
-        """A generator to yield details of the likes for a given post uri"""
+        newest_uri, newest_at = (state.newest_uri, state.newest_at) if state \
+            else (None, None)
         cursor = None
-        num_failures = 0
-
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                rsp = self.client.get_likes(uri, cursor=cursor)
-                yield from rsp.likes
-
-                if rsp.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = rsp.cursor
+        while True:
+            feed = self.retrier.call(self.client.get_author_feed, actor=handle,
+                                     cursor=cursor)
+            # The feed is newest first, only the entries at the end are old
+            end = len(feed.feed) if stop_at is None \
+                else bisect.bisect_left(range(len(feed.feed)), True,
+                                        key=lambda i: is_old(feed.feed[i]))
+            rows = [(feed_key(view), sort_at(view),
+                     view.model_dump_json(by_alias=True, exclude_none=True))
+                    for view in feed.feed[:end]]
+            self._post_store.put_views(did, rows)
+            if rows and (newest_at is None or rows[0][1] > newest_at):
+                newest_uri, newest_at = feed.feed[0].post.uri, rows[0][1]
+
+            if end < len(feed.feed) or not feed.cursor:
+                break
+            self.logger.info("Cursor found, retrieving next page...")
+            cursor = feed.cursor
+
+        self._post_store.set_state(did, newest_uri, newest_at, since_at)
+        return state.newest_at if state else None
+
+    def _stored_posts(self, handle, date_limit_str, count_limit, post_filter,
+                      since_last):
+        """A generator to yield the posts of the given user from the post store
+           once their feed is synced, see get_posts(). since_last has its own
+           checkpoint in the store, which syncs for stored don't move."""
+        self.sync_posts(handle, date_limit_str)
+        selection = PostSelection(handle, date_limit_str, count_limit, post_filter,
+                                  self.logger)
+        date_limit = selection.date_limit
+        did = self.profile_did(handle)
+
+        newer_than = None
+        if since_last:
+            store = self._post_store
+            newer_than = store.get_checkpoint(did, store.SINCE_LAST)
+            newest_at = store.get_state(did).newest_at
+            if newest_at is not None:
+                store.set_checkpoint(did, store.SINCE_LAST, newest_at)
+
+        views = self._post_store.views(
+                did, not_before=date_limit.timestamp() if date_limit else None,
+                newer_than=newer_than)
+        yield from selection.select(
+                atproto.models.AppBskyFeedDefs.FeedViewPost.model_validate_json(data)
+                for data in views)
+
+    def get_post_likes(self, uri, lean=False):
+        """A generator to yield details of the likes for a given post uri, as
+           LikeLite records if lean"""
+        with self._paginator(lambda cursor: self.retrier.call(
+                self.client.get_likes, uri, cursor=cursor), read_ahead=True) as pages:
+            for rsp in pages:
+                if lean:
+                    yield from map(LikeLite.from_like, rsp.likes)
                 else:
-                    return None
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
+                    yield from rsp.likes
 
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
-
-    # TODO: implement retries
+    @retried
     def get_unread_notifications_count(self):
         """Return a count of the unread notifications for the authenticated user"""
-        num_failures = 0
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                return self.client.app.bsky.notification.get_unread_count()
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        return self.client.app.bsky.notification.get_unread_count()
 
     # TODO: Finish get_notifications tests
     def get_notifications(self, date_limit_str=None, count_limit=None,
                           mark_read=False, get_all=False):
-        """A generator to yield notifications for the authenticated handle"""
-        date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
-        count = 0
-        num_failures = 0
-        cursor = None
-
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                rsp = self.client.app.bsky.notification.list_notifications(
-                        params={"cursor": cursor})
-                for notif in rsp.notifications:
-                    if date_limit:
-                        dt = dateutil.parser.isoparse(notif.record.created_at)
-                        if dt < date_limit:
-                            # Once we get to notifications older than the date
-                            # limit, we assume the rest of the notifications are
-                            # older, we're done
-                            self.logger.info("Date limit reached")
-                            return None
-
-                    if count_limit:
-                        count += 1
-                        if count > count_limit:
-                            self.logger.info("Count limit reached")
-                            return None
-
-                    # If we're not returning all (already read) notificiations then
-                    # we're done when we hit the first already read notification.
-                    if not get_all and notif.is_read:
-                        return None
-
-                    if notif.reason == "reply":
-                        post = self.get_post(notif.record.reply.parent.uri)
-                    elif notif.reason in ["like", "repost"]:
-                        post = self.get_post(notif.reason_subject)
-                    else:
-                        post = None
-
-                    yield notif, post
-
-                if rsp.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = rsp.cursor
-                    continue
-
-                return None
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-            finally:
-                if mark_read:
-                    # TODO should we consider implementing mark_read when date or
-                    # count limit is reached above?
-                    seen_at = self.client.get_current_time_iso()
-                    self.client.app.bsky.notification.update_seen({"seen_at": seen_at})
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        """A generator to yield notifications for the authenticated handle. The
+           posts that the notifications of each page refer to are retrieved
+           together, see get_posts_by_uri()"""
+        selection = NotificationSelection(date_limit_str, count_limit, get_all,
+                                          self.logger)
+        try:
+            with self._paginator(lambda cursor: self.retrier.call(
+                    self.client.app.bsky.notification.list_notifications,
+                    params={"cursor": cursor})) as pages:
+                for rsp in pages:
+                    # Find the notifications of this page to return before retrieving
+                    # the posts they refer to
+                    notifs = selection.page(rsp)
+                    posts = self.get_posts_by_uri(selection.subjects(notifs))
+                    yield from selection.pairs(notifs, posts)
+                    if selection.done:
+                        return
+        finally:
+            if mark_read:
+                # TODO should we consider implementing mark_read when date or
+                # count limit is reached above?
+                seen_at = self.client.get_current_time_iso()
+                self.retrier.call(self.client.app.bsky.notification.update_seen,
+                                  {"seen_at": seen_at})
+
+    def get_posts_by_uri(self, uris):
+        """Return a dict of post views keyed by URI for the given post URIs.
+           Duplicate and None URIs are ignored and the posts are retrieved
+           GET_POSTS_BATCH_SIZE at a time. Posts that no longer exist are missing
+           from the result."""
+        uris = list(dict.fromkeys(uri for uri in uris if uri))
+        posts = {}
+
+        for i in range(0, len(uris), self.GET_POSTS_BATCH_SIZE):
+            batch = uris[i:i + self.GET_POSTS_BATCH_SIZE]
+            rsp = self.retrier.call(self.client.app.bsky.feed.get_posts,
+                                    params={"uris": batch})
+            posts.update((post.uri, post) for post in rsp.posts)
+
+        return posts
 
     def search(self, term, author, date_limit_str, sort_order, is_follow, is_follower):
         """A generator to yield posts that match the given search terms"""
-        params = {"q": term,
-                  "limit": 100,
-                  "sort": sort_order}
-        date_limit = dateparse.parse(date_limit_str) if date_limit_str else None
-        if author:
-            # Careful not to call normalize_handle_value with None, otherwise it
-            # would insert self.handle
-            params["author"] = self.normalize_handle_value(author)
-        if date_limit:
-            params["since"] = date_limit.strftime("%Y-%m-%dT%H:%M:%SZ")
+        # Careful not to call normalize_handle_value with None, otherwise it
+        # would insert self.handle
+        params = search_params(term, author and self.normalize_handle_value(author),
+                               date_limit_str, sort_order)
 
         if is_follow is None:
             follows = []
@@ -521,42 +1180,36 @@ class BlueSky:
         else:
             followers = [entry.handle for entry in self.followers(self.handle)]
 
-        cursor = None
-        num_failures = 0
-
-        while num_failures < self.FAILURE_LIMIT:
-            params["cursor"] = cursor
-            try:
-                rsp = self.client.app.bsky.feed.search_posts(params=params)
-                for post in rsp.posts:
-                    if is_follow is not None:
-                        if (is_follow and post.author.handle not in follows) or \
-                           (not is_follow and post.author.handle in follows):
-                            continue
-                    if is_follower is not None:
-                        if (is_follower and post.author.handle not in followers) or \
-                           (not is_follower and post.author.handle in followers):
-                            continue
-                    yield (post, follows, followers)
-
-                if rsp.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = rsp.cursor
-                else:
-                    return None
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        with self._paginator(lambda cursor: self.retrier.call(
+                self.client.app.bsky.feed.search_posts,
+                params={**params, "cursor": cursor}), read_ahead=True) as pages:
+            for rsp in pages:
+                yield from search_matches(rsp.posts, follows, followers, is_follow,
+                                          is_follower)
 
     @normalize_handle
     def profile_did(self, handle):
-        """Return the DID for a given user handle"""
-        profile = self.get_profile(handle)
-        if profile:
-            return profile.did
-        return None
+        """Return the DID for a given user handle, None if it isn't found"""
+        return self.profile_dids([handle])[handle]
+
+    def profile_dids(self, handles):
+        """Return a dict of the DIDs of the given user handles, None for handles
+           that aren't found. Handles are resolved with
+           com.atproto.identity.resolveHandle unless they are already known, see
+           HandleResolver."""
+        normalized = {handle: self.normalize_handle_value(handle)
+                      for handle in handles}
+        dids = self.resolver.resolve_many(
+                [norm for norm in normalized.values() if not norm.startswith("did:")])
+        return {handle: norm if norm.startswith("did:") else dids[norm]
+                for handle, norm in normalized.items()}
+
+    def _resolve_handle(self, handle):
+        """Return the DID of the given handle, None if it can't be resolved"""
+        try:
+            return self.retrier.call(self.client.resolve_handle, handle).did
+        except atproto_client.exceptions.BadRequestError:
+            return None
 
     @staticmethod
     def at_uri_to_http_url(at_uri):
@@ -585,58 +1238,101 @@ class BlueSky:
     def follows(self, handle):
         """A generator to return an entry for each user that the given user
            handle follows"""
-        cursor = None
-        num_failures = 0
-
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                rsp = self.client.get_follows(handle, cursor=cursor)
-                yield from rsp.follows
-                if rsp.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = rsp.cursor
-                else:
-                    return []
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+        if self._graph_cache:
+            return self._cached_graph("follows", handle)
+        return self._graph("follows", handle)
 
     @normalize_handle
     def followers(self, handle):
         """A generator to return an entry for each user that follows the given user
            handle"""
-        cursor = None
-        num_failures = 0
-
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                rsp = self.client.get_followers(handle, cursor=cursor)
-                yield from rsp.followers
-                if rsp.cursor:
-                    self.logger.info("Cursor found, retrieving next page...")
-                    cursor = rsp.cursor
-                else:
-                    return []
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
-
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
-
-    def _login(self):
-        num_failures = 0
+        if self._graph_cache:
+            return self._cached_graph("followers", handle)
+        return self._graph("followers", handle)
+
+    def _graph(self, kind, handle):
+        """A generator to return an entry for each of the follows or followers
+           (kind) of the given user handle"""
+        for rsp in self._graph_pages(kind, handle, read_ahead=True):
+            yield from getattr(rsp, kind)
+
+    def _graph_pages(self, kind, handle, read_ahead=False):
+        """A generator to return each page of the follows or followers (kind) of
+           the given user handle, read ahead if set, see _paginator()"""
+        get_page = self.client.get_follows if kind == "follows" \
+            else self.client.get_followers
+        with self._paginator(lambda cursor: self.retrier.call(
+                get_page, handle, cursor=cursor), read_ahead) as pages:
+            yield from pages
+
+    def _paginator(self, fetch, read_ahead=False):
+        """Return a paginate.Paginator of the pages returned by fetch(cursor),
+           read self.read_ahead pages ahead if read_ahead is set. Only listings
+           that are usually read to the end read ahead. Those that stop early at
+           a date or count limit would fetch pages that aren't used."""
+        return paginate.Paginator(fetch, read_ahead=self.read_ahead if read_ahead
+                                  else 0, logger=self.logger)
+
+    def _cached_graph(self, kind, handle):
+        """A generator to return the follows or followers (kind) of the given user
+           handle from the graph cache. If they're not cached, or older than the
+           cache's TTL, they're retrieved and cached. An incremental refresh only
+           retrieves pages until it reaches an entry that is already cached."""
+        cache = self._graph_cache
+        cached = cache.lookup(kind, handle)
+        if cached and cache.is_fresh(cached[1]):
+            self.logger.info("Using cached %s of %s", kind, handle)
+            yield from self._cached_profiles(kind, cached[0])
+            return
+
+        if cached and cache.refresh == cache.INCREMENTAL:
+            new = []
+            subject = None
+            # The refresh usually stops within a page or two, don't read ahead
+            for rsp in self._graph_pages(kind, handle):
+                subject = rsp.subject
+                profiles = getattr(rsp, kind)
+                known = cache.known(kind, subject.did, (p.did for p in profiles))
+                new.extend(p for p in profiles if p.did not in known)
+                if known:
+                    break
+            self.logger.info("Adding %d new %s of %s to the cache", len(new), kind,
+                             handle)
+            if subject:
+                cache.prepend(kind, subject.did, subject.handle,
+                              [(p.did, self._profile_to_json(p)) for p in new])
+            yield from self._cached_profiles(kind, subject.did if subject
+                                             else cached[0])
+            return
+
+        # Full refresh: yield entries as they arrive and stage each page in the
+        # cache, only replacing the cached entries once they have all been
+        # retrieved
+        count = 0
+        subject = None
+        for rsp in self._graph_pages(kind, handle, read_ahead=True):
+            subject = rsp.subject
+            profiles = getattr(rsp, kind)
+            cache.stage(kind, subject.did,
+                        [(p.did, self._profile_to_json(p)) for p in profiles], count)
+            count += len(profiles)
+            yield from profiles
+        if subject:
+            cache.replace_staged(kind, subject.did, subject.handle)
+
+    def _cached_profiles(self, kind, subject):
+        """A generator to return the cached profiles of the follows or followers
+           (kind) of the given user DID"""
+        for profile in self._graph_cache.entries(kind, subject):
+            yield atproto.models.AppBskyActorDefs.ProfileView.model_validate_json(
+                    profile)
 
-        while num_failures < BlueSky.FAILURE_LIMIT:
-            try:
-                self.client.login(self.handle, self._password)
-                return
-            except atproto_core.exceptions.AtProtocolError as ex:
-                num_failures += 1
-                self._print_at_protocol_error(ex)
+    @staticmethod
+    def _profile_to_json(profile):
+        return profile.model_dump_json(by_alias=True, exclude_none=True)
 
-        raise IOError(f"Giving up, more than {self.FAILURE_LIMIT} failures")
+    def _login(self, client):
+        self.retrier.call(client.login, self.handle, self._password)
 
     def _print_at_protocol_error(self, ex):
         self.logger.error(type(ex))
@@ -667,24 +1363,7 @@ class BlueSky:
         return hand.lstrip("@")
 
     def _get_image_data(self, filename):
-        """Read the image at the given filename and downsize it to under the
-           max size permissible for blue sky"""
-        scaler = 0.75
-        count = 0
-
-        self.logger.info("Reading image file %s", filename)
-        with Image(filename=filename) as img:
-            while count < 100:  # need some limit, surely 100 is enough
-                img_data = img.make_blob()
-                siz = len(img_data)
-                self.logger.info("Image size is %d", siz)
-                if siz < BlueSky.BLUESKY_MAX_IMAGE_SIZE:
-                    break
-
-                width = int(img.width * scaler)
-                height = int(img.height * scaler)
-                self.logger.info("Resizing image file to %dx%d", width, height)
-                img.resize(width, height)
-                count += 1
-
-        return img_data
+        """Return the ImageData of the image at the given filename downsized to
+           under the max size permissible for blue sky, see images.prepare()"""
+        return images.prepare(filename, self._image_cache,
+                              BlueSky.BLUESKY_MAX_IMAGE_SIZE)
@@ -13,12 +13,28 @@ import logging
 from dataclasses import dataclass
 
 import bluesky
+import cleanup
 from commandlineparser import Command, Argument, CommandLineParser
+from graphcache import GraphCache
+from handles import HandleStore
+from images import ImageCache
+import jetstream
+from lazyimport import lazy_import
+import outputformat
+import paginate
+from poststore import PostStore
+from profilecache import LRUCache, ProfileStore
+from retry import Retrier
 from usercmd import UserCmd
 from postcmd import PostCmd
 from likecmd import LikeCmd
 from msgcmd import MsgCmd
+from repocmd import RepoCmd
 import shared
+from transport import Transport
+
+# Only --record and --replay need the cassette and httpx
+cassettes = lazy_import("cassette")
 
 
 @dataclass
@@ -36,6 +52,17 @@ class BlueSkyCommandLine:
     """A command line client for the BlueSky API"""
     CONFIG_PATH_FILENAME = ".bluesky.config"
     CONFIG_PATH_DEFAULT = os.path.join(os.path.expanduser('~'), CONFIG_PATH_FILENAME)
+    SESSION_PATH_FILENAME = ".bluesky.session"
+    SESSION_PATH_DEFAULT = os.path.join(os.path.expanduser('~'), SESSION_PATH_FILENAME)
+    # The on-disk stores, each enabled by a path in its config section: the
+    # BlueSky argument, the config section, the store class and the options of
+    # the section passed to the store
+    STORES = [("graph_cache", "graph_cache", GraphCache, {"ttl": int, "refresh": str}),
+              ("profile_store", "profile_cache", ProfileStore, {"ttl": int}),
+              ("handle_store", "handle_cache", HandleStore, {"ttl": int}),
+              ("post_store", "post_store", PostStore, {"refresh": int}),
+              ("image_cache", "image_cache", ImageCache, {}),
+              ("cleanup_store", "cleanup", cleanup.CleanupStore, {})]
     # Global aruments for the application as a whole
     ARGUMENTS = [Argument("--critical", action="store_const",
                           dest="log_level", const=logging.CRITICAL,
@@ -58,7 +85,24 @@ class BlueSkyCommandLine:
                           help="Synonym for --debug"),
                  Argument("--config", "-c", dest="config", action="store",
                           help=f"Config file or $BSCONFIG or "
-                               f"$HOME/{CONFIG_PATH_FILENAME}")]
+                               f"$HOME/{CONFIG_PATH_FILENAME}"),
+                 Argument("--format", "-F", choices=outputformat.FORMATS,
+                          default=outputformat.TEXT,
+                          help="Output format of the records a command shows "
+                               "[default: text]"),
+                 Argument("--fields", action="store",
+                          help="Comma separated fields of each record to show "
+                               "with --format jsonl, csv or tsv [default: all]"),
+                 Argument("--record", metavar="CASSETTE", action="store",
+                          help="Record the command's requests and responses in "
+                               "the given cassette file"),
+                 Argument("--replay", metavar="CASSETTE", action="store",
+                          help="Replay the command from the given cassette file "
+                               "instead of using the network"),
+                 Argument("--replay-latency", action="store", default="0",
+                          help="Simulated latency of each replayed request in "
+                               "seconds, or `recorded` to use the latency of the "
+                               "recording [default: 0]")]
     # User sub-commands
     USER = [Command("did", None,
                     [Argument("handle", nargs="?", help="User's handle")],
@@ -88,14 +132,24 @@ class BlueSkyCommandLine:
                                    "that follow the given user that the user doesn't "
                                    "follow back"),
                      Argument("--full", "-f", action="store_true",
-                              help="Show more details of each user")],
+                              help="Show more details of each user"),
+                     Argument("--run-size", type=int, action="store",
+                              help="Hold at most this many users of each side in "
+                                   "memory, spilling the rest to sorted runs on "
+                                   "disk, for very large accounts")],
                     help="Show who follows the given user"),
             Command("reposters", None,
                     [Argument("handle", nargs="?", help="User's handle"),
                      Argument("--since", "-s", action="store",
                               help="Date limit (e.g. today/yesterday/3 days ago"),
                      Argument("--full", "-f", action="store_true",
-                              help="Show more details of each user")],
+                              help="Show more details of each user"),
+                     Argument("--stored", action="store_true",
+                              help="Sync the user's posts to the post store and "
+                                   "read them from there"),
+                     Argument("--top", "-t", type=int, action="store",
+                              help="Show only the given number of users with the "
+                                   "most reposts")],
                     help="Show repost users"),
             Command("likes", None,
                     [Argument("--since", "-s", action="store",
@@ -103,9 +157,12 @@ class BlueSkyCommandLine:
                      Argument("--count", "-c", action="store", type=int,
                               help="Max number of posts to check likes for"),
                      Argument("--date", "-d", action="store_true",
-                              help="Show date of each like (more costly)"),
+                              help="Show date of each like"),
                      Argument("--short",  action="store_true",
-                              help="Show a short format output")],
+                              help="Show a short format output"),
+                     Argument("--exact-date", action="store_true",
+                              help="Fetch each like record for its exact date "
+                                   "(more costly)")],
                     help="Show likes for authenticated user")]
 
     # Post sub-commands
@@ -140,8 +197,13 @@ class BlueSkyCommandLine:
                      Argument("--all", "-a", action="store_const",
                               dest="post_type",
                               const=bluesky.ALL_POST,
-                              help="Show all posts types")],
-                    func_args=lambda ns: (ns.handle, ns.since, ns.count, ns.post_type),
+                              help="Show all posts types"),
+                     Argument("--since-last", action="store_true",
+                              help="Only show posts that are new since the last "
+                                   "--since-last run, keeping the user's posts in "
+                                   "the post store")],
+                    func_args=lambda ns: (ns.handle, ns.since, ns.count, ns.post_type,
+                                          ns.since_last),
                     help="Show BlueSky posts"),
             Command("put", None,
                     [Argument("text", action="store", help="Text to post"),
@@ -157,11 +219,15 @@ class BlueSkyCommandLine:
                     help="Post rich text to BlueSky"),
             Command("puti", None,
                     [Argument("text", action="store", help="Text to post"),
-                     Argument("filename", action="store", help="Path to image file"),
-                     Argument("--alt", "-a", action="store", help="Image alt text"),
+                     Argument("filename", nargs="+",
+                              help="Path to image file, up to "
+                                   f"{bluesky.BlueSky.MAX_IMAGES} files"),
+                     Argument("--alt", "-a", action="append",
+                              help="Image alt text, given once for each image "
+                                   "in order"),
                      Argument("--uri", "-u", action="store_true",
                               help="Show URI of post")],
-                    help="Post image to BlueSky"),
+                    help="Post images to BlueSky"),
             Command("delete", None,
                     [Argument("uri", action="store", help="URI to delete")],
                     aliases=["del"], help="Delete BlueSky post"),
@@ -232,9 +298,12 @@ class BlueSkyCommandLine:
                               help="Show all posts types"),
                      Argument("--full", "-f", action="store_true",
                               help="Show full details of each user who likes the "
-                                   "post")],
+                                   "post"),
+                     Argument("--stored", action="store_true",
+                              help="Sync the user's posts to the post store and "
+                                   "read them from there")],
                     func_args=lambda ns: (ns.handle, ns.since, ns.count,
-                                          ns.post_type, ns.full),
+                                          ns.post_type, ns.full, ns.stored),
                     help="Show like details of the found posts"),
             Command("most", None,
                     [Argument("--since", "-s", action="store",
@@ -261,9 +330,15 @@ class BlueSkyCommandLine:
                      Argument("--all", "-a", action="store_const",
                               dest="post_type",
                               const=bluesky.ALL_POST,
-                              help="Show all posts types")],
+                              help="Show all posts types"),
+                     Argument("--top", "-t", type=int, action="store",
+                              help="Show only the given number of users with the "
+                                   "most likes"),
+                     Argument("--stored", action="store_true",
+                              help="Sync the user's posts to the post store and "
+                                   "read them from there")],
                     func_args=lambda ns: (ns.handle, ns.since, ns.count,
-                                          ns.post_type, ns.full),
+                                          ns.post_type, ns.full, ns.top, ns.stored),
                     help="Find users with the most likes for the given posts")]
 
     # Msg (notification) sub-commands
@@ -277,12 +352,50 @@ class BlueSkyCommandLine:
                              help="Max number of notifications to show"),
                     Argument("--mark", "-m", action="store_true",
                              help="Mark notifications as seen")],
-                   help="Show notifications")]
+                   help="Show notifications"),
+           Command("watch", None,
+                   [Argument("--reason", "-r", action="append", dest="reason",
+                             choices=jetstream.REASONS,
+                             help="Only show notifications for this reason, can "
+                                  "be given more than once"),
+                    Argument("--count", "-c", action="store", type=int,
+                             help="Stop after showing this many notifications"),
+                    Argument("--cursor", action="store", type=int,
+                             help="Replay the stream from the given time_us")],
+                   help="Show notifications as they happen")]
+
+    # Repo sub-commands
+    REPO = [Command("cleanup", None,
+                    [Argument("collection", choices=list(cleanup.COLLECTIONS),
+                              help="Kind of records to delete"),
+                     Argument("--since", "-s", action="store",
+                              help="Only delete records created since this date "
+                                   "(e.g. today/yesterday/3 days ago)"),
+                     Argument("--before", "-b", action="store",
+                              help="Only delete records created before this date "
+                                   "(e.g. 52 weeks ago)"),
+                     Argument("--type", "-t", choices=cleanup.TYPES,
+                              default=cleanup.ALL, dest="record_type",
+                              help="Only delete original posts or replies "
+                                   "[default: all]"),
+                     Argument("--dry-run", "-n", action="store_true",
+                              help="Show the records that would be deleted "
+                                   "without deleting them"),
+                     Argument("--batch-size", type=int, action="store",
+                              help="Records deleted per request, up to "
+                                   f"{cleanup.MAX_BATCH_SIZE} [default: "
+                                   f"{cleanup.DEFAULT_BATCH_SIZE}]")],
+                    func_args=lambda ns: (cleanup.Criteria(
+                        ns.collection, ns.since, ns.before, ns.record_type),
+                        ns.dry_run, ns.batch_size),
+                    help="Delete the authenticated user's posts, likes or "
+                         "reposts in bulk")]
 
     COMMANDS = [Command("user", USER),
                 Command("post", POST),
                 Command("like", LIKE),
-                Command("msg", MSG)]
+                Command("msg", MSG),
+                Command("repo", REPO)]
 
     def __init__(self, args):
         """Command Line Main Entry Point"""
@@ -301,9 +414,34 @@ class BlueSkyCommandLine:
         self.config = self.get_config(config_path)
         self.handle, self._password = (self.config.get("auth", "user"),
                                        self.config.get("auth", "password"))
+        # The session is saved between runs to avoid logging in every time. An
+        # empty session_file value in the config disables this.
+        session_path = os.path.expanduser(
+                self.config.get("auth", "session_file",
+                                fallback=BlueSkyCommandLine.SESSION_PATH_DEFAULT))
+
+        # Recordings and replays don't use a saved session or the local caches
+        # so that a replay makes the same requests as its recording
+        cassette = self.get_cassette(self.ns)
+        if cassette:
+            session_path, stores = None, {}
+        else:
+            stores = {arg: self.get_store(self.config, section, cls, options)
+                      for arg, section, cls, options in self.STORES}
 
         # Create the bluesky client that interacts with the BlueSky API
-        self.bs = bluesky.BlueSky(self.handle, self._password)
+        self.bs = bluesky.BlueSky(self.handle, self._password,
+                                  session_path=session_path,
+                                  profile_cache_size=self.config.getint(
+                                      "profile_cache", "size",
+                                      fallback=LRUCache.DEFAULT_SIZE),
+                                  retrier=Retrier.from_config(self.config),
+                                  cassette=cassette,
+                                  read_ahead=self.config.getint(
+                                      "pagination", "read_ahead",
+                                      fallback=paginate.DEFAULT_READ_AHEAD),
+                                  transport=Transport.from_config(self.config),
+                                  **stores)
 
     def run(self):
         """Run the function for the command line given to the constructor"""
@@ -339,6 +477,39 @@ class BlueSkyCommandLine:
            For example: user -> UserCmd, post -> PostCmd"""
         return f"{cmd_name.capitalize()}Cmd"
 
+    @staticmethod
+    def get_store(config, section, cls, options=None):
+        """Return a store of the given class if a path is configured in the
+           given config section, otherwise None. The given options of the
+           section (name -> type) that are set are passed to the store."""
+        path = config.get(section, "path", fallback=None)
+        if not path:
+            return None
+        kwargs = {name: convert(config.get(section, name))
+                  for name, convert in (options or {}).items()
+                  if config.has_option(section, name)}
+        return cls(os.path.expanduser(path), **kwargs)
+
+    @staticmethod
+    def get_cassette(ns):
+        """Return the cassette to record to or replay from if --record or
+           --replay was given, otherwise None"""
+        if ns.record and ns.replay:
+            raise ValueError("Only one of --record and --replay can be given")
+        if ns.record:
+            return cassettes.Cassette(ns.record, cassettes.Cassette.RECORD)
+        if ns.replay:
+            latency = ns.replay_latency
+            if latency != cassettes.RECORDED:
+                try:
+                    latency = float(latency)
+                except ValueError:
+                    raise ValueError(f"Invalid replay latency: `{latency}`. "
+                                     f"Expected seconds or "
+                                     f"`{cassettes.RECORDED}`.") from None
+            return cassettes.Cassette(ns.replay, cassettes.Cassette.REPLAY, latency)
+        return None
+
     @staticmethod
     def get_config(path):
         """Read config data and return"""
@@ -0,0 +1,249 @@
+"""Record the XRPC requests and responses of a session into a cassette file and
+   replay them later without a network
+
+A cassette is a gzipped file of JSON lines, one per request. Requests are
+matched by method, URL and a hash of the request body. Session tokens are
+replaced by unsigned tokens that never expire, and the body of login requests
+isn't hashed, so a cassette holds neither the password nor a usable session and
+can be replayed without logging in."""
+
+import asyncio
+import atexit
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+import httpx
+
+from transport import Transport
+
+CASSETTE_VERSION = 1
+# Replay with the latency measured when each response was recorded
+RECORDED = "recorded"
+# The bodies of these requests hold credentials, they are matched without them
+SESSION_ENDPOINTS = ("com.atproto.server.createSession",
+                     "com.atproto.server.refreshSession")
+# The response headers worth keeping: the content type and rate limit details
+KEPT_HEADERS = ("content-type", "ratelimit-limit", "ratelimit-remaining",
+                "ratelimit-reset", "ratelimit-policy", "retry-after")
+# Tokens of replayed sessions expire in 2100
+REPLAY_TOKEN_EXPIRY = 4102444800
+
+
+class CassetteMissError(LookupError):
+    """Raised when replaying a request that wasn't recorded"""
+
+
+def request_key(request):
+    """Return the key that the given httpx request is recorded and replayed by"""
+    body = request.content
+    if not body or request.url.path.rsplit("/", 1)[-1] in SESSION_ENDPOINTS:
+        digest = ""
+    else:
+        digest = hashlib.sha256(body).hexdigest()[:32]
+    return f"{request.method} {request.url.host}{request.url.raw_path.decode()} " \
+           f"{digest}"
+
+
+def replay_token(payload):
+    """Return an unsigned JWT with the given payload and an expiry far enough in
+       the future that the atproto client never refreshes it"""
+    def encode(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=") \
+            .decode()
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}." \
+           f"{encode({**payload, 'exp': REPLAY_TOKEN_EXPIRY})}."
+
+
+def _sanitize(content):
+    """Replace the session tokens of a createSession or refreshSession response"""
+    try:
+        session = json.loads(content)
+    except ValueError:
+        return content
+    for field, scope in (("accessJwt", "com.atproto.access"),
+                         ("refreshJwt", "com.atproto.refresh")):
+        if field in session:
+            session[field] = replay_token({"scope": scope,
+                                           "sub": session.get("did")})
+    return json.dumps(session).encode()
+
+
+class Cassette:
+    """A cassette file opened for recording or replaying. Use request() and
+       async_request() to create the atproto request objects of clients that
+       record to or replay from it. A recording is only complete once the
+       cassette is closed, which happens at exit if it isn't closed before."""
+    RECORD = "record"
+    REPLAY = "replay"
+
+    def __init__(self, path, mode, latency=0.0):
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError(f"Invalid cassette mode: `{mode}`. Expected "
+                             f"`{self.RECORD}` or `{self.REPLAY}`.")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._interactions = collections.defaultdict(collections.deque)
+        self._file = None
+
+        if mode == self.RECORD:
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            self._file.write(json.dumps({"version": CASSETTE_VERSION}) + "\n")
+            atexit.register(self.close)
+        else:
+            self._load()
+
+    def _load(self):
+        """Read the interactions of the cassette"""
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version "
+                                 f"{header.get('version')} in {self.path}")
+            for line in f:
+                entry = json.loads(line)
+                if "text" in entry:
+                    content = entry["text"].encode()
+                else:
+                    content = base64.b64decode(entry["data"])
+                self._interactions[entry["key"]].append(
+                        (entry["status"], entry["headers"], content,
+                         entry["elapsed"]))
+
+    def close(self):
+        """Finish writing a recording"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def record(self, request, response, elapsed):
+        """Add the given httpx request and its (read) response"""
+        content = response.content
+        if request.url.path.rsplit("/", 1)[-1] in SESSION_ENDPOINTS:
+            content = _sanitize(content)
+
+        entry = {"key": request_key(request),
+                 "status": response.status_code,
+                 "headers": {name: response.headers[name] for name in KEPT_HEADERS
+                             if name in response.headers},
+                 "elapsed": round(elapsed, 4)}
+        try:
+            entry["text"] = content.decode()
+        except UnicodeDecodeError:
+            entry["data"] = base64.b64encode(content).decode()
+
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._file:
+                raise ValueError(f"Cassette {self.path} is closed")
+            self._file.write(line)
+
+    def replay(self, request):
+        """Return the recorded httpx response to the given request and its
+           delay. Identical requests are answered in the order they were
+           recorded, the last answer is repeated once they run out."""
+        key = request_key(request)
+        with self._lock:
+            answers = self._interactions.get(key)
+            if not answers:
+                raise CassetteMissError(f"No recorded response to {key} in "
+                                        f"{self.path}")
+            status, headers, content, elapsed = \
+                answers.popleft() if len(answers) > 1 else answers[0]
+
+        delay = elapsed if self.latency == RECORDED else self.latency
+        return httpx.Response(status, headers=headers, content=content,
+                              request=request), delay
+
+    def transport(self, settings=None):
+        """Return an httpx transport that records to or replays from the
+           cassette. Recordings are sent with the connection pool of the given
+           transport.Transport settings."""
+        if self.mode == self.RECORD:
+            return RecordingTransport(self, (settings or Transport()).http_transport())
+        return ReplayTransport(self)
+
+    def async_transport(self, settings=None):
+        """Return an async httpx transport that records to or replays from the
+           cassette"""
+        if self.mode == self.RECORD:
+            return AsyncRecordingTransport(
+                    self, (settings or Transport()).async_http_transport())
+        return AsyncReplayTransport(self)
+
+    def request(self, settings=None):
+        """Return an atproto Request that uses the cassette and the given
+           transport.Transport settings"""
+        settings = settings or Transport()
+        return settings.request(self.transport(settings))
+
+    def async_request(self, settings=None):
+        """Return an atproto AsyncRequest that uses the cassette and the given
+           transport.Transport settings"""
+        settings = settings or Transport()
+        return settings.async_request(self.async_transport(settings))
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Send requests with the given transport and record them in the cassette"""
+    def __init__(self, cassette, transport):
+        self.cassette = cassette
+        self.transport = transport
+
+    def handle_request(self, request):
+        start = time.monotonic()
+        response = self.transport.handle_request(request)
+        response.read()
+        self.cassette.record(request, response, time.monotonic() - start)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Answer requests from the cassette"""
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def handle_request(self, request):
+        response, delay = self.cassette.replay(request)
+        if delay:
+            time.sleep(delay)
+        return response
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """Async equivalent of RecordingTransport"""
+    def __init__(self, cassette, transport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        start = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        self.cassette.record(request, response, time.monotonic() - start)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """Async equivalent of ReplayTransport"""
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    async def handle_async_request(self, request):
+        response, delay = self.cassette.replay(request)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
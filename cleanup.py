@@ -0,0 +1,135 @@
+"""Bulk deletion of the authenticated user's posts, likes and reposts
+
+Records are selected by collection, record key date range and post type. They
+are listed with com.atproto.repo.listRecords, newest first, starting from the
+record key of the end of the date range, so newer records are never fetched.
+The selected records are deleted with com.atproto.repo.applyWrites in batches.
+Record keys are TIDs, which encode the time each record was created, see
+tid.py, so the date range is checked without reading the records.
+
+Batches are paced to stay under the PDS's write rate limit, and a rate limited
+batch waits for the limit to reset, see retry.py. After each batch the position
+in the listing is saved in the CleanupStore, so an interrupted cleanup that is
+run again carries on from there rather than listing the records kept again."""
+
+import time
+from dataclasses import dataclass
+
+from sqlitestore import SQLiteStore
+
+POSTS = "posts"
+LIKES = "likes"
+REPOSTS = "reposts"
+COLLECTIONS = {POSTS: "app.bsky.feed.post",
+               LIKES: "app.bsky.feed.like",
+               REPOSTS: "app.bsky.feed.repost"}
+
+# Post types, only posts have a type
+ALL = "all"
+ORIGINAL = "original"
+REPLY = "reply"
+TYPES = (ALL, ORIGINAL, REPLY)
+
+# com.atproto.repo.applyWrites takes at most 200 writes
+MAX_BATCH_SIZE = 200
+DEFAULT_BATCH_SIZE = MAX_BATCH_SIZE
+# The PDS allows 5000 points of writes an hour and a delete costs 1 point.
+# Leave some for the user's other writes.
+DEFAULT_WRITES_PER_HOUR = 4500
+
+
+@dataclass
+class Criteria:
+    """The records to delete: those of the given collection (POSTS, LIKES or
+       REPOSTS) created since the since date and before the before date, both
+       informal date strings, see dateparse.py. Posts can also be selected by
+       type, see TYPES."""
+    collection: str
+    since: str = None
+    before: str = None
+    record_type: str = ALL
+
+    def __post_init__(self):
+        if self.collection not in COLLECTIONS:
+            raise ValueError(f"Invalid collection: `{self.collection}`. Expected "
+                             f"one of {', '.join(COLLECTIONS)}.")
+        if self.record_type not in TYPES:
+            raise ValueError(f"Invalid type: `{self.record_type}`. Expected one "
+                             f"of {', '.join(TYPES)}.")
+        if self.record_type != ALL and self.collection != POSTS:
+            raise ValueError(f"Only {POSTS} can be selected by type")
+
+    @property
+    def nsid(self):
+        """The NSID of the collection"""
+        return COLLECTIONS[self.collection]
+
+    def key(self, did):
+        """Return the key of a cleanup of the given user's records by these
+           criteria. Date strings aren't resolved so that running the same
+           command again resumes the same cleanup."""
+        return "|".join((did, self.collection, self.record_type,
+                         self.since or "", self.before or ""))
+
+    def matches(self, value):
+        """Indicate whether the given record value is of the selected type"""
+        if self.record_type == ALL:
+            return True
+        is_reply = getattr(value, "reply", None) is not None
+        return is_reply == (self.record_type == REPLY)
+
+
+class Pacer:
+    """Spread writes out to at most per_hour writes an hour. A batch of writes
+       waits until the writes before it would have been made at that rate. No
+       per_hour means no pacing."""
+    def __init__(self, per_hour=DEFAULT_WRITES_PER_HOUR, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.per_hour = per_hour
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = None
+
+    def wait(self, count):
+        """Wait until the given number of writes can be made"""
+        if not self.per_hour:
+            return
+        now = self.clock()
+        start = now if self.next_at is None else max(self.next_at, now)
+        if start > now:
+            self.sleep(start - now)
+        self.next_at = start + count * 3600 / self.per_hour
+
+
+class CleanupStore(SQLiteStore):
+    """An SQLite store of the progress of interrupted cleanups, keyed by
+       Criteria.key(): the record key listed up to and the number of records
+       deleted so far"""
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS cleanups (
+                     key TEXT PRIMARY KEY,
+                     cursor TEXT NOT NULL,
+                     deleted INTEGER NOT NULL,
+                     updated_at REAL NOT NULL)""",)
+
+    def get(self, key):
+        """Return the (cursor, deleted) progress tuple of the given cleanup, None
+           if it isn't in progress"""
+        with self._connect() as db:
+            row = db.execute("""SELECT cursor, deleted FROM cleanups
+                                WHERE key = ?""", (key,)).fetchone()
+        if row is None:
+            return None
+        cursor, deleted = row
+        return cursor, deleted
+
+    def put(self, key, cursor, deleted):
+        """Save the progress of the given cleanup"""
+        with self._connect() as db:
+            db.execute("""INSERT OR REPLACE INTO cleanups
+                          (key, cursor, deleted, updated_at) VALUES (?, ?, ?, ?)""",
+                       (key, cursor, deleted, time.time()))
+
+    def remove(self, key):
+        """Forget the given cleanup once it's complete"""
+        with self._connect() as db:
+            db.execute("DELETE FROM cleanups WHERE key = ?", (key,))
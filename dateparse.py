@@ -2,29 +2,38 @@
 
 """Parse informal date strings into datetime objects"""
 from datetime import datetime, timedelta
+import functools
 import re
 
-import tzlocal
-import dateutil
-
+from lazyimport import lazy_import
 import text2int
+import timestamp
+
+# tzlocal probes the system for its timezone, both are only loaded when a date
+# is parsed
+dateutil_parser = lazy_import("dateutil.parser")
+tzlocal = lazy_import("tzlocal")
+
 
-LOCAL_TIMEZONE = tzlocal.get_localzone()
+@functools.cache
+def local_timezone():
+    """Return the local timezone, looked up once"""
+    return tzlocal.get_localzone()
 
 
 def parse(date_limit_str):
     """Parse the given date string into a datetime object"""
     try:
-        parsed_date = _parse(date_limit_str).replace(tzinfo=LOCAL_TIMEZONE)
+        parsed_date = _parse(date_limit_str).replace(tzinfo=local_timezone())
         dt = parsed_date
     except ValueError:
-        dt = dateutil.parser.parse(date_limit_str)
+        dt = dateutil_parser.parse(date_limit_str)
 
     if not dt:
         print(f"Error parsing date: {date_limit_str}")
         return None
 
-    return dt.replace(tzinfo=LOCAL_TIMEZONE)
+    return dt.replace(tzinfo=local_timezone())
 
 
 def _parse(date_str):
@@ -176,7 +185,7 @@ def humanise_date_string(date_string):
     """Convert the given BlueSky date string into something more readable
         for human consumption"""
     try:
-        return dateutil.parser.isoparse(date_string).strftime(
+        return timestamp.parse(date_string).strftime(
                 "%B %d, %Y at %I:%M %p UTC")
     except ValueError:
         # Failed to parse string, return it as a simple string
@@ -0,0 +1,126 @@
+"""Sort and join more records than fit in memory
+
+SortedRuns holds at most run_size records in memory. Each time it's full they
+are sorted and written to a run file, and the runs are merged back in key order
+when read. At most max_fan_in runs are merged at a time, so a very large sort
+doesn't run out of file descriptors. merge_join() joins two key ordered
+streams, such as the follows and followers of a user, holding only the current
+record of each, see BlueSky.get_mutuals()."""
+
+import heapq
+import os
+import tempfile
+
+DEFAULT_RUN_SIZE = 100000
+DEFAULT_MAX_FAN_IN = 64
+
+
+class SortedRuns:
+    """Records of a string key and an optional string value, added in any order
+       and iterated in key order. Records are spilled to sorted run files of
+       run_size records in a temporary directory, in the given directory if
+       set, that is removed when closed. Keys can't contain tabs or newlines,
+       nor can values. No more than max_fan_in run files are read at once,
+       runs are merged into longer runs first if there are more."""
+    def __init__(self, run_size=DEFAULT_RUN_SIZE, directory=None,
+                 max_fan_in=DEFAULT_MAX_FAN_IN):
+        if run_size < 1:
+            raise ValueError(f"Invalid run size: {run_size}")
+        if max_fan_in < 2:
+            raise ValueError(f"Invalid max fan-in: {max_fan_in}")
+        self.run_size = run_size
+        self.max_fan_in = max_fan_in
+        self._dir = tempfile.TemporaryDirectory(prefix="bs-runs-", dir=directory)
+        self._buffer = []
+        self._written = 0
+        self.runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Remove the run files"""
+        self._buffer = []
+        self._dir.cleanup()
+
+    def add(self, key, value=None):
+        """Add a record, spilling the records in memory to a run file once there
+           are run_size of them"""
+        self._buffer.append((key, value))
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        """Write the records in memory to a new run file in key order"""
+        self._buffer.sort(key=lambda record: record[0])
+        self.runs.append(self._write_run(self._buffer))
+        self._buffer = []
+
+    def _write_run(self, records):
+        """Write the given key ordered records to a new run file and return its
+           path"""
+        path = os.path.join(self._dir.name, f"run{self._written}")
+        self._written += 1
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\t{'' if value is None else value}\n"
+                         for key, value in records)
+        return path
+
+    def _merge_runs(self):
+        """Merge the oldest max_fan_in runs into one run until there are no more
+           than max_fan_in runs"""
+        while len(self.runs) > self.max_fan_in:
+            paths = self.runs[:self.max_fan_in]
+            merged = self._write_run(heapq.merge(
+                    *(self._read_run(path) for path in paths),
+                    key=lambda record: record[0]))
+            for path in paths:
+                os.remove(path)
+            self.runs = self.runs[self.max_fan_in:] + [merged]
+
+    @staticmethod
+    def _read_run(path):
+        """A generator to yield the (key, value) records of the given run file"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                key, value = line.rstrip("\n").split("\t", 1)
+                yield key, value or None
+
+    def __iter__(self):
+        """Yield the (key, value) records in key order, reading each run a line
+           at a time"""
+        self._merge_runs()
+        self._buffer.sort(key=lambda record: record[0])
+        return heapq.merge(*(self._read_run(path) for path in self.runs),
+                           iter(self._buffer), key=lambda record: record[0])
+
+
+def merge_join(left, right):
+    """A generator to yield (key, left record, right record) for each key in
+       either of the given iterables of (key, value) records in key order, with
+       the record of the side it's missing from set to None (a full outer join).
+       Each key is yielded once, with the first record of each side."""
+    left, right = _unique(left), _unique(right)
+    lrec, rrec = next(left, None), next(right, None)
+    while lrec or rrec:
+        if rrec is None or (lrec is not None and lrec[0] < rrec[0]):
+            yield lrec[0], lrec, None
+            lrec = next(left, None)
+        elif lrec is None or rrec[0] < lrec[0]:
+            yield rrec[0], None, rrec
+            rrec = next(right, None)
+        else:
+            yield lrec[0], lrec, rrec
+            lrec, rrec = next(left, None), next(right, None)
+
+
+def _unique(records):
+    """A generator to yield the first of each run of records with the same key"""
+    last = None
+    for record in records:
+        if record[0] != last:
+            last = record[0]
+            yield record
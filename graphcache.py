@@ -0,0 +1,163 @@
+"""A local SQLite cache of the follows and followers of BlueSky users"""
+
+import time
+
+from sqlitestore import SQLiteStore
+
+# pylint: disable=R0913,R0917
+
+
+class GraphCache(SQLiteStore):
+    """Store the follows and followers of users keyed by the user's DID, in the
+       order that the API returns them (newest first), along with when they were
+       fetched. Entries are stored as JSON strings, see BlueSky for the
+       conversion to and from profile models.
+
+       Each method opens its own connection so that a cache can be shared by
+       several threads, e.g. the crawlers of BlueSky.get_mutuals()."""
+    KINDS = ("follows", "followers")
+    DEFAULT_TTL = 3600
+    INCREMENTAL = "incremental"
+    FULL = "full"
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS fetches (
+                     subject TEXT NOT NULL,
+                     kind TEXT NOT NULL,
+                     handle TEXT NOT NULL,
+                     fetched_at REAL NOT NULL,
+                     PRIMARY KEY (subject, kind))""",
+              """CREATE TABLE IF NOT EXISTS entries (
+                     subject TEXT NOT NULL,
+                     kind TEXT NOT NULL,
+                     did TEXT NOT NULL,
+                     position INTEGER NOT NULL,
+                     profile TEXT NOT NULL,
+                     PRIMARY KEY (subject, kind, did))""",
+              """CREATE INDEX IF NOT EXISTS entries_position
+                     ON entries (subject, kind, position)""",
+              """CREATE TABLE IF NOT EXISTS staged_entries (
+                     subject TEXT NOT NULL,
+                     kind TEXT NOT NULL,
+                     did TEXT NOT NULL,
+                     position INTEGER NOT NULL,
+                     profile TEXT NOT NULL,
+                     PRIMARY KEY (subject, kind, did))""")
+
+    def __init__(self, path, ttl=DEFAULT_TTL, refresh=INCREMENTAL):
+        if refresh not in (self.INCREMENTAL, self.FULL):
+            raise ValueError(f"Invalid refresh mode: `{refresh}`. Expected "
+                             f"`{self.INCREMENTAL}` or `{self.FULL}`.")
+        self.ttl = ttl
+        self.refresh = refresh
+        super().__init__(path)
+
+    def _check_kind(self, kind):
+        if kind not in self.KINDS:
+            raise ValueError(f"Invalid kind: `{kind}`. Expected `follows` or "
+                             f"`followers`.")
+
+    def lookup(self, kind, actor):
+        """Return the (DID, fetched_at) of the given user, a handle or DID, if
+           their follows or followers (kind) are cached, otherwise None"""
+        self._check_kind(kind)
+        with self._connect() as db:
+            return db.execute("""SELECT subject, fetched_at FROM fetches
+                                 WHERE kind = ? AND (subject = ? OR handle = ?)
+                                 ORDER BY fetched_at DESC""",
+                              (kind, actor, actor)).fetchone()
+
+    def is_fresh(self, fetched_at):
+        """Indicate whether entries fetched at the given time are within the TTL"""
+        return time.time() - fetched_at < self.ttl
+
+    def entries(self, kind, subject):
+        """A generator to yield the cached JSON profiles of the given user's
+           follows or followers (kind), newest first"""
+        self._check_kind(kind)
+        with self._connect() as db:
+            cursor = db.execute("""SELECT profile FROM entries
+                                   WHERE subject = ? AND kind = ?
+                                   ORDER BY position""", (subject, kind))
+            for (profile,) in cursor:
+                yield profile
+
+    def known(self, kind, subject, dids):
+        """Return the set of the given DIDs that are cached as the given user's
+           follows or followers (kind)"""
+        self._check_kind(kind)
+        dids = list(dids)
+        if not dids:
+            return set()
+        with self._connect() as db:
+            rows = db.execute(f"""SELECT did FROM entries
+                                  WHERE subject = ? AND kind = ?
+                                  AND did IN ({", ".join("?" * len(dids))})""",
+                              (subject, kind, *dids))
+            return {did for (did,) in rows}
+
+    def replace(self, kind, subject, handle, rows):
+        """Replace the given user's cached follows or followers (kind) with the
+           given (did, JSON profile) rows, newest first"""
+        self._check_kind(kind)
+        with self._connect() as db:
+            db.execute("DELETE FROM entries WHERE subject = ? AND kind = ?",
+                       (subject, kind))
+            db.executemany("""INSERT OR REPLACE INTO entries
+                              (subject, kind, did, position, profile)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           ((subject, kind, did, position, profile)
+                            for position, (did, profile) in enumerate(rows)))
+            self._fetched(db, kind, subject, handle)
+
+    def stage(self, kind, subject, rows, start=0):
+        """Stage the given (did, JSON profile) rows, newest first, at the given
+           position of a full refresh of the given user's follows or followers
+           (kind). They replace the cached entries once the refresh is complete,
+           see replace_staged(). Staging from the start discards the rows of an
+           earlier refresh that wasn't completed."""
+        self._check_kind(kind)
+        with self._connect() as db:
+            if not start:
+                db.execute("""DELETE FROM staged_entries
+                              WHERE subject = ? AND kind = ?""", (subject, kind))
+            db.executemany("""INSERT OR REPLACE INTO staged_entries
+                              (subject, kind, did, position, profile)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           ((subject, kind, did, start + i, profile)
+                            for i, (did, profile) in enumerate(rows)))
+
+    def replace_staged(self, kind, subject, handle):
+        """Replace the given user's cached follows or followers (kind) with the
+           rows staged by a complete refresh, see stage()"""
+        self._check_kind(kind)
+        with self._connect() as db:
+            db.execute("DELETE FROM entries WHERE subject = ? AND kind = ?",
+                       (subject, kind))
+            db.execute("""INSERT INTO entries
+                          (subject, kind, did, position, profile)
+                          SELECT subject, kind, did, position, profile
+                          FROM staged_entries WHERE subject = ? AND kind = ?""",
+                       (subject, kind))
+            db.execute("""DELETE FROM staged_entries
+                          WHERE subject = ? AND kind = ?""", (subject, kind))
+            self._fetched(db, kind, subject, handle)
+
+    def prepend(self, kind, subject, handle, rows):
+        """Add the given (did, JSON profile) rows, newest first, ahead of the
+           given user's cached follows or followers (kind)"""
+        self._check_kind(kind)
+        with self._connect() as db:
+            (first,) = db.execute("""SELECT COALESCE(MIN(position), 0) FROM entries
+                                     WHERE subject = ? AND kind = ?""",
+                                  (subject, kind)).fetchone()
+            db.executemany("""INSERT OR REPLACE INTO entries
+                              (subject, kind, did, position, profile)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           ((subject, kind, did, first - len(rows) + i, profile)
+                            for i, (did, profile) in enumerate(rows)))
+            self._fetched(db, kind, subject, handle)
+
+    @staticmethod
+    def _fetched(db, kind, subject, handle):
+        db.execute("""INSERT OR REPLACE INTO fetches (subject, kind, handle,
+                                                      fetched_at)
+                      VALUES (?, ?, ?, ?)""", (subject, kind, handle, time.time()))
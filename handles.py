@@ -0,0 +1,151 @@
+"""Resolve BlueSky handles to DIDs, with an in-process map and an optional
+   on-disk store of the results"""
+
+import concurrent.futures
+import threading
+import time
+
+from sqlitestore import SQLiteStore
+
+
+class HandleStore(SQLiteStore):
+    """An SQLite store of handle <-> DID mappings. Mappings older than the TTL
+       (seconds) are ignored."""
+    DEFAULT_TTL = 86400
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS handles (
+                     handle TEXT PRIMARY KEY,
+                     did TEXT NOT NULL,
+                     resolved_at REAL NOT NULL)""",
+              """CREATE INDEX IF NOT EXISTS handles_did
+                     ON handles (did)""")
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        super().__init__(path)
+
+    def get_dids(self, handles):
+        """Return a dict of the stored DIDs of those of the given handles that
+           are stored and within the TTL"""
+        handles = list(handles)
+        dids = {}
+        with self._connect() as db:
+            # Stay well within SQLite's limit on the number of parameters
+            for i in range(0, len(handles), 500):
+                batch = handles[i:i + 500]
+                dids.update(db.execute(
+                        f"""SELECT handle, did FROM handles
+                            WHERE handle IN ({", ".join("?" * len(batch))})
+                                  AND resolved_at > ?""",
+                        (*batch, time.time() - self.ttl)))
+        return dids
+
+    def get_handle(self, did):
+        """Return the most recently stored handle of the given DID if it's within
+           the TTL, otherwise None"""
+        with self._connect() as db:
+            row = db.execute("""SELECT handle FROM handles
+                                WHERE did = ? AND resolved_at > ?
+                                ORDER BY resolved_at DESC""",
+                             (did, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, rows):
+        """Store the given (handle, DID) rows"""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany("""INSERT OR REPLACE INTO handles (handle, did,
+                                                              resolved_at)
+                              VALUES (?, ?, ?)""",
+                           ((handle, did, now) for handle, did in rows))
+
+
+class HandleResolver:
+    """Resolve handles to DIDs with resolve_fn(handle), which returns the DID or
+       None if the handle doesn't exist. Results are kept in memory for the TTL
+       (seconds) and in the given HandleStore if there is one. Handles are case
+       insensitive. Mappings learnt elsewhere, e.g. from profiles, can be added
+       with put()."""
+    DEFAULT_TTL = HandleStore.DEFAULT_TTL
+    MAX_WORKERS = 8
+
+    def __init__(self, resolve_fn, store=None, ttl=DEFAULT_TTL,
+                 max_workers=MAX_WORKERS):
+        self.resolve_fn = resolve_fn
+        self.store = store
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._dids = {}
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, handle):
+        """Return the in-memory DID of the given handle if it's within the TTL"""
+        entry = self._dids.get(handle)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def _remember(self, mappings):
+        """Keep the given handle: DID mappings in memory"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for handle, did in mappings.items():
+                self._dids[handle] = (did, expires_at)
+                self._handles[did] = (handle, expires_at)
+
+    def put(self, handle, did):
+        """Add a known handle to DID mapping"""
+        self.put_many({handle: did})
+
+    def put_many(self, mappings):
+        """Add the given known handle: DID mappings"""
+        mappings = {handle.lower(): did for handle, did in mappings.items()}
+        self._remember(mappings)
+        if self.store and mappings:
+            self.store.put_many(mappings.items())
+
+    def resolve(self, handle):
+        """Return the DID of the given handle, None if it doesn't exist"""
+        return self.resolve_many([handle])[handle]
+
+    def resolve_many(self, handles):
+        """Return a dict of the DIDs of the given handles keyed by the handle
+           given, None for those that don't exist. Handles that aren't in memory
+           or in the store are resolved concurrently."""
+        keys = {handle: handle.lower() for handle in handles}
+        dids = {}
+        with self._lock:
+            for key in set(keys.values()):
+                did = self._cached(key)
+                if did:
+                    dids[key] = did
+
+        missing = [key for key in set(keys.values()) if key not in dids]
+        if missing and self.store:
+            stored = self.store.get_dids(missing)
+            self._remember(stored)
+            dids.update(stored)
+            missing = [key for key in missing if key not in stored]
+
+        resolved = {}
+        if len(missing) == 1:
+            resolved[missing[0]] = self.resolve_fn(missing[0])
+        elif missing:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, len(missing))) as executor:
+                resolved = dict(zip(missing, executor.map(self.resolve_fn, missing)))
+        # Only keep the handles that exist, the others might be created later
+        self.put_many({key: did for key, did in resolved.items() if did})
+        dids.update(resolved)
+
+        return {handle: dids.get(key) for handle, key in keys.items()}
+
+    def handle_of(self, did):
+        """Return the known handle of the given DID, None if it isn't known"""
+        with self._lock:
+            entry = self._handles.get(did)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+        if self.store:
+            return self.store.get_handle(did)
+        return None
@@ -0,0 +1,139 @@
+"""Prepare images for posting: downsize them to under the blob size limit in as
+   few encodes as possible, and cache the results
+
+The image is decoded once. Each attempt resizes a copy of the decoded original
+rather than shrinking the previous attempt again, so quality only suffers as
+much as the size limit requires. Encoded size is roughly proportional to the
+number of pixels, so the scale for a target size is estimated from the size of
+each attempt. Estimates that overshoot fall back to bisecting between the
+largest scale known to fit and the smallest known not to."""
+
+import hashlib
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+from lazyimport import lazy_import
+from sqlitestore import SQLiteStore
+
+# Loading ImageMagick is slow, wand is only loaded when an image is prepared
+wand_image = lazy_import("wand.image")
+
+MAX_SIZE = int(976.56 * 1024)
+# Bluesky shows images at most 2000 pixels on their longest side
+MAX_DIMENSION = 2000
+JPEG_QUALITY = 85
+# Stop once an attempt fits and fills this much of the limit
+TARGET_FILL = 0.9
+MAX_ENCODES = 8
+# Part of the cache key, change it when the processing changes
+PROCESS_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ImageData:
+    """An encoded image ready to upload and its dimensions"""
+    data: bytes
+    width: int
+    height: int
+
+
+def _encode(original, scale, image_format):
+    """Return the given decoded image scaled and encoded"""
+    with original.clone() as img:
+        width = max(1, round(original.width * scale))
+        height = max(1, round(original.height * scale))
+        if (width, height) != (original.width, original.height):
+            img.resize(width, height, filter="lanczos")
+        img.format = image_format
+        if image_format == "jpeg":
+            img.compression_quality = JPEG_QUALITY
+        return ImageData(img.make_blob(), width, height)
+
+
+def downsize(data, max_size=MAX_SIZE):
+    """Return the ImageData of the given encoded image, stripped of metadata,
+       turned upright, no larger than MAX_DIMENSION on either side and encoded
+       in under max_size bytes. Images with transparency stay PNGs, others are
+       JPEGs. Raise ValueError if it can't be made small enough."""
+    with wand_image.Image(blob=data) as original:
+        original.auto_orient()
+        original.strip()
+        image_format = "png" if original.alpha_channel else "jpeg"
+
+        # The largest scale known to fit and the smallest known not to
+        fits, too_big = 0.0, min(1.0, MAX_DIMENSION / max(original.width,
+                                                          original.height))
+        scale, best = too_big, None
+        for _ in range(MAX_ENCODES):
+            attempt = _encode(original, scale, image_format)
+            size = len(attempt.data)
+            logger.info("Encoded %dx%d image in %d bytes", attempt.width,
+                        attempt.height, size)
+            if size <= max_size:
+                best, fits = attempt, scale
+                if size >= max_size * TARGET_FILL or scale >= too_big:
+                    break
+            else:
+                too_big = scale
+
+            # Pixels, and so bytes, grow with the square of the scale
+            scale *= math.sqrt(max_size * TARGET_FILL / size)
+            if not fits < scale < too_big:
+                scale = (fits + too_big) / 2
+
+    if not best:
+        raise ValueError(f"Unable to reduce the image to under {max_size} bytes")
+    return best
+
+
+class ImageCache(SQLiteStore):
+    """An SQLite store of processed images keyed by a hash of the source image
+       content and the processing parameters"""
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS images (
+                     key TEXT PRIMARY KEY,
+                     data BLOB NOT NULL,
+                     width INTEGER NOT NULL,
+                     height INTEGER NOT NULL,
+                     created_at REAL NOT NULL)""",)
+
+    @staticmethod
+    def key(data, max_size):
+        """Return the cache key of the given source image content"""
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{digest}:{max_size}:{MAX_DIMENSION}:{JPEG_QUALITY}:{PROCESS_VERSION}"
+
+    def get(self, key):
+        """Return the cached ImageData of the given key, None if it isn't cached"""
+        with self._connect() as db:
+            row = db.execute("""SELECT data, width, height FROM images
+                                WHERE key = ?""", (key,)).fetchone()
+        return ImageData(*row) if row else None
+
+    def put(self, key, image):
+        """Cache the given ImageData"""
+        with self._connect() as db:
+            db.execute("""INSERT OR REPLACE INTO images
+                          (key, data, width, height, created_at)
+                          VALUES (?, ?, ?, ?, ?)""",
+                       (key, image.data, image.width, image.height, time.time()))
+
+
+def prepare(filename, cache=None, max_size=MAX_SIZE):
+    """Return the ImageData of the image file with the given filename, ready to
+       post, see downsize(). It's taken from the given ImageCache if the same
+       image has been prepared before."""
+    logger.info("Reading image file %s", filename)
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    key = ImageCache.key(data, max_size)
+    image = cache.get(key) if cache else None
+    if not image:
+        image = downsize(data, max_size)
+        if cache:
+            cache.put(key, image)
+    return image
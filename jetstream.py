@@ -0,0 +1,190 @@
+"""Stream notifications in real time from a Jetstream websocket
+
+Jetstream relays the commits of every repo on the network as JSON messages. The
+records that would notify a user, likes and reposts of their posts, follows of
+them, and replies to, quotes of and mentions of them, are picked out of the
+stream locally as they arrive, so there's no polling of listNotifications. The
+stream is resumed from the last message seen if the connection drops."""
+
+import contextlib
+import json
+import logging
+import urllib.parse
+from dataclasses import dataclass
+
+from lazyimport import lazy_import
+
+asyncio = lazy_import("asyncio")
+
+DEFAULT_URL = "wss://jetstream2.us-east.bsky.network/subscribe"
+
+POST = "app.bsky.feed.post"
+LIKE = "app.bsky.feed.like"
+REPOST = "app.bsky.feed.repost"
+FOLLOW = "app.bsky.graph.follow"
+COLLECTIONS = (POST, LIKE, REPOST, FOLLOW)
+
+# Notification reasons, as named by listNotifications
+REASONS = ("like", "repost", "follow", "reply", "quote", "mention")
+
+MENTION_FEATURE = "app.bsky.richtext.facet#mention"
+RECORD_EMBED = "app.bsky.embed.record"
+RECORD_WITH_MEDIA_EMBED = "app.bsky.embed.recordWithMedia"
+
+
+@dataclass
+class StreamNotification:
+    """A notification picked out of the stream. uri is the at-uri of the record
+       that caused it and subject_uri the at-uri of the user's post that it
+       refers to, if any. time_us is the stream cursor of its message."""
+    author_did: str
+    reason: str
+    uri: str
+    subject_uri: str
+    record: dict
+    time_us: int
+
+    @property
+    def created_at(self):
+        """The creation date of the record"""
+        return self.record.get("createdAt")
+
+    @property
+    def text(self):
+        """The text of a reply, quote or mention, None for other notifications"""
+        return self.record.get("text")
+
+
+def _is_users(uri, did):
+    """Return whether the given at-uri is of a record of the given user"""
+    return bool(uri) and uri.startswith(f"at://{did}/")
+
+
+def _quoted_uri(record):
+    """Return the at-uri of the record that the given post quotes, if any"""
+    embed = record.get("embed") or {}
+    if embed.get("$type") == RECORD_EMBED:
+        return embed.get("record", {}).get("uri")
+    if embed.get("$type") == RECORD_WITH_MEDIA_EMBED:
+        return embed.get("record", {}).get("record", {}).get("uri")
+    return None
+
+
+def _mentions(record, did):
+    """Return whether the given post mentions the given user"""
+    return any(feature.get("$type") == MENTION_FEATURE and feature.get("did") == did
+               for facet in record.get("facets") or []
+               for feature in facet.get("features") or [])
+
+
+def notification_reason(collection, record, did):
+    """Return the (reason, subject at-uri) of the notification the given new
+       record would give the given user, None if it wouldn't notify them"""
+    if collection in (LIKE, REPOST):
+        uri = (record.get("subject") or {}).get("uri")
+        if _is_users(uri, did):
+            return ("like" if collection == LIKE else "repost"), uri
+    elif collection == FOLLOW:
+        if record.get("subject") == did:
+            return "follow", None
+    elif collection == POST:
+        parent = ((record.get("reply") or {}).get("parent") or {}).get("uri")
+        if _is_users(parent, did):
+            return "reply", parent
+        quoted = _quoted_uri(record)
+        if _is_users(quoted, did):
+            return "quote", quoted
+        if _mentions(record, did):
+            return "mention", None
+    return None
+
+
+def to_notification(event, did):
+    """Return the StreamNotification of the given Jetstream message for the given
+       user, None if it doesn't notify them. Only newly created records notify,
+       and never the user's own."""
+    commit = event.get("commit")
+    if event.get("kind") != "commit" or not commit or \
+            commit.get("operation") != "create" or event.get("did") == did:
+        return None
+    record = commit.get("record") or {}
+    found = notification_reason(commit.get("collection"), record, did)
+    if not found:
+        return None
+    reason, subject_uri = found
+    return StreamNotification(
+            author_did=event["did"], reason=reason,
+            uri=f"at://{event['did']}/{commit['collection']}/{commit['rkey']}",
+            subject_uri=subject_uri, record=record, time_us=event.get("time_us"))
+
+
+class Jetstream:
+    """A Jetstream subscription to the given collections. cursor, a message's
+       time_us, replays the stream from that message. If the connection drops
+       it's reopened from the last message received, waiting reconnect_delay
+       seconds, doubling up to max_reconnect_delay while it keeps failing."""
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 60.0
+
+    def __init__(self, url=DEFAULT_URL, collections=COLLECTIONS, cursor=None,
+                 reconnect_delay=RECONNECT_DELAY,
+                 max_reconnect_delay=MAX_RECONNECT_DELAY):
+        self.url = url
+        self.collections = collections
+        self.cursor = cursor
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.logger = logging.getLogger(__name__)
+
+    def subscribe_url(self):
+        """Return the URL to subscribe to, resuming from the cursor if set"""
+        params = [("wantedCollections", collection)
+                  for collection in self.collections]
+        if self.cursor:
+            params.append(("cursor", self.cursor))
+        separator = "&" if "?" in self.url else "?"
+        return f"{self.url}{separator}{urllib.parse.urlencode(params)}"
+
+    async def events(self):
+        """An async generator to yield the decoded messages of the stream"""
+        # websockets is only loaded once a stream is watched
+        # pylint: disable=C0415 (import-outside-toplevel)
+        from websockets.asyncio.client import connect
+        from websockets.exceptions import WebSocketException
+
+        delay = self.reconnect_delay
+        # The time_us of the last message yielded. A resumed stream starts with
+        # that message again.
+        last = None
+        while True:
+            try:
+                async with connect(self.subscribe_url(),
+                                   max_size=None) as websocket:
+                    async for message in websocket:
+                        try:
+                            event = json.loads(message)
+                        except ValueError:
+                            self.logger.warning("Invalid message: %.80s", message)
+                            continue
+                        time_us = event.get("time_us")
+                        if last and time_us and time_us <= last:
+                            continue
+                        last = self.cursor = time_us or self.cursor
+                        delay = self.reconnect_delay
+                        yield event
+                self.logger.info("Stream closed by the server")
+            except (WebSocketException, OSError) as ex:
+                self.logger.warning("Stream failed: %s", ex)
+            self.logger.info("Reconnecting in %ss", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def notifications(self, did, reasons=None):
+        """An async generator to yield a StreamNotification for each message that
+           notifies the given user, optionally only for the given reasons"""
+        # Close the connection as soon as this generator is closed
+        async with contextlib.aclosing(self.events()) as events:
+            async for event in events:
+                notif = to_notification(event, did)
+                if notif and (not reasons or notif.reason in reasons):
+                    yield notif
@@ -0,0 +1,26 @@
+"""Import modules when they're first used rather than at startup
+
+atproto alone takes longer to import than a command like --help takes to run,
+and most commands never need wand (ImageMagick), websockets or the timezone
+and date parsing modules. lazy_import() returns a module whose code runs when
+one of its attributes is first used, see importlib.util.LazyLoader."""
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """Return the module of the given name, loaded when one of its attributes is
+       first used. It's returned as is if it's already imported. The parent
+       packages of a dotted name are imported straight away."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
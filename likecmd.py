@@ -4,6 +4,8 @@
 # pylint: disable=R0913 (too-many-arguments)
 # pylint: disable=R0917 (too-many-positional-arguments)
 
+import heapq
+
 from basecmd import BaseCmd
 
 
@@ -14,12 +16,13 @@ class LikeCmd(BaseCmd):
         """Print the like details of the given post"""
         likes = list(self.bs.get_post_likes(uri))
         if count:
-            print(f"Count: {len(likes)}")
+            self.print_summary(f"Count: {len(likes)}")
         if not no_details:
             for like in likes:
-                self.print_like_entry(like, full)
+                self.print_like_entry(like, full, post_uri=uri)
 
-    def gets(self, handle, date_limit_str, count_limit, post_filter, full):
+    def gets(self, handle, date_limit_str, count_limit, post_filter, full,
+             stored=False):
         """Print the like details of the posts found by the request details
            like: date_limit, count, reply vs. original post"""
         count = 0
@@ -28,39 +31,65 @@ class LikeCmd(BaseCmd):
         # there are a lot of posts without any likes.
 
         # TODO: Should the date_limit_str apply to the likes rather than the posts?
-        for post in self.bs.get_posts(handle,
-                                      date_limit_str=date_limit_str,
-                                      count_limit=None,
-                                      post_filter=post_filter):
-            if post.like_count:
-                count += 1
-                for like in self.bs.get_post_likes(post.uri):
-                    self.print_like_entry(like, full)
-                    if full:
-                        self.print_post_entry(post)
+        posts = self.async_bs.get_posts(handle,
+                                        date_limit_str=date_limit_str,
+                                        count_limit=None,
+                                        post_filter=post_filter,
+                                        stored=stored)
+
+        # The likes of several posts are retrieved concurrently but printed in
+        # post order
+        for post, likes in self.async_bs.iterate(
+                self.async_bs.get_posts_likes(self._liked_posts(posts))):
+            count += 1
+            for like in likes:
+                self.print_like_entry(like, full, post_uri=post.uri)
+                # Formatted likes refer to the post by its URI
+                if full and not self.formatter:
+                    self.print_post_entry(post)
 
             if count_limit and count >= count_limit:
                 break
 
-    def most(self, handle, date_limit_str, count_limit, post_filter, full):
-        """Print details of who most likes the posts found by the given parameters"""
-        likes = {}
-        for post in self.bs.get_posts(handle, date_limit_str,
-                                      count_limit=count_limit,
-                                      post_filter=post_filter):
-            for like in self.bs.get_post_likes(post.uri):
-                if like.actor.did in likes:
-                    count, profile = likes[like.actor.did]
-                    count += 1
-                    likes[like.actor.did] = count, profile
-                else:
-                    likes[like.actor.did] = 1, like.actor
+    @staticmethod
+    async def _liked_posts(posts):
+        """Async generator to filter the given async generator of posts to those
+           that have likes"""
+        async for post in posts:
+            if post.like_count:
+                yield post
+
+    def most(self, handle, date_limit_str, count_limit, post_filter, full,
+             top=None, stored=False):
+        """Print details of who most likes the posts found by the given parameters.
+           The likes of several posts are retrieved concurrently and counted as
+           they arrive. Optionally only print the top N users."""
+        counts = {}
+        profiles = {}
+        posts = self.async_bs.get_posts(handle, date_limit_str,
+                                        count_limit=count_limit,
+                                        post_filter=post_filter,
+                                        stored=stored)
+        for _, likes in self.async_bs.iterate(
+                self.async_bs.get_posts_likes(posts, ordered=False, lean=True)):
+            for like in likes:
+                did = like.actor.did
+                counts[did] = counts.get(did, 0) + 1
+                if did not in profiles:
+                    profiles[did] = like.actor
+
+        # nlargest() keeps a heap of only the top N entries
+        if top:
+            most_likes = heapq.nlargest(top, counts.items(), key=lambda v: v[1])
+        else:
+            most_likes = sorted(counts.items(), key=lambda v: v[1], reverse=True)
 
-        for value in sorted(likes.values(), key=lambda v: v[0], reverse=True):
-            if full:
-                count, profile = value
+        for did, count in most_likes:
+            profile = profiles[did]
+            if self.formatter:
+                self.formatter.write("like_count", profile, count=count)
+            elif full:
                 print(f"Like Count: {count}")
                 self.print_profile(profile, full=True)
             else:
-                count, profile = value
                 print(f"{count} {profile.handle} ({profile.display_name})")
@@ -3,6 +3,7 @@
 
 from basecmd import BaseCmd
 import dateparse
+from jetstream import Jetstream, DEFAULT_URL
 
 
 class MsgCmd(BaseCmd):
@@ -27,18 +28,58 @@ class MsgCmd(BaseCmd):
                 unread_count += 1
             notification_count += 1
 
-        print(f"{notification_count} notifications, "
-              f"{notification_count - unread_count} read, "
-              f"{unread_count} unread")
+        self.print_summary(f"{notification_count} notifications, "
+                           f"{notification_count - unread_count} read, "
+                           f"{unread_count} unread")
+
+    def watch(self, reasons, count_limit, cursor):
+        """Print notifications as they happen, optionally only those for the
+           given reasons, until count_limit notifications have been printed.
+           cursor replays the stream from an earlier message's time_us."""
+        did = self.bs.profile_did(self.bs.handle)
+        stream = Jetstream(self.config.get("jetstream", "url", fallback=DEFAULT_URL),
+                           cursor=cursor)
+        count = 0
+        for notif in self.async_bs.iterate(stream.notifications(did, reasons)):
+            self.print_stream_notification(notif)
+            count += 1
+            if count_limit and count >= count_limit:
+                break
+
+    def print_stream_notification(self, notif):
+        """Print details of the given StreamNotification as soon as it arrives"""
+        author = self.bs.get_profiles([notif.author_did])[notif.author_did]
+        if self.formatter:
+            self.formatter.write("stream_notification", notif,
+                                 author_handle=author.handle if author else None)
+            self.formatter.flush()
+            return
+        if author:
+            print(self.profile_name(author))
+            print(self.profile_link(author))
+        else:
+            print(f"Profile: {notif.author_did}")
+        print(f"Reason: {notif.reason}")
+        if notif.created_at:
+            print(f"Date: {dateparse.humanise_date_string(notif.created_at)}")
+        if notif.subject_uri:
+            print(f"Post Link: {self.bs.at_uri_to_http_url(notif.subject_uri)}")
+        if notif.text:
+            print(f"Text: {notif.text}")
+        print("-----", flush=True)
 
     def print_notification_entry(self, notif, post):
         """Print details of the given notification structure"""
+        if self.formatter:
+            self.formatter.write("notification", notif,
+                                 post_text=post.record.text if post else None)
+            return
         print(self.profile_name(notif.author))
         print(self.profile_link(notif.author))
         print(f"Reason: {notif.reason}")
         print(f"Date: {dateparse.humanise_date_string(notif.indexed_at)}")
         if post:
-            print(f"Post: {post.value.text}")
+            print(f"Post: {post.record.text}")
         if hasattr(notif.record, "text"):
             print(f"Reply: {notif.record.text}")
         print("-----")
@@ -0,0 +1,239 @@
+"""Machine readable command output: JSON lines, CSV and TSV
+
+Each record is written as soon as it's produced, through a large output buffer,
+so commands stream any number of records without holding them in memory. Only
+the fields requested with --fields, or the default fields of the kind of record,
+are extracted from each record."""
+
+import csv
+import io
+import json
+import sys
+
+import tid
+
+TEXT = "text"
+JSONL = "jsonl"
+CSV = "csv"
+TSV = "tsv"
+FORMATS = (TEXT, JSONL, CSV, TSV)
+BUFFER_SIZE = 1024 * 1024
+
+
+def _post_url(uri):
+    """Return the http address of the given post at-uri"""
+    _, _, did, _, rkey = uri.split("/")
+    return f"https://bsky.app/profile/{did}/post/{rkey}"
+
+
+def _profile_url(profile):
+    """Return the http address of the given profile"""
+    return f"https://bsky.app/profile/{profile.handle}"
+
+
+def _record_created_at(record):
+    """Return the creation date of the given repo record from its record key,
+       None if the record key isn't a TID"""
+    dt = tid.rkey_to_datetime(record.uri)
+    return dt.isoformat() if dt else None
+
+
+def _reply_root(post):
+    """Return the at-uri of the thread a post replies to, None if it isn't a
+       reply"""
+    reply = getattr(post, "reply", None)
+    return reply.root.uri if reply else None
+
+
+# The fields of each kind of record and how to extract them. Fields extracted by
+# None are only given by the command writing the record, and are only in the
+# default fields if it gives them.
+FIELDS = {
+    "profile": {
+        "handle": lambda p: p.handle,
+        "did": lambda p: p.did,
+        "display_name": lambda p: p.display_name,
+        "created_at": lambda p: p.created_at,
+        "description": lambda p: p.description,
+        "url": _profile_url},
+    "post": {
+        "uri": lambda p: p.uri,
+        "url": lambda p: _post_url(p.uri),
+        "author_handle": lambda p: p.author.handle,
+        "author_did": lambda p: p.author.did,
+        "author_display_name": lambda p: p.author.display_name,
+        "created_at": lambda p: p.record.created_at,
+        "repost_date": lambda p: getattr(p, "repost_date", None),
+        "reply_root_uri": _reply_root,
+        # A post record from post get only has the like count it's given
+        "like_count": lambda p: getattr(p, "like_count", None),
+        "repost_count": lambda p: getattr(p, "repost_count", None),
+        "reply_count": lambda p: getattr(p, "reply_count", None),
+        "text": lambda p: p.record.text,
+        "follows": None,
+        "follower": None},
+    "like": {
+        "handle": lambda lk: lk.actor.handle,
+        "did": lambda lk: lk.actor.did,
+        "display_name": lambda lk: lk.actor.display_name,
+        "created_at": lambda lk: lk.created_at,
+        "post_uri": None},
+    "liked_post": {
+        "author_handle": lambda lk: lk.post.author.handle,
+        "author_did": lambda lk: lk.post.author.did,
+        "post_uri": lambda lk: lk.post.uri,
+        "url": lambda lk: _post_url(lk.post.uri),
+        "like_date": lambda lk: lk.created_at,
+        "text": lambda lk: lk.post.record.text},
+    "notification": {
+        "author_handle": lambda n: n.author.handle,
+        "author_did": lambda n: n.author.did,
+        "reason": lambda n: n.reason,
+        "indexed_at": lambda n: n.indexed_at,
+        "is_read": lambda n: n.is_read,
+        "uri": lambda n: n.uri,
+        "reply_text": lambda n: getattr(n.record, "text", None),
+        "post_text": None},
+    "stream_notification": {
+        "author_did": lambda n: n.author_did,
+        "author_handle": None,
+        "reason": lambda n: n.reason,
+        "created_at": lambda n: n.created_at,
+        "uri": lambda n: n.uri,
+        "subject_uri": lambda n: n.subject_uri,
+        "text": lambda n: n.text,
+        "time_us": lambda n: n.time_us},
+    "reposter": {
+        "handle": lambda p: p.handle,
+        "did": lambda p: p.did,
+        "display_name": lambda p: p.display_name,
+        "count": None,
+        "post_uris": None},
+    "record": {
+        "uri": lambda r: r.uri,
+        "collection": lambda r: r.uri.split("/")[3],
+        "created_at": _record_created_at,
+        "dry_run": None},
+    "like_count": {
+        "handle": lambda p: p.handle,
+        "did": lambda p: p.did,
+        "display_name": lambda p: p.display_name,
+        "count": None}}
+
+
+def buffered_stdout(buffer_size=BUFFER_SIZE):
+    """Return a text stream that writes to stdout through a buffer of the given
+       size. Closing it flushes it but leaves stdout open."""
+    sys.stdout.flush()
+    raw = io.FileIO(sys.stdout.fileno(), "w", closefd=False)
+    return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size),
+                            encoding="utf-8", newline="")
+
+
+def create(output_format, fields=None, stream=None):
+    """Return the formatter of the given --format value, None for text which
+       commands print themselves. fields is the list of fields to output, the
+       default fields of each kind of record if None. Output goes to the given
+       text stream, or a buffered stdout."""
+    if output_format == TEXT:
+        return None
+    try:
+        cls = {JSONL: JsonlFormatter, CSV: CsvFormatter,
+               TSV: TsvFormatter}[output_format]
+    except KeyError:
+        raise ValueError(f"Invalid format: `{output_format}`. Expected one of "
+                         f"{', '.join(FORMATS)}.") from None
+    return cls(stream, fields)
+
+
+def parse_fields(value):
+    """Return the list of fields of a comma separated --fields value, None if
+       no value is given"""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
+class Formatter:
+    """Base class of the formatters. Records are written with write() and the
+       output is only complete once close() is called."""
+    def __init__(self, stream=None, fields=None):
+        self.fields = fields
+        self._own_stream = stream is None
+        self.stream = buffered_stdout() if stream is None else stream
+        self._kind = None
+        self._columns = None
+        self.names = None
+
+    def _start(self, kind, extra):
+        """Choose the columns of the given kind of record"""
+        available = FIELDS[kind]
+        if self.fields:
+            unknown = [field for field in self.fields if field not in available]
+            if unknown:
+                raise ValueError(f"Unknown {kind} field(s): {', '.join(unknown)}. "
+                                 f"Expected any of {', '.join(available)}.")
+            names = self.fields
+        else:
+            names = [name for name, get in available.items()
+                     if get or name in extra]
+        self._kind = kind
+        self._columns = [(name, available[name]) for name in names]
+        self.names = list(names)
+        self.header(self.names)
+
+    def write(self, kind, record, **extra):
+        """Write the given record of the given kind. extra gives the values of
+           fields that aren't taken from the record itself."""
+        if kind != self._kind:
+            self._start(kind, extra)
+        self.row([extra.get(name) if get is None else get(record)
+                  for name, get in self._columns])
+
+    def header(self, names):
+        """Start writing records with the given field names"""
+
+    def row(self, values):
+        """Write a record with the given field values"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Write out the buffered records"""
+        self.stream.flush()
+
+    def close(self):
+        """Flush the output"""
+        if self._own_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class JsonlFormatter(Formatter):
+    """Write each record as a JSON object on its own line"""
+    def row(self, values):
+        self.stream.write(json.dumps(dict(zip(self.names, values)),
+                                     ensure_ascii=False, default=str))
+        self.stream.write("\n")
+
+
+class CsvFormatter(Formatter):
+    """Write records as CSV rows. A header row of the field names starts the
+       records of each kind. Lists are separated by spaces and None is empty."""
+    DIALECT = csv.excel
+
+    def __init__(self, stream=None, fields=None):
+        super().__init__(stream, fields)
+        self.writer = csv.writer(self.stream, self.DIALECT, lineterminator="\n")
+
+    def header(self, names):
+        self.writer.writerow(names)
+
+    def row(self, values):
+        self.writer.writerow([" ".join(value) if isinstance(value, list) else value
+                              for value in values])
+
+
+class TsvFormatter(CsvFormatter):
+    """Write records as tab separated rows, otherwise as CsvFormatter"""
+    DIALECT = csv.excel_tab
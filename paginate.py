@@ -0,0 +1,107 @@
+"""Cursor pagination with background read-ahead
+
+The API returns lists a page at a time with a cursor for the next page. A
+Paginator yields the pages of a list. With a read_ahead depth it fetches the
+next pages on a background thread while the caller works on the current one, up
+to read_ahead pages ahead, so request latency overlaps the caller's work. The
+thread waits for the caller to take a page before fetching another once it's
+read_ahead pages ahead. Closing the Paginator, e.g. when the caller stops
+early, stops the thread once its current request completes. Read-ahead suits
+lists that are read to the end. Those that usually stop early at a date or
+count limit would fetch pages that aren't used, see BlueSky._paginator()."""
+
+import logging
+import queue
+import threading
+
+DEFAULT_READ_AHEAD = 2
+_DONE = object()
+
+
+class Paginator:
+    """Iterate over the pages of a list, returned by fetch(cursor) for each
+       cursor from the given one until a page has no cursor. The pages are
+       fetched read_ahead pages ahead on a background thread, if read_ahead is
+       set, otherwise as they're iterated. Use it as a context manager, or call
+       close(), to stop the read-ahead if the pages aren't all iterated. An
+       exception fetching a page is raised when that page is reached."""
+    def __init__(self, fetch, cursor=None, read_ahead=0, logger=None):
+        if read_ahead < 0:
+            raise ValueError(f"Invalid read-ahead: {read_ahead}")
+        self.fetch = fetch
+        self.cursor = cursor
+        self.read_ahead = read_ahead
+        self.logger = logger or logging.getLogger(__name__)
+        self._pages = None
+        self._slots = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        if not self.read_ahead:
+            return self._fetch_pages()
+        return self._read_ahead_pages()
+
+    def _fetch_pages(self):
+        """A generator to fetch and yield each page"""
+        cursor = self.cursor
+        while self._can_fetch():
+            rsp = self.fetch(cursor)
+            yield rsp
+            if not rsp.cursor:
+                return
+            self.logger.info("Cursor found, retrieving next page...")
+            cursor = rsp.cursor
+
+    def _can_fetch(self):
+        """Wait until the read-ahead, if any, is less than read_ahead pages ahead
+           of the caller. Return whether to fetch another page, not once closed."""
+        if self._slots:
+            self._slots.acquire()
+        return not self._stop.is_set()
+
+    def _read_ahead_pages(self):
+        """A generator to yield each page as the read-ahead thread fetches it"""
+        self._pages = queue.Queue()
+        # A slot for each page the thread can fetch ahead of the caller
+        self._slots = threading.Semaphore(self.read_ahead)
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True,
+                                        name="paginator")
+        self._thread.start()
+        try:
+            while True:
+                page = self._pages.get()
+                if page is _DONE:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                self._slots.release()
+                yield page
+        finally:
+            self.close()
+
+    def _read_ahead(self):
+        """Thread worker to put each page on the queue, then _DONE, or the
+           exception that ended it. Stop once close() is called."""
+        try:
+            for page in self._fetch_pages():
+                self._pages.put(page)
+        except Exception as ex:     # pylint: disable=broad-except
+            self._pages.put(ex)
+            return
+        self._pages.put(_DONE)
+
+    def close(self):
+        """Stop the read-ahead, waiting for a request in progress to complete"""
+        self._stop.set()
+        if self._thread:
+            # Wake the thread if it's waiting for a slot
+            self._slots.release()
+            self._thread.join()
+            self._thread = None
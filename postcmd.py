@@ -26,12 +26,15 @@ class PostCmd(BaseCmd):
 
         self.print_post_entry(post)
 
-    def gets(self, handle, date_limit_str, count_limit, post_filter):
+    def gets(self, handle, date_limit_str, count_limit, post_filter,
+             since_last=False):
         """Print the posts by the given user handle limited by the request details
-           like: date_limit, count, reply vs. original post"""
+           like: date_limit, count, reply vs. original post. since_last only
+           prints the posts that are new since the last since_last run."""
         for post in self.bs.get_posts(handle, date_limit_str,
                                       count_limit=count_limit,
-                                      post_filter=post_filter):
+                                      post_filter=post_filter,
+                                      since_last=since_last, lean=True):
             self.print_post_entry(post)
 
     def put(self, text, show_uri):
@@ -46,16 +49,16 @@ class PostCmd(BaseCmd):
         if show_uri:
             print(uri)
 
-    def puti(self, text, filename, alt, show_uri):
-        """Post the given image with the given text and given alt-text"""
-        uri = self.bs.post_image(text, filename, alt)
+    def puti(self, text, filenames, alts, show_uri):
+        """Post the given images with the given text and given alt-texts"""
+        uri = self.bs.post_images(text, filenames, alts)
         if show_uri:
             print(uri)
 
     def likes(self, uri, full):
         """Print the like details of the given post"""
         for like in self.bs.get_post_likes(uri):
-            self.print_like_entry(like, full)
+            self.print_like_entry(like, full, post_uri=uri)
 
     def delete(self, uri):
         """Delete the post at the given uri"""
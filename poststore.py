@@ -0,0 +1,122 @@
+"""An on-disk store of author feeds that is kept up to date incrementally"""
+
+import time
+from dataclasses import dataclass
+
+from sqlitestore import SQLiteStore
+
+
+@dataclass
+class SyncState:
+    """The checkpoint of a user's stored feed. newest_at is the date (epoch
+       seconds) of the newest feed entry stored and newest_uri its post URI.
+       since_at is how far back the feed is stored, None if it's stored back to
+       the first post."""
+    newest_uri: str
+    newest_at: float
+    since_at: float
+    synced_at: float
+
+    def covers(self, since_at):
+        """Return whether the feed is stored back to the given date, None being
+           the first post"""
+        return self.since_at is None or \
+            (since_at is not None and since_at >= self.since_at)
+
+
+class PostStore(SQLiteStore):
+    """An SQLite store of the JSON feed views of users' author feeds keyed by DID,
+       and the sync state of each feed. refresh (seconds) is how far before the
+       checkpoint each sync fetches again to update the like, repost and reply
+       counts of recent posts. See BlueSky.sync_posts() for the sync.
+
+       Each mode of reading the store that only returns new posts, e.g.
+       SINCE_LAST, keeps its own checkpoint of the newest entry it returned, so
+       that syncing for another mode doesn't move it."""
+    DEFAULT_REFRESH = 0
+    SINCE_LAST = "since_last"
+    # Rows read from the store at a time
+    FETCH_SIZE = 500
+    # key distinguishes a post from reposts of it in the same feed
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS feed (
+                     did TEXT NOT NULL,
+                     key TEXT NOT NULL,
+                     sort_at REAL NOT NULL,
+                     view TEXT NOT NULL,
+                     PRIMARY KEY (did, key))""",
+              """CREATE INDEX IF NOT EXISTS feed_sort
+                     ON feed (did, sort_at)""",
+              """CREATE TABLE IF NOT EXISTS sync_state (
+                     did TEXT PRIMARY KEY,
+                     newest_uri TEXT,
+                     newest_at REAL,
+                     since_at REAL,
+                     synced_at REAL NOT NULL)""",
+              """CREATE TABLE IF NOT EXISTS checkpoints (
+                     did TEXT NOT NULL,
+                     mode TEXT NOT NULL,
+                     newest_at REAL NOT NULL,
+                     PRIMARY KEY (did, mode))""")
+
+    def __init__(self, path, refresh=DEFAULT_REFRESH):
+        self.refresh = refresh
+        super().__init__(path)
+
+    def get_state(self, did):
+        """Return the SyncState of the given user's feed, None if it has never
+           been synced"""
+        with self._connect() as db:
+            row = db.execute("""SELECT newest_uri, newest_at, since_at, synced_at
+                                FROM sync_state WHERE did = ?""",
+                             (did,)).fetchone()
+        return SyncState(*row) if row else None
+
+    def put_views(self, did, rows):
+        """Store the given (key, sort_at, JSON view) rows of the given user's feed,
+           replacing those with the same key"""
+        with self._connect() as db:
+            db.executemany("""INSERT OR REPLACE INTO feed (did, key, sort_at, view)
+                              VALUES (?, ?, ?, ?)""",
+                           ((did, key, sort_at, view) for key, sort_at, view in rows))
+
+    def set_state(self, did, newest_uri, newest_at, since_at):
+        """Record a completed sync of the given user's feed"""
+        with self._connect() as db:
+            db.execute("""INSERT OR REPLACE INTO sync_state
+                          (did, newest_uri, newest_at, since_at, synced_at)
+                          VALUES (?, ?, ?, ?, ?)""",
+                       (did, newest_uri, newest_at, since_at, time.time()))
+
+    def get_checkpoint(self, did, mode):
+        """Return the date (epoch seconds) of the newest entry of the given user's
+           feed returned by the given mode, None if it hasn't returned any"""
+        with self._connect() as db:
+            row = db.execute("""SELECT newest_at FROM checkpoints
+                                WHERE did = ? AND mode = ?""", (did, mode)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, did, mode, newest_at):
+        """Record the date (epoch seconds) of the newest entry of the given user's
+           feed returned by the given mode"""
+        with self._connect() as db:
+            db.execute("""INSERT OR REPLACE INTO checkpoints (did, mode, newest_at)
+                          VALUES (?, ?, ?)""", (did, mode, newest_at))
+
+    def views(self, did, not_before=None, newer_than=None):
+        """A generator to yield the stored JSON views of the given user's feed,
+           newest first, optionally only those dated not_before or later and/or
+           later than newer_than (epoch seconds). Rows are read FETCH_SIZE at a
+           time."""
+        query = "SELECT view FROM feed WHERE did = ?"
+        params = [did]
+        if not_before is not None:
+            query += " AND sort_at >= ?"
+            params.append(not_before)
+        if newer_than is not None:
+            query += " AND sort_at > ?"
+            params.append(newer_than)
+        with self._connect() as db:
+            cursor = db.execute(query + " ORDER BY sort_at DESC", params)
+            while rows := cursor.fetchmany(self.FETCH_SIZE):
+                for (view,) in rows:
+                    yield view
@@ -0,0 +1,76 @@
+"""In-process and on-disk caches of BlueSky user profiles"""
+
+import collections
+import threading
+import time
+
+from sqlitestore import SQLiteStore
+
+
+class LRUCache:
+    """A thread safe, size limited, least recently used cache"""
+    DEFAULT_SIZE = 1024
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for the given key or None"""
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            except KeyError:
+                return None
+
+    def put(self, key, value):
+        """Cache the given value, discarding the least recently used entry if
+           the cache is full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ProfileStore(SQLiteStore):
+    """An SQLite store of JSON profiles looked up by DID or handle. Profiles
+       older than the TTL (seconds) are ignored. See BlueSky for the conversion
+       to and from profile models."""
+    DEFAULT_TTL = 86400
+    SCHEMA = ("""CREATE TABLE IF NOT EXISTS profiles (
+                     did TEXT PRIMARY KEY,
+                     handle TEXT NOT NULL,
+                     profile TEXT NOT NULL,
+                     fetched_at REAL NOT NULL)""",
+              """CREATE INDEX IF NOT EXISTS profiles_handle
+                     ON profiles (handle)""")
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        super().__init__(path)
+
+    def get(self, actor):
+        """Return the JSON profile of the given DID or handle if it's stored and
+           within the TTL, otherwise None"""
+        with self._connect() as db:
+            row = db.execute("""SELECT profile FROM profiles
+                                WHERE (did = ? OR handle = ?) AND fetched_at > ?
+                                ORDER BY fetched_at DESC""",
+                             (actor, actor, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, rows):
+        """Store the given (did, handle, JSON profile) rows"""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany("""INSERT OR REPLACE INTO profiles
+                              (did, handle, profile, fetched_at)
+                              VALUES (?, ?, ?, ?)""",
+                           ((did, handle, profile, now)
+                            for did, handle, profile in rows))
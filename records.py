@@ -0,0 +1,145 @@
+"""Compact records of profiles, posts and likes for large result sets
+
+The atproto models are pydantic objects that hold every field of a response and
+take several times the memory of the few fields the commands print. These
+__slots__ records hold only those fields, with no per instance __dict__. They
+have the same attribute names as the models so they print and format the same
+way. The generators return them in their lean=True mode, see
+BlueSky.get_mutuals() and benchmark.py --footprint for their size. They're
+created from the models with their from_*() class methods, or with their
+fields as keyword arguments."""
+
+
+class _Record:
+    """Base class of the records. The fields are the __slots__ of each record
+       class, given to the constructor as keyword arguments, None if they're
+       not given."""
+    __slots__ = ()
+
+    def _check_fields(self, fields):
+        """Raise TypeError if fields has any that the record doesn't"""
+        unknown = fields.keys() - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"Unknown {type(self).__name__} fields: "
+                            f"{', '.join(sorted(unknown))}")
+
+    def values(self):
+        """Return the list of the record's field values, in __slots__ order"""
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_values(cls, values):
+        """Return the record of the given field values, see values()"""
+        return cls(**dict(zip(cls.__slots__, values)))
+
+
+class ProfileLite(_Record):
+    """The fields of a profile that the commands print"""
+    __slots__ = ("did", "handle", "display_name", "created_at", "description")
+
+    def __init__(self, **fields):
+        self._check_fields(fields)
+        self.did = fields.get("did")
+        self.handle = fields.get("handle")
+        self.display_name = fields.get("display_name")
+        self.created_at = fields.get("created_at")
+        self.description = fields.get("description")
+
+    def __repr__(self):
+        return f"ProfileLite(did={self.did!r}, handle={self.handle!r})"
+
+    @classmethod
+    def from_profile(cls, profile):
+        """Return the ProfileLite of the given profile model, which may be a
+           basic profile view without some of the fields"""
+        if isinstance(profile, cls):
+            return profile
+        return cls(did=profile.did, handle=profile.handle,
+                   display_name=getattr(profile, "display_name", None),
+                   created_at=getattr(profile, "created_at", None),
+                   description=getattr(profile, "description", None))
+
+
+class _ReplyRoot(_Record):
+    """The root of the thread a PostLite replies to, as reply.root.uri"""
+    __slots__ = ("uri",)
+
+    def __init__(self, **fields):
+        self._check_fields(fields)
+        self.uri = fields.get("uri")
+
+    @property
+    def root(self):
+        """The reply's thread root"""
+        return self
+
+
+class PostLite(_Record):   # pylint: disable=R0902 (too-many-instance-attributes)
+    """The fields of a post that the commands print. The record fields
+       (created_at and text) are also available as post.record.* and the reply
+       thread root as post.reply.root.uri, like the post view model."""
+    __slots__ = ("uri", "author", "created_at", "text", "like_count",
+                 "repost_count", "reply_count", "reply_root_uri", "repost_date")
+
+    def __init__(self, **fields):
+        self._check_fields(fields)
+        self.uri = fields.get("uri")
+        self.author = fields.get("author")
+        self.created_at = fields.get("created_at")
+        self.text = fields.get("text")
+        self.like_count = fields.get("like_count")
+        self.repost_count = fields.get("repost_count")
+        self.reply_count = fields.get("reply_count")
+        self.reply_root_uri = fields.get("reply_root_uri")
+        self.repost_date = fields.get("repost_date")
+
+    def __repr__(self):
+        return f"PostLite(uri={self.uri!r})"
+
+    @property
+    def record(self):
+        """The post's record fields"""
+        return self
+
+    @property
+    def reply(self):
+        """The post's reply details, None if it isn't a reply"""
+        return _ReplyRoot(uri=self.reply_root_uri) if self.reply_root_uri \
+            else None
+
+    @classmethod
+    def from_post(cls, post):
+        """Return the PostLite of the given post view model, see
+           BlueSky.get_posts()"""
+        if isinstance(post, cls):
+            return post
+        reply = getattr(post, "reply", None)
+        return cls(uri=post.uri, author=ProfileLite.from_profile(post.author),
+                   created_at=post.record.created_at, text=post.record.text,
+                   like_count=getattr(post, "like_count", None),
+                   repost_count=getattr(post, "repost_count", None),
+                   reply_count=getattr(post, "reply_count", None),
+                   reply_root_uri=reply.root.uri if reply else None,
+                   repost_date=getattr(post, "repost_date", None))
+
+
+class LikeLite(_Record):
+    """The fields of a like of a post that the commands print"""
+    __slots__ = ("actor", "created_at")
+
+    def __init__(self, **fields):
+        self._check_fields(fields)
+        self.actor = fields.get("actor")
+        self.created_at = fields.get("created_at")
+
+    def __repr__(self):
+        return f"LikeLite(actor={self.actor!r}, created_at={self.created_at!r})"
+
+    @classmethod
+    def from_like(cls, like):
+        """Return the LikeLite of the given like model, see
+           BlueSky.get_post_likes()"""
+        if isinstance(like, cls):
+            return like
+        return cls(actor=ProfileLite.from_profile(like.actor),
+                   created_at=like.created_at)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""BlueSky command line interface: Repo command class"""
+
+# pylint: disable=R0913 (too-many-arguments)
+# pylint: disable=R0917 (too-many-positional-arguments)
+
+import cleanup
+from basecmd import BaseCmd
+import tid
+
+
+class RepoCmd(BaseCmd):
+    """BlueSky command line interface: Repo command class"""
+
+    def cleanup(self, criteria, dry_run, batch_size):
+        """Delete the authenticated user's records selected by the given
+           cleanup.Criteria, printing each one. A dry run only prints the records
+           that would be deleted. The [cleanup] config section sets the batch
+           size and the writes_per_hour pacing."""
+        if batch_size is None:
+            batch_size = self.config.getint("cleanup", "batch_size",
+                                            fallback=cleanup.DEFAULT_BATCH_SIZE)
+        pacer = cleanup.Pacer(self.config.getint(
+                "cleanup", "writes_per_hour",
+                fallback=cleanup.DEFAULT_WRITES_PER_HOUR))
+        count = 0
+        for record in self.bs.cleanup(criteria, dry_run=dry_run,
+                                      batch_size=batch_size, pacer=pacer):
+            count += 1
+            self.print_record(record, dry_run)
+        self.print_summary(f"{'Would delete' if dry_run else 'Deleted'}: "
+                           f"{count} {criteria.collection}")
+
+    def print_record(self, record, dry_run=False):
+        """Print the at-uri and creation date of the given deleted record"""
+        if self.formatter:
+            self.formatter.write("record", record, dry_run=dry_run)
+            return
+        created_at = tid.rkey_to_datetime(record.uri)
+        print(f"{'Would delete' if dry_run else 'Deleted'}: {record.uri} "
+              f"({created_at.isoformat() if created_at else 'unknown date'})")
@@ -0,0 +1,215 @@
+"""Retry failed BlueSky API requests with exponential backoff, per error class
+   policies, rate limit awareness and a circuit breaker shared by all requests"""
+
+import functools
+import logging
+import random
+import threading
+import time
+
+import atproto_core.exceptions
+
+from lazyimport import lazy_import
+
+asyncio = lazy_import("asyncio")
+atproto_client = lazy_import("atproto_client")
+
+# pylint: disable=R0913,R0917
+
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_MAX_RATE_LIMIT_WAIT = 300.0
+DEFAULT_BREAKER_THRESHOLD = 30
+DEFAULT_BREAKER_COOLDOWN = 60.0
+
+
+class CircuitOpenError(IOError):
+    """Raised instead of making a request while the circuit breaker is open"""
+
+
+class RetryPolicy:
+    """How to retry an error: the maximum number of attempts and the range of
+       the exponential backoff between them. Each delay is chosen at random
+       between 0 and base_delay * 2^attempt, capped at max_delay ("full jitter"),
+       so that concurrent clients don't retry in lock step."""
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Return the delay before the retry following the given (0 based)
+           failed attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    """Count consecutive failures across all requests. After threshold failures
+       the circuit opens and requests fail immediately for cooldown seconds.
+       After that a single trial request is allowed, its success closes the
+       circuit again, its failure re-opens it."""
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD,
+                 cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise CircuitOpenError if requests aren't currently allowed"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError(f"Giving up, {self.failures} consecutive "
+                                       f"failures, not retrying for "
+                                       f"{self.cooldown}s")
+            # Half open: allow a trial request, re-open if it fails
+            self.opened_at = None
+            self.failures = self.threshold - 1
+
+    def success(self):
+        """Record a successful request"""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        """Record a failed request"""
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class Retrier:
+    """Call BlueSky API methods, retrying atproto errors according to the policy
+       for the error's class. The first matching class in policies is used, so
+       more specific classes come first. Rate limited (429) requests wait until
+       the ratelimit-reset time given by the server if there is one."""
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 max_rate_limit_wait=DEFAULT_MAX_RATE_LIMIT_WAIT,
+                 breaker=None, policies=None, on_error=None):
+        default = RetryPolicy(max_attempts, base_delay, max_delay)
+        self.policies = policies or [
+            # Requests that fail like this won't succeed if they're repeated
+            (atproto_client.exceptions.BadRequestError, NO_RETRY),
+            (atproto_client.exceptions.UnauthorizedError, NO_RETRY),
+            (atproto_client.exceptions.ModelError, NO_RETRY),
+            (atproto_core.exceptions.AtProtocolError, default)]
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.breaker = breaker or CircuitBreaker()
+        self.on_error = on_error
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Create a Retrier from the [retry] section of the given config"""
+        def get(name, default):
+            return config.getfloat("retry", name, fallback=default)
+
+        return cls(max_attempts=config.getint("retry", "max_attempts",
+                                              fallback=DEFAULT_MAX_ATTEMPTS),
+                   base_delay=get("base_delay", DEFAULT_BASE_DELAY),
+                   max_delay=get("max_delay", DEFAULT_MAX_DELAY),
+                   max_rate_limit_wait=get("max_rate_limit_wait",
+                                           DEFAULT_MAX_RATE_LIMIT_WAIT),
+                   breaker=CircuitBreaker(
+                       config.getint("retry", "breaker_threshold",
+                                     fallback=DEFAULT_BREAKER_THRESHOLD),
+                       get("breaker_cooldown", DEFAULT_BREAKER_COOLDOWN)),
+                   **kwargs)
+
+    def policy(self, ex):
+        """Return the retry policy for the given exception"""
+        for cls, policy in self.policies:
+            if isinstance(ex, cls):
+                return policy
+        return NO_RETRY
+
+    def _failed(self, ex, attempt):
+        """Handle the given failure of the given (0 based) attempt. Re-raise the
+           exception if it isn't retried, raise IOError if there have been too
+           many failures, otherwise return the delay before the next attempt.
+           Errors that aren't retried, like a record that isn't found, are left
+           to the caller and don't count towards the circuit breaker."""
+        policy = self.policy(ex)
+        if policy.max_attempts <= 1:
+            raise ex
+
+        self.breaker.failure()
+        if self.on_error:
+            self.on_error(ex)
+        if attempt + 1 >= policy.max_attempts:
+            raise IOError(f"Giving up, more than {policy.max_attempts} "
+                          f"failures") from ex
+
+        delay = self.rate_limit_delay(ex)
+        if delay is None:
+            delay = policy.delay(attempt)
+        else:
+            self.logger.info("Rate limited, waiting %.1fs", delay)
+        return delay
+
+    def rate_limit_delay(self, ex):
+        """Return how long to wait before retrying a rate limited request, None
+           if the exception isn't a rate limit with a reset time"""
+        response = getattr(ex, "response", None)
+        if getattr(response, "status_code", None) != 429:
+            return None
+
+        headers = getattr(response, "headers", None) or {}
+        try:
+            if "ratelimit-reset" in headers:
+                delay = float(headers["ratelimit-reset"]) - time.time()
+            elif "retry-after" in headers:
+                delay = float(headers["retry-after"])
+            else:
+                return None
+        except (TypeError, ValueError):
+            return None
+        return min(max(delay, 0.0), self.max_rate_limit_wait)
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) retrying failures, return its result"""
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                result = fn(*args, **kwargs)
+            except atproto_core.exceptions.AtProtocolError as ex:
+                time.sleep(self._failed(ex, attempt))
+                attempt += 1
+                continue
+            self.breaker.success()
+            return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) retrying failures, return its result"""
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                result = await fn(*args, **kwargs)
+            except atproto_core.exceptions.AtProtocolError as ex:
+                await asyncio.sleep(self._failed(ex, attempt))
+                attempt += 1
+                continue
+            self.breaker.success()
+            return result
+
+
+def retried(method):
+    """Decorator for BlueSky methods that make a single API request, to retry the
+       whole method with the instance's Retrier"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.retrier.call(method, self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,53 @@
+"""Persist the authenticated BlueSky session between command line invocations"""
+
+import fcntl
+import os
+
+
+class SessionFile:
+    """Store an exported atproto session string (handle, DID, access/refresh JWTs
+       and PDS endpoint) in a file that only the current user can read. Reads and
+       writes hold an advisory lock so that concurrent invocations, e.g. from
+       cron, never see a partially written session."""
+    MODE = 0o600
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Return the saved session string or None if there isn't one"""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+        with os.fdopen(fd, "r", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return f.read().strip() or None
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self, session_string):
+        """Save the given session string, replacing any previous session"""
+        # Don't use O_TRUNC, truncate only once we hold the lock so a reader
+        # can't see an empty file
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, self.MODE)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # Tighten the permissions of a file that already existed
+                os.fchmod(f.fileno(), self.MODE)
+                f.truncate(0)
+                f.write(session_string)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def clear(self):
+        """Remove the saved session"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
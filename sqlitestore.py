@@ -0,0 +1,30 @@
+"""Base class of the local SQLite caches and stores"""
+
+import contextlib
+import sqlite3
+
+
+class SQLiteStore:
+    """An SQLite database at the given path with the tables and indexes of the
+       SCHEMA statements, created if they don't exist. Each method opens its own
+       connection, see _connect(), so that a store can be shared by several
+       threads. The database is in WAL mode so readers don't block the writer."""
+    SCHEMA = ()
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                db.execute(statement)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Context manager for a connection that commits on success and is
+           always closed"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
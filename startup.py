@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""Startup time benchmark of bs.py based on python -X importtime
+
+Runs a bs.py command line, --help by default, in a new interpreter with
+-X importtime and reports the time taken to import the modules that bs.py
+imports, leaving out the modules the interpreter imports for itself, and the
+slowest of them. The fastest of several runs is used, after a first run that
+compiles the modules' bytecode. It exits with status 1 if the import time is
+over the budget, or if any of the modules that are only imported when a command
+needs them (DEFERRED) were imported, e.g.
+
+    ./startup.py
+    ./startup.py --budget 80 -- post gets --help"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+
+DEFAULT_BUDGET_MS = 100
+DEFAULT_REPEAT = 5
+# Modules that no command needs until it makes a request, prepares an image,
+# parses a date, streams or records. A module loaded by lazyimport.lazy_import()
+# has no importtime line of its own, only the modules it imports do.
+DEFERRED = ("atproto", "atproto_client", "httpx", "wand.api", "dateutil.parser",
+            "dateutil.tz", "tzlocal", "websockets", "asyncio", "cassette",
+            "async_bluesky")
+BS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bs.py")
+# import time: self [us] | cumulative | imported package
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class Import:
+    """A module imported at startup, its import time excluding and including
+       the modules it imports (microseconds) and its nesting depth"""
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output):
+    """Return the list of Imports in the given -X importtime output, in the
+       order they were imported. Other lines are ignored."""
+    imports = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append(Import(name, int(self_us), int(cumulative_us),
+                                  (len(indent) - 1) // 2))
+    return imports
+
+
+def run_importtime(args):
+    """Run python -X importtime with the given arguments and return its Imports.
+       Raise RuntimeError if it fails."""
+    env = dict(os.environ)
+    # Time the imports as a user would see them, from compiled bytecode
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run([sys.executable, "-X", "importtime", *args],
+                            capture_output=True, text=True, env=env, check=False)
+    if result.returncode:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr}")
+    return parse_importtime(result.stderr)
+
+
+def startup_imports(imports, baseline):
+    """Return the top level Imports that aren't in the baseline Imports of an
+       interpreter that runs nothing"""
+    ignored = {i.name for i in baseline}
+    return [i for i in imports if i.depth == 0 and i.name not in ignored]
+
+
+def measure(args, repeat=DEFAULT_REPEAT):
+    """Return the total import time (microseconds) of the fastest of repeat runs
+       of the given python arguments, and the Imports of that run"""
+    run_importtime(args)
+    baseline = run_importtime(["-c", "pass"])
+    runs = []
+    for _ in range(repeat):
+        imports = run_importtime(args)
+        runs.append((sum(i.cumulative_us
+                         for i in startup_imports(imports, baseline)), imports))
+    return min(runs, key=lambda run: run[0])
+
+
+def deferred_imports(imports):
+    """Return the DEFERRED modules that are, or have submodules, among the
+       given Imports"""
+    names = {i.name for i in imports}
+    return [name for name in DEFERRED
+            if any(n == name or n.startswith(f"{name}.") for n in names)]
+
+
+def main(argv=None):
+    """Measure and report the startup import time of a bs.py command, return
+       the exit status"""
+    parser = argparse.ArgumentParser(
+            description="Measure the time bs.py takes to import its modules")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"Allowed import time in milliseconds [default: "
+                             f"{DEFAULT_BUDGET_MS}]")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Runs to take the fastest of [default: "
+                             f"{DEFAULT_REPEAT}]")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of the slowest modules to show")
+    parser.add_argument("bs_args", nargs="*", default=["--help"],
+                        help="bs.py arguments [default: --help]")
+    ns = parser.parse_args(argv)
+
+    total, imports = measure([BS_PATH, *ns.bs_args], ns.repeat)
+    print(f"bs.py {' '.join(ns.bs_args)}: {total / 1000:.1f}ms of imports "
+          f"(budget {ns.budget:g}ms)")
+    print("Slowest modules (self time):")
+    for i in sorted(imports, key=lambda i: i.self_us, reverse=True)[:ns.top]:
+        print(f"  {i.self_us / 1000:8.1f}ms  {i.name}")
+
+    failed = False
+    deferred = deferred_imports(imports)
+    if deferred:
+        print(f"Imported at startup: {', '.join(deferred)}")
+        failed = True
+    if total / 1000 > ns.budget:
+        print("Over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@
 from unittest.mock import patch
 import pytest
 from bluesky import BlueSky
+from retry import Retrier
 
 # pylint: disable=W0201 (attribute-defined-outside-init)
 # pylint: disable=R0903 (too-few-public-methods)
@@ -18,8 +19,10 @@ class BaseTest:
             mock_client_instance = mock_client.return_value
             # Mock the login method
             mock_client_instance.login.return_value = None
+            # Retry without waiting between attempts
             self.instance = BlueSky(handle='@testuser.bsky.social',
-                                    password='testpassword')
+                                    password='testpassword',
+                                    retrier=Retrier(base_delay=0))
 
             # Mock its atproto client
             self.instance._client = mock_client
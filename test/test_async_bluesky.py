@@ -0,0 +1,202 @@
+'''AsyncBlueSky tests'''
+
+import asyncio
+from unittest.mock import MagicMock
+
+import atproto_core
+import pytest
+
+from async_bluesky import AsyncBlueSky
+from base_test import BaseTest
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=W0212 (protected-access)
+
+
+class TestAsyncBlueSky(BaseTest):
+    '''Test the AsyncBlueSky class with a mocked async client'''
+    @pytest.fixture(autouse=True)
+    def setup_async(self, setup):
+        '''Create an AsyncBlueSky instance with a mocked async client'''
+        self.async_instance = AsyncBlueSky(self.instance, max_concurrency=3)
+        self.async_instance._client = MagicMock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        yield
+        self.async_instance.close()
+
+    async def track(self, value):
+        '''Count the number of concurrent requests while returning value'''
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        return value
+
+    @staticmethod
+    def page(attr, items, cursor=None):
+        '''Create a mock page of results'''
+        rsp = MagicMock()
+        setattr(rsp, attr, items)
+        rsp.cursor = cursor
+        return rsp
+
+    def test_follows_pages(self):
+        '''Test follows() follows the cursor across pages'''
+        pages = {None: self.page('follows', [1, 2], 'a'),
+                 'a': self.page('follows', [3], 'b'),
+                 'b': self.page('follows', [4, 5])}
+        self.async_instance._client.get_follows = \
+            lambda handle, cursor=None: self.track(pages[cursor])
+
+        result = list(self.async_instance.iterate(
+            self.async_instance.follows('testuser')))
+        assert result == [1, 2, 3, 4, 5]
+
+    def test_get_posts_likes_order_and_concurrency(self):
+        '''Test the likes of posts are retrieved concurrently, bounded by
+           max_concurrency, and yielded in post order'''
+        def get_likes(uri, cursor=None):
+            return self.track(self.page('likes', [f"{uri}-like"]))
+        self.async_instance._client.get_likes = get_likes
+
+        async def posts():
+            for i in range(20):
+                post = MagicMock()
+                post.uri = f"post{i}"
+                yield post
+
+        result = list(self.async_instance.iterate(
+            self.async_instance.get_posts_likes(posts())))
+        assert [post.uri for post, _ in result] == [f"post{i}" for i in range(20)]
+        assert [likes for _, likes in result] == [[f"post{i}-like"]
+                                                  for i in range(20)]
+        assert 1 < self.max_in_flight <= 3
+
+    def test_get_posts_likes_unordered(self):
+        '''Test unordered results are yielded as each post's likes complete'''
+        async def get_likes(uri, cursor=None):
+            # Make the earlier posts slowest
+            await asyncio.sleep(0.001 * (10 - int(uri[4:])))
+            return self.page('likes', [f"{uri}-like"])
+        self.async_instance._client.get_likes = get_likes
+
+        async def posts():
+            for i in range(10):
+                post = MagicMock()
+                post.uri = f"post{i}"
+                yield post
+
+        result = list(self.async_instance.iterate(
+            self.async_instance.get_posts_likes(posts(), ordered=False)))
+        uris = [post.uri for post, _ in result]
+        assert sorted(uris) == sorted(f"post{i}" for i in range(10))
+        assert uris != [f"post{i}" for i in range(10)]
+
+    def test_call_exception_limit(self):
+        '''Test requests are retried up to the failure limit'''
+        calls = []
+
+        async def get_follows(handle, cursor=None):
+            calls.append(handle)
+            raise atproto_core.exceptions.AtProtocolError('Mocked Exception')
+        self.async_instance._client.get_follows = get_follows
+
+        with pytest.raises(IOError):
+            list(self.async_instance.iterate(self.async_instance.follows('testuser')))
+        assert len(calls) == self.instance.FAILURE_LIMIT
+
+    def test_get_notifications(self):
+        '''Test notification posts are retrieved in a batch and yielded in order'''
+        notifs = []
+        for i in range(10):
+            notif = MagicMock()
+            notif.reason = 'like'
+            notif.reason_subject = f"at://did:plc:example/app.bsky.feed.post/{i}"
+            notif.is_read = False
+            notifs.append(notif)
+
+        self.async_instance._client.app.bsky.notification.list_notifications = \
+            lambda params: self.track(self.page('notifications', notifs))
+        self.async_instance._client.app.bsky.feed.get_posts = \
+            lambda params: self.track(self.page(
+                'posts', [MagicMock(uri=uri) for uri in params['uris']]))
+
+        result = list(self.async_instance.iterate(
+            self.async_instance.get_notifications()))
+        assert [post.uri for _, post in result] == [n.reason_subject for n in notifs]
+        assert [notif for notif, _ in result] == notifs
+
+    def test_get_notifications_mark_read_retried(self):
+        '''Test marking notifications as read is retried after a transient
+           failure'''
+        calls = []
+
+        async def update_seen(data):
+            calls.append(data)
+            if len(calls) == 1:
+                raise atproto_core.exceptions.AtProtocolError('Mocked Exception')
+
+        client = self.async_instance._client
+        client.app.bsky.notification.list_notifications = \
+            lambda params: self.track(self.page('notifications', []))
+        client.app.bsky.notification.update_seen = update_seen
+        client.get_current_time_iso.return_value = '2024-11-01T12:00:00Z'
+
+        assert not list(self.async_instance.iterate(
+            self.async_instance.get_notifications(mark_read=True)))
+        assert calls == [{'seen_at': '2024-11-01T12:00:00Z'}] * 2
+
+    def test_close(self):
+        '''Test closing closes the async client's connections and the loop'''
+        closed = []
+
+        async def close():
+            closed.append(True)
+        self.async_instance._request = MagicMock(close=close)
+
+        self.async_instance.close()
+        assert closed == [True]
+        assert self.async_instance.loop.is_closed()
+
+    def test_iterate_stop_early(self):
+        '''Test the async generator is closed when the caller stops early'''
+        closed = []
+
+        async def numbers():
+            try:
+                for i in range(10):
+                    yield i
+            finally:
+                closed.append(True)
+
+        gen = self.async_instance.iterate(numbers())
+        assert next(gen) == 0
+        assert not closed
+        gen.close()
+        assert closed == [True]
+
+    def test_get_posts_count_limit(self):
+        '''Test posts are selected by type across pages up to the count limit'''
+        handle = self.instance.normalize_handle_value('testuser')
+
+        def view(i, reply):
+            return MagicMock(reply=MagicMock() if reply else None,
+                             post=MagicMock(uri=f"at://{i}",
+                                            author=MagicMock(handle=handle)))
+
+        pages = [[view(0, False), view(1, True)], [view(2, False), view(3, False)],
+                 [view(4, False)]]
+        calls = []
+
+        async def get_author_feed(actor, cursor=None):
+            page = cursor or 0
+            calls.append(page)
+            return self.page('feed', pages[page],
+                             page + 1 if page + 1 < len(pages) else None)
+        self.async_instance._client.get_author_feed = get_author_feed
+
+        result = list(self.async_instance.iterate(
+            self.async_instance.get_posts('testuser', count_limit=2)))
+        assert [post.uri for post in result] == ['at://0', 'at://2']
+        assert calls == [0, 1]
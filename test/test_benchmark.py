@@ -0,0 +1,64 @@
+'''Benchmark suite tests'''
+
+import json
+
+import pytest
+
+import benchmark
+
+
+class TestBenchmark:
+    '''Run each benchmark at a small scale to check the fake client stays in step
+       with the generators it feeds'''
+    @pytest.mark.parametrize('name', list(benchmark.BENCHMARKS))
+    def test_run(self, name):
+        '''Test each benchmark consumes all of its items'''
+        result = benchmark.run(name, 250, page_size=50)
+        assert result['items'] == 250
+        assert result['yielded'] > 0
+        assert result['calls'] >= 5
+        assert result['items_per_sec'] > 0
+        assert result['peak_mb'] > 0
+
+    def test_run_counts(self):
+        '''Test the items yielded and calls made for a known feed'''
+        result = benchmark.run('get_posts', 250, page_size=50, memory=False)
+        assert result['yielded'] == 250
+        assert result['calls'] == 5
+        assert result['peak_mb'] is None
+
+        result = benchmark.run('get_mutuals', 250, page_size=50, memory=False)
+        assert result['yielded'] == 125
+        assert result['calls'] == 10
+
+    def test_compare(self, tmp_path, capsys):
+        '''Test saved results are compared and regressions reported'''
+        path = tmp_path / 'results.json'
+        assert benchmark.main(['search', '-n', '100', '--repeat', '1',
+                               '--no-memory', '--save', str(path)]) == 0
+        results = json.loads(path.read_text())
+        assert [r['benchmark'] for r in results] == ['search']
+
+        results[0]['items_per_sec'] *= 1000
+        path.write_text(json.dumps(results))
+        assert benchmark.main(['search', '-n', '100', '--repeat', '1',
+                               '--no-memory', '--compare', str(path)]) == 1
+        assert 'Regressions: search' in capsys.readouterr().out
+
+    def test_regressions(self):
+        '''Test the regression tolerance'''
+        baseline = {'a': {'items_per_sec': 100}, 'b': {'items_per_sec': 100}}
+        results = [{'benchmark': 'a', 'items_per_sec': 85},
+                   {'benchmark': 'b', 'items_per_sec': 75},
+                   {'benchmark': 'c', 'items_per_sec': 1}]
+        assert benchmark.regressions(results, baseline, 0.2) == ['b']
+
+    def test_footprint(self, capsys):
+        '''Test lean records take a fraction of the memory of the models'''
+        results = benchmark.footprint(200)
+        assert set(results) == {'profile', 'post', 'like'}
+        for sizes in results.values():
+            assert 0 < sizes['lean'] < sizes['model'] / 3
+
+        assert benchmark.main(['--footprint', '-n', '50']) == 0
+        assert 'saving' in capsys.readouterr().out
@@ -12,8 +12,9 @@ class TestBuildPost(BaseTest):
         # on what it returns
         input_text = 'Some text value'
 
-        with patch.object(self.instance, 'profile_did',
-                          side_effect=random_did):
+        with patch.object(self.instance, 'profile_dids',
+                          side_effect=lambda handles: {h: random_did
+                                                       for h in handles}):
             tb = self.instance.build_post(input_text, setup_random_profile_names)
             built_text = tb.build_text()
 
@@ -0,0 +1,161 @@
+'''Cassette record/replay tests'''
+
+import gzip
+import json
+
+import atproto_client
+import httpx
+import pytest
+
+import cassette
+from async_bluesky import AsyncBlueSky
+from bluesky import BlueSky
+from cassette import Cassette, CassetteMissError
+from retry import Retrier
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=W0212 (protected-access)
+
+HANDLE = 'alice.bsky.social'
+PASSWORD = 'secret-password'
+DID = 'did:plc:alice'
+ACCESS_JWT = cassette.replay_token({'scope': 'com.atproto.access', 'sub': DID,
+                                    'jti': 'real-access-token'})
+
+
+class TestCassette:
+    '''Record the requests of a BlueSky instance made against a fake server and
+       replay them without it'''
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path, monkeypatch):
+        '''Send recorded requests to a fake server'''
+        self.path = str(tmp_path / 'session.cassette')
+        self.requests = []
+        monkeypatch.setattr(cassette.httpx, 'HTTPTransport',
+                            lambda **_: httpx.MockTransport(self.server))
+
+    def server(self, request):
+        '''The fake server'''
+        self.requests.append(request)
+        nsid = request.url.path.rsplit('/', 1)[-1]
+        if nsid == 'com.atproto.server.createSession':
+            return httpx.Response(200, json={'did': DID, 'handle': HANDLE,
+                                             'accessJwt': ACCESS_JWT,
+                                             'refreshJwt': ACCESS_JWT})
+        if nsid == 'app.bsky.actor.getProfile':
+            return httpx.Response(200, json={'did': DID, 'handle': HANDLE})
+        if nsid == 'app.bsky.actor.getProfiles':
+            actors = request.url.params.get_list('actors')
+            if any(actor.startswith('bad') for actor in actors):
+                return httpx.Response(400, json={'error': 'InvalidRequest',
+                                                 'message': 'Bad actor'})
+            # The display names change with each request
+            return httpx.Response(
+                200, json={'profiles': [{'did': f"did:plc:{actor.split('.')[0]}",
+                                         'handle': actor,
+                                         'displayName': f"{len(self.requests)}"}
+                                        for actor in actors]},
+                headers={'ratelimit-remaining': '99'})
+        return httpx.Response(404, json={'error': 'NotFound', 'message': nsid})
+
+    def bluesky(self, mode, password=PASSWORD, latency=0.0):
+        '''Return a BlueSky instance that records or replays the cassette'''
+        return BlueSky(HANDLE, password, retrier=Retrier(base_delay=0),
+                       cassette=Cassette(self.path, mode, latency))
+
+    def record(self):
+        '''Record a session, return the profiles retrieved'''
+        bs = self.bluesky(Cassette.RECORD)
+        profiles = [bs.get_profile('bob').display_name,
+                    bs.get_profiles(['carol', 'bad'])['carol'].display_name]
+        bs.cassette.close()
+        return profiles
+
+    def test_replay(self):
+        '''Test a replay returns the recorded responses without the server'''
+        recorded = self.record()
+        num_requests = len(self.requests)
+        assert num_requests == 6
+
+        bs = self.bluesky(Cassette.REPLAY, password='not-checked')
+        assert [bs.get_profile('bob').display_name,
+                bs.get_profiles(['carol', 'bad'])['carol'].display_name] == recorded
+        assert len(self.requests) == num_requests
+
+    def test_secrets_not_recorded(self):
+        '''Test the password and session tokens aren't in the cassette'''
+        self.record()
+        with gzip.open(self.path, 'rt') as f:
+            content = f.read()
+        assert PASSWORD not in content
+        assert ACCESS_JWT not in content
+        assert 'ratelimit-remaining' in content
+
+        bs = self.bluesky(Cassette.REPLAY, password='not-checked')
+        assert bs.client._session.access_jwt_payload.exp == \
+            cassette.REPLAY_TOKEN_EXPIRY
+
+    def test_replay_order(self):
+        '''Test identical requests are answered in the order recorded and the
+           last answer is repeated'''
+        bs = self.bluesky(Cassette.RECORD)
+        names = [bs._fetch_profiles(['bob'])[0].display_name for _ in range(2)]
+        bs.cassette.close()
+        assert names[0] != names[1]
+
+        bs = self.bluesky(Cassette.REPLAY)
+        assert [bs._fetch_profiles(['bob'])[0].display_name
+                for _ in range(3)] == names + names[1:]
+
+    def test_replay_error(self):
+        '''Test recorded error responses raise the same exceptions'''
+        bs = self.bluesky(Cassette.RECORD)
+        with pytest.raises(atproto_client.exceptions.BadRequestError):
+            bs.client.app.bsky.actor.get_profiles(params={'actors': ['bad']})
+        bs.cassette.close()
+
+        bs = self.bluesky(Cassette.REPLAY)
+        with pytest.raises(atproto_client.exceptions.BadRequestError):
+            bs.client.app.bsky.actor.get_profiles(params={'actors': ['bad']})
+
+    def test_replay_miss(self):
+        '''Test replaying a request that wasn't recorded'''
+        self.record()
+        bs = self.bluesky(Cassette.REPLAY)
+        with pytest.raises(CassetteMissError):
+            bs.get_profile('dave')
+
+    def test_replay_async(self):
+        '''Test the async client replays too'''
+        self.record()
+        bs = self.bluesky(Cassette.REPLAY)
+        async_bs = AsyncBlueSky(bs)
+        try:
+            rsp = async_bs.run(async_bs._call('app.bsky.actor.get_profiles',
+                                              params={'actors': ['bob.bsky.social']}))
+        finally:
+            async_bs.close()
+        assert rsp.profiles[0].handle == 'bob.bsky.social'
+
+    def test_replay_latency(self, monkeypatch):
+        '''Test the simulated latency of replays'''
+        self.record()
+        delays = []
+        monkeypatch.setattr(cassette.time, 'sleep', delays.append)
+        self.bluesky(Cassette.REPLAY, latency=0.25).get_profile('bob')
+        assert delays == [0.25] * 3
+
+        delays.clear()
+        self.bluesky(Cassette.REPLAY, latency=cassette.RECORDED).get_profile('bob')
+        with gzip.open(self.path, 'rt') as f:
+            elapsed = [json.loads(line)['elapsed'] for line in list(f)[1:4]]
+        assert delays == [e for e in elapsed if e]
+
+    def test_invalid(self):
+        '''Test invalid modes and versions'''
+        with pytest.raises(ValueError):
+            Cassette(self.path, 'rewind')
+        with gzip.open(self.path, 'wt') as f:
+            f.write(json.dumps({'version': 0}) + '\n')
+        with pytest.raises(ValueError):
+            Cassette(self.path, Cassette.REPLAY)
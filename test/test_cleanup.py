@@ -0,0 +1,165 @@
+'''Bulk record cleanup tests'''
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import cleanup
+import tid
+from base_test import BaseTest
+from cleanup import CleanupStore, Criteria, Pacer
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=W0212 (protected-access)
+
+HANDLE = 'testuser.bsky.social'
+DID = 'did:plc:testuser'
+
+
+def make_record(collection, day, reply=False):
+    '''Return a listed record of the given collection created at noon UTC on the
+       given day of November 2024'''
+    rkey = tid.from_datetime(datetime(2024, 11, day, 12, tzinfo=timezone.utc))
+    return SimpleNamespace(
+            uri=f"at://{DID}/{cleanup.COLLECTIONS[collection]}/{rkey}",
+            value=SimpleNamespace(reply=SimpleNamespace() if reply else None))
+
+
+def days(records):
+    '''Return the days of the month the given records were created'''
+    return [tid.rkey_to_datetime(record.uri).day for record in records]
+
+
+class TestCleanup(BaseTest):
+    '''Test deleting records in batches'''
+    PAGE_SIZE = 3
+
+    @pytest.fixture(autouse=True)
+    def setup_repo(self, setup, tmp_path):
+        '''Give the user a repo of a post on each of the first ten days of
+           November, every third one a reply'''
+        self.instance.handle = HANDLE
+        self.instance.resolver.put(HANDLE, DID)
+        self.store = CleanupStore(str(tmp_path / 'cleanup.sqlite'))
+        self.instance._cleanup_store = self.store
+        self.repo = [make_record(cleanup.POSTS, day, reply=day % 3 == 0)
+                     for day in range(10, 0, -1)]
+        self.cursors = []
+        self.batches = []
+        self.fail_batch = None
+        repo = self.instance.client.com.atproto.repo
+        repo.list_records.side_effect = self.list_records
+        repo.apply_writes.side_effect = self.apply_writes
+
+    def list_records(self, params):
+        '''Return a page of the records listed after the cursor, newest first'''
+        assert (params.repo, params.collection) == (DID, 'app.bsky.feed.post')
+        self.cursors.append(params.cursor)
+        listed = [r for r in self.repo
+                  if not params.cursor or r.uri.rsplit('/', 1)[-1] < params.cursor]
+        page = listed[:self.PAGE_SIZE]
+        return SimpleNamespace(
+                records=page,
+                cursor=page[-1].uri.rsplit('/', 1)[-1] if len(listed) > len(page)
+                else None)
+
+    def apply_writes(self, data):
+        '''Delete the records of the writes'''
+        if len(self.batches) == self.fail_batch:
+            raise IOError("Giving up")
+        assert data.repo == DID
+        rkeys = [write.rkey for write in data.writes]
+        assert {write.collection for write in data.writes} == {'app.bsky.feed.post'}
+        self.batches.append(rkeys)
+        self.repo = [r for r in self.repo if r.uri.rsplit('/', 1)[-1] not in rkeys]
+
+    def run(self, criteria, **kwargs):
+        '''Return the days of the records the cleanup yields'''
+        return days(self.instance.cleanup(criteria, **kwargs))
+
+    def test_date_range(self):
+        '''Test only records in the date range are listed and deleted'''
+        assert self.run(Criteria(cleanup.POSTS, since='2024-11-03',
+                                 before='2024-11-08'), batch_size=2) == \
+            [7, 6, 5, 4, 3]
+        assert days(self.repo) == [10, 9, 8, 2, 1]
+        assert [len(batch) for batch in self.batches] == [2, 2, 1]
+        # Listing starts at the end of the date range
+        assert self.cursors[0] == tid.from_datetime(
+                datetime(2024, 11, 8).astimezone())
+
+    def test_type(self):
+        '''Test posts are selected by type'''
+        assert self.run(Criteria(cleanup.POSTS, record_type=cleanup.REPLY)) == \
+            [9, 6, 3]
+        assert self.run(Criteria(cleanup.POSTS, record_type=cleanup.ORIGINAL)) == \
+            [10, 8, 7, 5, 4, 2, 1]
+        assert not self.repo
+
+    def test_dry_run(self):
+        '''Test a dry run deletes nothing'''
+        assert self.run(Criteria(cleanup.POSTS, before='2024-11-04'),
+                        dry_run=True) == [3, 2, 1]
+        assert not self.batches
+        assert len(self.repo) == 10
+
+    def test_resume(self):
+        '''Test an interrupted cleanup carries on from its last batch'''
+        criteria = Criteria(cleanup.POSTS, record_type=cleanup.ORIGINAL)
+        self.fail_batch = 2
+        deleted = []
+        with pytest.raises(IOError):
+            deleted.extend(self.instance.cleanup(criteria, batch_size=2))
+        assert days(deleted) == [10, 8, 7, 5]
+        assert self.store.get(criteria.key(DID)) == (self.batches[-1][-1], 4)
+
+        self.fail_batch = None
+        self.cursors.clear()
+        assert self.run(criteria, batch_size=2) == [4, 2, 1]
+        assert self.cursors[0] == self.batches[1][-1]
+        assert days(self.repo) == [9, 6, 3]
+        assert self.store.get(criteria.key(DID)) is None
+
+    def test_paced(self):
+        '''Test each batch waits for the pacer'''
+        waits = []
+        pacer = SimpleNamespace(wait=waits.append)
+        self.run(Criteria(cleanup.POSTS), batch_size=4, pacer=pacer)
+        assert waits == [4, 4, 2]
+
+    @pytest.mark.parametrize('batch_size', [0, cleanup.MAX_BATCH_SIZE + 1])
+    def test_batch_size(self, batch_size):
+        '''Test the batch size is checked'''
+        with pytest.raises(ValueError):
+            self.run(Criteria(cleanup.POSTS), batch_size=batch_size)
+
+
+@pytest.mark.parametrize('kwargs', [{'collection': 'follows'},
+                                    {'collection': cleanup.POSTS,
+                                     'record_type': 'quote'},
+                                    {'collection': cleanup.LIKES,
+                                     'record_type': cleanup.REPLY}])
+def test_invalid_criteria(kwargs):
+    '''Test invalid criteria are rejected'''
+    with pytest.raises(ValueError):
+        Criteria(**kwargs)
+
+
+def test_pacer():
+    '''Test writes are spread out to the rate'''
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    pacer = Pacer(per_hour=3600, clock=lambda: now[0], sleep=sleep)
+    pacer.wait(10)
+    pacer.wait(10)
+    now[0] += 4
+    pacer.wait(5)
+    now[0] += 60
+    pacer.wait(1)
+    assert sleeps == [10, 6]
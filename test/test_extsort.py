@@ -0,0 +1,62 @@
+'''External sort and merge join tests'''
+
+import os
+import random
+
+import pytest
+
+from extsort import SortedRuns, merge_join
+
+# pylint: disable=W0212 (protected-access)
+
+
+def test_sorted_runs(tmp_path):
+    '''Test records are spilled to runs of run_size and read back in order'''
+    keys = [f"did:plc:{i:04d}" for i in range(25)]
+    random.Random(1).shuffle(keys)
+    with SortedRuns(run_size=4, directory=str(tmp_path)) as runs:
+        for key in keys:
+            runs.add(key, f'["{key}"]' if key.endswith('0') else None)
+            assert len(runs._buffer) < 4
+        assert len(runs.runs) == 6
+        assert all(os.path.exists(path) for path in runs.runs)
+        records = list(runs)
+    assert [key for key, _ in records] == sorted(keys)
+    assert dict(records)['did:plc:0010'] == '["did:plc:0010"]'
+    assert dict(records)['did:plc:0011'] is None
+    # The run files are removed when closed
+    assert not os.listdir(tmp_path)
+
+
+def test_max_fan_in(tmp_path):
+    '''Test runs are merged into longer runs until there are max_fan_in'''
+    keys = [f"did:plc:{i:04d}" for i in range(50)]
+    random.Random(2).shuffle(keys)
+    with SortedRuns(run_size=2, directory=str(tmp_path), max_fan_in=3) as runs:
+        for key in keys:
+            runs.add(key)
+        assert len(runs.runs) == 25
+        assert [key for key, _ in runs] == sorted(keys)
+        assert len(runs.runs) <= 3
+        assert len(os.listdir(runs._dir.name)) == len(runs.runs)
+        assert [key for key, _ in runs] == sorted(keys)
+
+
+def test_invalid_run_size():
+    '''Test the run size and max fan-in are checked'''
+    with pytest.raises(ValueError):
+        SortedRuns(run_size=0)
+    with pytest.raises(ValueError):
+        SortedRuns(max_fan_in=1)
+
+
+def test_merge_join():
+    '''Test keys of either side are joined once each'''
+    left = [('a', '1'), ('b', '2'), ('b', 'dup'), ('d', '4')]
+    right = [('b', 'x'), ('c', 'y'), ('d', 'z'), ('e', None)]
+    assert list(merge_join(left, right)) == [
+        ('a', ('a', '1'), None), ('b', ('b', '2'), ('b', 'x')),
+        ('c', None, ('c', 'y')), ('d', ('d', '4'), ('d', 'z')),
+        ('e', None, ('e', None))]
+    assert not list(merge_join([], []))
+    assert list(merge_join([], [('a', 'x')])) == [('a', None, ('a', 'x'))]
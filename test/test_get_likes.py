@@ -9,6 +9,7 @@ import atproto_core.exceptions
 import pytest
 from base_test import BaseTest
 from partial_failure import PartialFailure
+import tid
 
 
 # pylint: disable=W0613 (unused-argument)
@@ -52,6 +53,17 @@ class MockHelpers:
         # client.bsky.feed.like.get()
         return like_mock
 
+    @staticmethod
+    def create_tid_like_mock(num):
+        '''Create like mock object whose like URI has a TID record key, created
+           num minutes ago'''
+        like_mock = MockHelpers.create_like_mock(num)
+        created_at = datetime.datetime.now(datetime.UTC) - \
+            datetime.timedelta(minutes=num)
+        like_mock.post.viewer.like = f"at://did:plc:example/app.bsky.feed.like/" \
+                                     f"{tid.from_datetime(created_at)}"
+        return like_mock
+
     @staticmethod
     def create_gal_mocks(num):
         '''Create a mock response for get_actor_likes(). Used by several fixtures'''
@@ -244,7 +256,7 @@ class TestGetLikes(BaseTest):
         # like was created at. We setup these rkey/URI values as an increasing
         # integer from 1 in setup_10_gal_mock()
         like_get_mock.value.created_at = MockHelpers.like_created_at(minutes=int(rkey))
-        self.like_get_mock_feed_created_at.append(like_get_mock.value.created_at)
+        self.like_get_mock_feed_created_at[rkey] = like_get_mock.value.created_at
         return like_get_mock
 
     @pytest.mark.parametrize("minutes_ago", range(11))
@@ -257,9 +269,11 @@ class TestGetLikes(BaseTest):
                          'get', side_effect=self.side_effect_feed_like_get):
 
             # The side effect function self.mock_feed_like_get() saves the created_at
-            # dates in this list. We can assert that we get back these created_at
-            # dates in the likes returned from get_likes()
-            self.like_get_mock_feed_created_at = []
+            # dates in this dict keyed by rkey. We can assert that we get back
+            # these created_at dates in the likes returned from get_likes(). The
+            # likes aren't necessarily fetched in order, the date limit is found
+            # by bisecting each page.
+            self.like_get_mock_feed_created_at = {}
 
             # Call function under test: get_likes() with a date limit but no count
             # and get_date=False.
@@ -275,12 +289,12 @@ class TestGetLikes(BaseTest):
             assert len(likes) == minutes_ago
 
             # assert the contents of the returned likes
-            for like, mock_feed, created_at in zip(likes, setup_10_gal_mock.feed,
-                                                   self.like_get_mock_feed_created_at):
+            for like, mock_feed in zip(likes, setup_10_gal_mock.feed):
                 assert like.post.viewer.like == mock_feed.post.viewer.like
                 assert like.post.uri == mock_feed.post.uri
                 assert like.created_at is not None
-                assert like.created_at == created_at
+                assert like.created_at == self.like_get_mock_feed_created_at[
+                        like.post.viewer.like.split('/')[-1]]
 
     @pytest.mark.parametrize("count_limit", range(1, 11))
     def test_get_likes_no_date_count_limit_reached(self, setup_10_gal_mock,
@@ -364,3 +378,57 @@ class TestGetLikes(BaseTest):
 
         result = list(self.instance.get_likes("2023-01-01"))
         assert not result
+
+    @pytest.fixture
+    def setup_10_tid_gal_mock(self):
+        '''Create a mock response for get_actor_likes() with TID like URIs'''
+        gal_mock = MockHelpers.create_gal_mocks(0)
+        gal_mock.feed = [MockHelpers.create_tid_like_mock(i+1) for i in range(10)]
+        return gal_mock
+
+    @pytest.mark.parametrize("minutes_ago", range(11))
+    def test_get_likes_tid_date_limit_reached(self, setup_10_tid_gal_mock,
+                                              minutes_ago):
+        '''Test the date limit is applied using the like TIDs, without fetching
+           each like record'''
+        with patch.object(self.instance.client.app.bsky.feed,
+                          'get_actor_likes', return_value=setup_10_tid_gal_mock), \
+            patch.object(self.instance.client.app.bsky.feed.like,
+                         'get') as get_mock:
+            # The likes were created 1 to 10 minutes ago, see setup_10_tid_gal_mock
+            likes = list(self.instance.get_likes(f"{minutes_ago} minutes ago"))
+
+            assert len(likes) == minutes_ago
+            assert get_mock.call_count == 0
+            for like, mock_feed in zip(likes, setup_10_tid_gal_mock.feed):
+                assert like.post.uri == mock_feed.post.uri
+                assert like.created_at == tid.rkey_to_datetime(
+                        mock_feed.post.viewer.like).isoformat()
+
+    def test_get_likes_tid_get_date(self, setup_10_tid_gal_mock):
+        '''Test like dates are decoded from the like TIDs'''
+        with patch.object(self.instance.client.app.bsky.feed,
+                          'get_actor_likes', return_value=setup_10_tid_gal_mock), \
+            patch.object(self.instance.client.app.bsky.feed.like,
+                         'get') as get_mock:
+            likes = list(self.instance.get_likes(None, get_date=True))
+
+            assert len(likes) == 10
+            assert get_mock.call_count == 0
+            for like in likes:
+                assert like.created_at is not None
+
+    def test_get_likes_tid_exact_date(self, setup_10_tid_gal_mock,
+                                      setup_like_get_mock):
+        '''Test exact_date fetches each like record even if it has a TID'''
+        with patch.object(self.instance.client.app.bsky.feed,
+                          'get_actor_likes', return_value=setup_10_tid_gal_mock), \
+            patch.object(self.instance.client.app.bsky.feed.like,
+                         'get', return_value=setup_like_get_mock) as get_mock:
+            likes = list(self.instance.get_likes(None, get_date=True,
+                                                 exact_date=True))
+
+            assert len(likes) == 10
+            assert get_mock.call_count == 10
+            for like in likes:
+                assert like.created_at == setup_like_get_mock.value.created_at
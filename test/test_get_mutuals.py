@@ -1,13 +1,16 @@
 '''Tests for the BlueSky.get_mutuals() method'''
 
+import os
 from unittest.mock import patch
 from dataclasses import dataclass
+from types import SimpleNamespace
 
 import pytest
 from conftest import MockUtils
 from base_test import BaseTest
 
 # pylint: disable=R0903 (too-few-public-methods)
+# pylint: disable=W0212 (protected-access)
 
 
 @dataclass
@@ -94,3 +97,91 @@ class TestGetMutuals(BaseTest):
                     assert handles == ffm.both
                 else:
                     assert False
+
+    def test_get_mutuals_invalid_flag(self, setup_random_profile_name):
+        '''Test BlueSky.get_mutuals() with an invalid flag'''
+        with patch.object(self.instance, 'follows', return_value=[]), \
+             patch.object(self.instance, 'followers', return_value=[]):
+            with pytest.raises(ValueError):
+                list(self.instance.get_mutuals(setup_random_profile_name, 'invalid'))
+
+    @pytest.mark.parametrize('failing', ['follows', 'followers'])
+    def test_get_mutuals_exception(self, failing, setup_random_profile_name):
+        '''Test an exception retrieving either side is raised to the caller'''
+        profiles = [MockUtils.profile(f"handle{i}") for i in range(10)]
+        with patch.object(self.instance, 'follows', return_value=profiles), \
+             patch.object(self.instance, 'followers', return_value=profiles), \
+             patch.object(self.instance, failing, side_effect=IOError('Mocked')):
+            with pytest.raises(IOError):
+                list(self.instance.get_mutuals(setup_random_profile_name, 'both'))
+
+    def test_get_mutuals_duplicates(self, setup_random_profile_name):
+        '''Test a profile returned twice by the API is only yielded once'''
+        follows = [MockUtils.profile('handle1'), MockUtils.profile('handle2'),
+                   MockUtils.profile('handle1')]
+        with patch.object(self.instance, 'follows', return_value=follows), \
+             patch.object(self.instance, 'followers', return_value=[]):
+            result = list(self.instance.get_mutuals(setup_random_profile_name,
+                                                    'follows-not-followers'))
+            assert sorted(p.handle for p in result) == ['handle1', 'handle2']
+
+    def test_get_mutuals_stop_early(self, setup_random_profile_name):
+        '''Test the crawlers are stopped if the caller stops early'''
+        crawled = []
+
+        def followers(_handle):
+            for i in range(1000000):
+                crawled.append(i)
+                yield SimpleNamespace(handle=f"handle{i}")
+
+        with patch.object(self.instance, 'follows', return_value=[]), \
+             patch.object(self.instance, 'followers', side_effect=followers):
+            gen = self.instance.get_mutuals(setup_random_profile_name,
+                                            'followers-not-follows')
+            assert next(gen).handle == 'handle0'
+            gen.close()
+            assert len(crawled) < 1000000
+
+    def test_crawl_bounded(self):
+        '''Test the crawlers are held back by a full queue and still stop when
+           the caller stops early'''
+        crawled = []
+
+        def followers(_handle):
+            for i in range(1000000):
+                crawled.append(i)
+                yield SimpleNamespace(handle=f"handle{i}")
+
+        with patch.object(self.instance, 'follows', return_value=[]), \
+             patch.object(self.instance, 'followers', side_effect=followers):
+            gen = self.instance._crawl_graphs('testuser', maxsize=2)
+            items = [next(gen) for _ in range(3)]
+            assert len(crawled) <= len(items) + 3
+            gen.close()
+
+    @pytest.mark.parametrize('flag', ['both', 'follows-not-followers',
+                                      'followers-not-follows'])
+    def test_get_mutuals_spilled(self, flag, tmp_path, setup_random_profile_name):
+        '''Test the disk-backed merge join yields the same users as in memory,
+           with the profile fields of the side that's yielded'''
+        def profile(i, side):
+            return SimpleNamespace(did=f"did:plc:user{i:03d}", handle=f"handle{i}",
+                                   display_name=f"{side} {i}",
+                                   created_at='2024-11-01T12:00:00Z',
+                                   description=None)
+
+        follows = [profile(i, 'follow') for i in range(0, 100, 2)]
+        followers = [profile(i, 'follower') for i in range(0, 100, 3)]
+        followers.append(followers[0])
+        with patch.object(self.instance, 'follows', return_value=follows), \
+             patch.object(self.instance, 'followers', return_value=followers):
+            expected = list(self.instance.get_mutuals(setup_random_profile_name,
+                                                      flag))
+            result = list(self.instance.get_mutuals(setup_random_profile_name,
+                                                    flag, run_size=7,
+                                                    spill_dir=str(tmp_path)))
+        assert [p.handle for p in result] == \
+            sorted((p.handle for p in expected), key=lambda s: int(s[6:]))
+        assert [p.display_name for p in result] == \
+            [p.display_name for p in sorted(expected, key=lambda p: p.did)]
+        assert not os.listdir(tmp_path)
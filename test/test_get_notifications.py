@@ -91,18 +91,23 @@ class TestGetNotifications(BaseTest):
         return rsp
 
     @staticmethod
-    def side_effect_post(uri):
-        '''Create a mock post structure with the given URI'''
-        post = MagicMock()
-        post.uri = uri
-        return post
+    def side_effect_get_posts(params=None):
+        '''Create a mock getPosts response with a post for each given URI'''
+        assert len(params['uris']) <= 25
+        rsp = MagicMock()
+        rsp.posts = []
+        for uri in params['uris']:
+            post = MagicMock()
+            post.uri = uri
+            rsp.posts.append(post)
+        return rsp
 
     def test_get_notifications_no_date_no_count_no_mark_read(
             self, mock_40_not_read_notifications):
         '''Test notifications with no date limit, no count limit and not marking
            any as read'''
-        with patch.object(self.instance, 'get_post',
-                          side_effect=TestGetNotifications.side_effect_post), \
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts), \
              patch.object(self.instance.client.app.bsky.notification,
                           'list_notifications',
                           return_value=mock_40_not_read_notifications):
@@ -118,8 +123,8 @@ class TestGetNotifications(BaseTest):
         '''Test notifications with marking notification as read. Count needed to
            have get_notification return early. Test ensures notifications are
            marked as read even in that case.'''
-        with patch.object(self.instance, 'get_post',
-                          side_effect=TestGetNotifications.side_effect_post), \
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts), \
              patch.object(self.instance.client.app.bsky.notification,
                           'list_notifications',
                           return_value=mock_40_not_read_notifications), \
@@ -131,6 +136,35 @@ class TestGetNotifications(BaseTest):
             assert len(responses) == 5
             assert update_seen.call_count == 1
 
+    def test_get_notifications_mark_read_retried(self, mock_40_not_read_notifications):
+        '''Test marking notifications as read is retried after a transient
+           failure'''
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts), \
+             patch.object(self.instance.client.app.bsky.notification,
+                          'list_notifications',
+                          return_value=mock_40_not_read_notifications), \
+             patch.object(self.instance.client.app.bsky.notification, 'update_seen',
+                          side_effect=[atproto_core.exceptions.AtProtocolError(
+                              'Mocked'), None]) as update_seen:
+            responses = list(self.instance.get_notifications(count_limit=5,
+                                                             mark_read=True))
+            assert len(responses) == 5
+            assert update_seen.call_count == 2
+
+    def test_get_notifications_no_read_ahead(self, mock_40_not_read_notifications):
+        '''Test no pages are read ahead of the first read notification'''
+        mock_40_not_read_notifications.cursor = 'next'
+        mock_40_not_read_notifications.notifications[5].is_read = True
+        self.instance.read_ahead = 2
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts), \
+             patch.object(self.instance.client.app.bsky.notification,
+                          'list_notifications',
+                          return_value=mock_40_not_read_notifications) as list_notifs:
+            assert len(list(self.instance.get_notifications())) == 5
+            assert list_notifs.call_count == 1
+
     def test_get_notifications_no_date_no_count_no_mark_read_with_cursor(
             self, mock_40_not_read_notifications):
         '''Test notifications with no date limit, no count limit and not marking
@@ -157,8 +191,8 @@ class TestGetNotifications(BaseTest):
             return rsp
 
         post = MagicMock()
-        with patch.object(self.instance, 'get_post',
-                          side_effect=TestGetNotifications.side_effect_post), \
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts), \
              patch.object(self.instance.client.app.bsky.notification,
                           'list_notifications',
                           side_effect=side_effect_list_notifications_cursor):
@@ -247,8 +281,8 @@ class TestGetNotifications(BaseTest):
     def test_get_notifications_no_date_count_limit_reached(
             self, mock_40_not_read_notifications, count_limit):
         '''Test when the date limit is reached'''
-        with patch.object(self.instance, 'get_post',
-                          side_effect=TestGetNotifications.side_effect_post), \
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts), \
              patch.object(self.instance.client.app.bsky.notification,
                           'list_notifications',
                           return_value=mock_40_not_read_notifications):
@@ -281,3 +315,41 @@ class TestGetNotifications(BaseTest):
                           'list_notifications', return_value=rsp):
             responses = list(self.instance.get_notifications())
             assert not responses
+
+    def test_get_notifications_batched_posts(self):
+        '''Test the posts of a page of notifications are retrieved in batches of
+           at most 25 unique URIs and yielded in notification order'''
+        rsp = MagicMock()
+        # 60 notifications referring to 30 different posts
+        rsp.notifications = [self.mock_notification_like(i % 30) for i in range(60)]
+        rsp.cursor = None
+
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          side_effect=TestGetNotifications.side_effect_get_posts) \
+                as get_posts, \
+             patch.object(self.instance.client.app.bsky.notification,
+                          'list_notifications', return_value=rsp):
+            responses = list(self.instance.get_notifications())
+
+            assert len(responses) == 60
+            assert get_posts.call_count == 2
+            for i, (notification, post) in enumerate(responses):
+                assert notification is rsp.notifications[i]
+                assert post.uri == TestGetNotifications.mock_post_uri(i % 30)
+
+    def test_get_notifications_missing_post(self):
+        '''Test notifications for posts that no longer exist, or that don't refer
+           to a post, are yielded with None'''
+        follow = MagicMock()
+        follow.reason = 'follow'
+        follow.is_read = False
+        rsp = MagicMock()
+        rsp.notifications = [self.mock_notification_like(1), follow]
+        rsp.cursor = None
+
+        with patch.object(self.instance.client.app.bsky.feed, 'get_posts',
+                          return_value=MagicMock(posts=[])), \
+             patch.object(self.instance.client.app.bsky.notification,
+                          'list_notifications', return_value=rsp):
+            responses = list(self.instance.get_notifications())
+            assert responses == [(rsp.notifications[0], None), (follow, None)]
@@ -2,38 +2,62 @@
 
 from unittest.mock import patch, MagicMock
 
+import atproto_client
 import atproto_core
 import pytest
+from atproto import models
 
 from base_test import BaseTest
 from partial_failure import PartialFailure
+from profilecache import ProfileStore
+
+# pylint: disable=W0212 (protected-access)
+
+
+def profiles_rsp(*profiles):
+    '''Create a mock getProfiles response'''
+    rsp = MagicMock()
+    rsp.profiles = list(profiles)
+    return rsp
+
+
+def mock_profile(handle='testuser.bsky.social', did='did:example:123'):
+    '''Create a mock profile'''
+    profile = MagicMock()
+    profile.did = did
+    profile.handle = handle
+    return profile
+
+
+def side_effect_get_profiles(params=None):
+    '''Return a profile for each actor given unless it contains "unknown"'''
+    assert len(params['actors']) <= 25
+    return profiles_rsp(*[mock_profile(actor, f"did:plc:{actor}")
+                          for actor in params['actors'] if 'unknown' not in actor])
 
 
 class TestGetProfile(BaseTest):
     '''Test BlueSky get_profile() method'''
     def test_get_profile(self):
         '''Test the get_profile() method.'''
-        mock_profile = MagicMock()
-        mock_profile.did = 'did:example:123'
+        profile = mock_profile()
 
-        with patch.object(self.instance.client,
-                          'get_profile', return_value=mock_profile):
-            profile = self.instance.get_profile('@testuser.bsky.social')
-            assert profile.did == mock_profile.did
+        with patch.object(self.instance.client.app.bsky.actor,
+                          'get_profiles', return_value=profiles_rsp(profile)):
+            assert self.instance.get_profile('@testuser.bsky.social').did == \
+                profile.did
+            assert self.instance.get_profile('did:example:123').did == profile.did
 
     def test_get_profile_not_found(self):
         '''Test the get_profile() method when the profile is not found.'''
-        mock_profile = MagicMock()
-        mock_profile.did = 'did:example:123'
-
-        with patch.object(self.instance.client,
-                          'get_profile', return_value=None):
+        with patch.object(self.instance.client.app.bsky.actor,
+                          'get_profiles', return_value=profiles_rsp()):
             assert not self.instance.get_profile('@axslaskx.lasdl.iasdo')
 
     def test_get_profile_exception_limit(self):
         '''Test the get_profile() method with exceptions failure'''
-        with patch.object(self.instance.client,
-                          'get_profile',
+        with patch.object(self.instance.client.app.bsky.actor,
+                          'get_profiles',
                           side_effect=atproto_core.exceptions.AtProtocolError(
                               'Mocked Exception')) as mock_exception:
             with pytest.raises(IOError):
@@ -43,13 +67,71 @@ class TestGetProfile(BaseTest):
     def test_get_profile_with_retries(self):
         '''Test the get_profile() method with exceptions partial failure causing
            retries'''
-        mock_profile = MagicMock()
-        mock_profile.did = 'did:example:123'
+        profile = mock_profile('anyhandle.bsky.social')
 
-        with patch.object(self.instance.client,
-                          'get_profile',
+        with patch.object(self.instance.client.app.bsky.actor,
+                          'get_profiles',
                           side_effect=PartialFailure(self.instance.FAILURE_LIMIT,
-                                                     mock_profile)) as mock_exception:
-            profile = self.instance.get_profile('anyhandle')
-            assert profile.did == mock_profile.did
+                                                     profiles_rsp(profile))) \
+                as mock_exception:
+            assert self.instance.get_profile('anyhandle').did == profile.did
             assert mock_exception.call_count == self.instance.FAILURE_LIMIT
+
+    def test_get_profile_cached(self):
+        '''Test profiles are only retrieved once, by handle or DID'''
+        with patch.object(self.instance.client.app.bsky.actor, 'get_profiles',
+                          side_effect=side_effect_get_profiles) as get_profiles:
+            profile = self.instance.get_profile('someone')
+            assert self.instance.get_profile('Someone.bsky.social') is profile
+            assert self.instance.get_profile(profile.did) is profile
+            assert get_profiles.call_count == 1
+
+    def test_get_profiles_batched(self):
+        '''Test many profiles are retrieved 25 at a time, ignoring duplicates'''
+        handles = [f"user{i}.bsky.social" for i in range(60)] + \
+                  ['user1.bsky.social', 'unknown.bsky.social']
+
+        with patch.object(self.instance.client.app.bsky.actor, 'get_profiles',
+                          side_effect=side_effect_get_profiles) as get_profiles:
+            profiles = self.instance.get_profiles(handles)
+            assert get_profiles.call_count == 3
+            assert profiles['unknown.bsky.social'] is None
+            for i in range(60):
+                assert profiles[f"user{i}.bsky.social"].did == \
+                    f"did:plc:user{i}.bsky.social"
+
+    def test_get_profiles_bad_request(self):
+        '''Test a batch rejected because of an invalid actor is retried one
+           actor at a time'''
+        def get_profiles(params=None):
+            if any('invalid!' in actor for actor in params['actors']):
+                ex = atproto_client.exceptions.BadRequestError(MagicMock())
+                ex.response.status_code = 400
+                raise ex
+            return side_effect_get_profiles(params)
+
+        with patch.object(self.instance.client.app.bsky.actor, 'get_profiles',
+                          side_effect=get_profiles):
+            profiles = self.instance.get_profiles(['one.bsky.social', 'invalid!',
+                                                   'two.bsky.social'])
+            assert profiles['one.bsky.social'].did == 'did:plc:one.bsky.social'
+            assert profiles['two.bsky.social'].did == 'did:plc:two.bsky.social'
+            assert profiles['invalid!'] is None
+
+    def test_get_profile_store(self, tmp_path):
+        '''Test profiles are read from the on-disk profile store'''
+        profile = models.AppBskyActorDefs.ProfileViewDetailed(
+            did='did:plc:stored', handle='stored.bsky.social')
+        store = ProfileStore(tmp_path / "profiles.sqlite")
+        self.instance._profile_store = store
+
+        with patch.object(self.instance.client.app.bsky.actor, 'get_profiles',
+                          return_value=profiles_rsp(profile)) as get_profiles:
+            self.instance.get_profile('stored')
+            # A new in-process cache, as if this were a new run
+            self.instance._profile_cache._entries.clear()
+            assert self.instance.get_profile('did:plc:stored') == profile
+            assert get_profiles.call_count == 1
+
+        store.ttl = 0
+        assert store.get('did:plc:stored') is None
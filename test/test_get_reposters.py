@@ -1,26 +1,88 @@
 '''BlueSky tests'''
 
-from unittest.mock import patch, MagicMock
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
 
 from base_test import BaseTest
 
+# pylint: disable=W0201 (attribute-defined-outside-init)
+
+PAGE_SIZE = 2
+LATENCY = 0.1
+
+
+def make_post(i, repost_count=1):
+    '''Return a post with the given number of reposts'''
+    return SimpleNamespace(uri=f"at://did:plc:me/app.bsky.feed.post/{i:013d}",
+                           repost_count=repost_count)
+
 
 class TestGetReposters(BaseTest):
     '''Test BlueSky get_reposters() method'''
+    @pytest.fixture(autouse=True)
+    def setup_reposts(self, setup):
+        '''Posts 0 to 5 are reposted by users 0 to i, one page of PAGE_SIZE
+           reposters at a time'''
+        self.posts = [make_post(i) for i in range(6)] + [make_post(6, 0)]
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.instance.client.get_reposted_by.side_effect = self.get_reposted_by
+
+    def get_reposted_by(self, uri, cursor=None):
+        '''Return a page of the reposters of the given post'''
+        with self.lock:
+            self.calls.append((uri, cursor))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(LATENCY)
+        with self.lock:
+            self.in_flight -= 1
+        reposters = int(uri[-13:]) + 1
+        start = int(cursor or 0)
+        end = min(start + PAGE_SIZE, reposters)
+        return SimpleNamespace(
+                reposted_by=[SimpleNamespace(did=f"did:plc:user{i}",
+                                             handle=f"user{i}.bsky.social")
+                             for i in range(start, end)],
+                cursor=str(end) if end < reposters else None)
+
+    def reposters(self, **kwargs):
+        '''Return the get_reposters() results of the posts'''
+        with patch.object(self.instance, 'get_posts', return_value=self.posts):
+            return list(self.instance.get_reposters('@testuser.bsky.social',
+                                                    **kwargs))
+
     def test_get_reposters(self):
-        '''Test the get_reposters() method.'''
-        mock_post = MagicMock()
-        mock_post.repost_count = 1
-        mock_post.uri = 'at://example/post/1'
-
-        with patch.object(self.instance, 'get_posts', return_value=[mock_post]):
-            mock_reposter = MagicMock()
-            mock_reposter.handle = 'reposter_user'
-            mock_reposter.reposted_by = [mock_reposter]
-
-            with patch.object(self.instance.client,
-                              'get_reposted_by', return_value=mock_reposter):
-                reposters = list(self.instance.get_reposters(
-                                                        '@testuser.bsky.social'))
-                assert len(reposters) == 1
-                assert reposters[0]['profile'].handle == 'reposter_user'
+        '''Test every page of reposters is counted, most reposts first'''
+        reposters = self.reposters()
+        assert [(r['profile'].handle, r['count']) for r in reposters] == \
+            [(f"user{i}.bsky.social", 6 - i) for i in range(6)]
+        # Only the post URIs are kept, newest first
+        assert reposters[5]['post_uris'] == [self.posts[5].uri]
+        assert reposters[4]['post_uris'] == [self.posts[5].uri, self.posts[4].uri]
+        # Posts without reposts aren't fetched, the others are fetched page by
+        # page
+        expected = [(post.uri, str(cursor) if cursor else None)
+                    for i, post in enumerate(self.posts[:6])
+                    for cursor in range(0, i + 1, PAGE_SIZE)]
+        assert sorted(self.calls, key=str) == sorted(expected, key=str)
+
+    def test_top(self):
+        '''Test only the users with the most reposts are returned'''
+        assert [r['profile'].handle for r in self.reposters(top=2)] == \
+            ['user0.bsky.social', 'user1.bsky.social']
+
+    def test_concurrent(self):
+        '''Test the reposters of several posts are fetched concurrently'''
+        start = time.monotonic()
+        self.reposters(max_concurrency=3)
+        elapsed = time.monotonic() - start
+        assert self.max_in_flight == 3
+        # Post 5 takes 3 pages, the posts all take 12
+        assert elapsed < 8 * LATENCY
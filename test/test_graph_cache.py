@@ -0,0 +1,161 @@
+'''Test the follows/followers graph cache'''
+
+from unittest.mock import MagicMock
+
+import pytest
+from atproto import models
+
+from base_test import BaseTest
+from graphcache import GraphCache
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=W0212 (protected-access)
+
+SUBJECT = models.AppBskyActorDefs.ProfileView(did='did:plc:subject',
+                                              handle='testuser.bsky.social')
+
+
+def profile(num):
+    '''Create a profile model for the given number'''
+    return models.AppBskyActorDefs.ProfileView(did=f"did:plc:user{num}",
+                                               handle=f"user{num}.bsky.social",
+                                               display_name=f"User {num}")
+
+
+class TestGraphCache:
+    '''Test the GraphCache class'''
+    @pytest.fixture
+    def cache(self, tmp_path):
+        '''Create an empty cache'''
+        return GraphCache(tmp_path / "graph.sqlite")
+
+    def test_empty(self, cache):
+        '''Nothing is cached to begin with'''
+        assert cache.lookup('follows', 'testuser.bsky.social') is None
+        assert not list(cache.entries('follows', 'did:plc:subject'))
+
+    def test_replace_lookup(self, cache):
+        '''Replaced entries can be looked up by handle or DID, in order'''
+        cache.replace('follows', 'did:plc:subject', 'testuser.bsky.social',
+                      [('did:1', '1'), ('did:2', '2')])
+
+        for actor in ['testuser.bsky.social', 'did:plc:subject']:
+            subject, fetched_at = cache.lookup('follows', actor)
+            assert subject == 'did:plc:subject'
+            assert cache.is_fresh(fetched_at)
+        assert cache.lookup('followers', 'did:plc:subject') is None
+        assert list(cache.entries('follows', 'did:plc:subject')) == ['1', '2']
+        assert cache.known('follows', 'did:plc:subject',
+                           ['did:2', 'did:3', 'did:1']) == {'did:1', 'did:2'}
+        assert cache.known('followers', 'did:plc:subject', ['did:2']) == set()
+        assert cache.known('follows', 'did:plc:subject', []) == set()
+
+        cache.replace('follows', 'did:plc:subject', 'testuser.bsky.social',
+                      [('did:3', '3')])
+        assert list(cache.entries('follows', 'did:plc:subject')) == ['3']
+
+    def test_prepend(self, cache):
+        '''Prepended entries come before the existing entries'''
+        cache.replace('followers', 'did:plc:subject', 'testuser.bsky.social',
+                      [('did:3', '3'), ('did:4', '4')])
+        cache.prepend('followers', 'did:plc:subject', 'testuser.bsky.social',
+                      [('did:1', '1'), ('did:2', '2')])
+        assert list(cache.entries('followers', 'did:plc:subject')) == \
+            ['1', '2', '3', '4']
+
+    def test_stage(self, cache):
+        '''Staged entries only replace the cached entries once complete'''
+        cache.replace('follows', 'did:plc:subject', 'testuser.bsky.social',
+                      [('did:9', '9')])
+        cache.stage('follows', 'did:plc:subject', [('did:0', '0')])
+        cache.stage('follows', 'did:plc:subject', [('did:1', '1'), ('did:2', '2')])
+        cache.stage('follows', 'did:plc:subject', [('did:3', '3')], 2)
+        assert list(cache.entries('follows', 'did:plc:subject')) == ['9']
+
+        cache.replace_staged('follows', 'did:plc:subject', 'testuser.bsky.social')
+        assert list(cache.entries('follows', 'did:plc:subject')) == ['1', '2', '3']
+        cache.replace_staged('follows', 'did:plc:subject', 'testuser.bsky.social')
+        assert not list(cache.entries('follows', 'did:plc:subject'))
+
+    def test_ttl(self, tmp_path):
+        '''Entries older than the TTL are not fresh'''
+        cache = GraphCache(tmp_path / "graph.sqlite", ttl=0)
+        cache.replace('follows', 'did:plc:subject', 'testuser.bsky.social', [])
+        assert not cache.is_fresh(cache.lookup('follows', 'did:plc:subject')[1])
+
+    def test_invalid(self, cache, tmp_path):
+        '''Invalid kinds and refresh modes raise ValueError'''
+        with pytest.raises(ValueError):
+            cache.lookup('mutuals', 'did:plc:subject')
+        with pytest.raises(ValueError):
+            GraphCache(tmp_path / "graph.sqlite", refresh='sometimes')
+
+
+class TestBlueSkyGraphCache(BaseTest):
+    '''Test BlueSky.follows() and followers() using the graph cache'''
+    @pytest.fixture(autouse=True)
+    def setup_cache(self, setup, tmp_path):
+        '''Attach a graph cache to the BlueSky instance'''
+        self.cache = GraphCache(tmp_path / "graph.sqlite")
+        self.instance._graph_cache = self.cache
+
+    @staticmethod
+    def pages(nums_per_page):
+        '''Return a get_followers() side effect returning the given pages'''
+        def get_followers(_handle, cursor=None):
+            page = cursor or 0
+            rsp = MagicMock()
+            rsp.subject = SUBJECT
+            rsp.followers = [profile(n) for n in nums_per_page[page]]
+            rsp.cursor = page + 1 if page + 1 < len(nums_per_page) else None
+            return rsp
+        return get_followers
+
+    def test_fetch_then_cached(self):
+        '''The first call fetches and caches, the second answers from the cache'''
+        get_followers = self.instance.client.get_followers
+        get_followers.side_effect = self.pages([[1, 2], [3]])
+
+        first = list(self.instance.followers('testuser'))
+        assert [p.handle for p in first] == ['user1.bsky.social', 'user2.bsky.social',
+                                             'user3.bsky.social']
+        assert get_followers.call_count == 2
+
+        assert list(self.instance.followers('testuser')) == first
+        assert list(self.instance.followers('did:plc:subject')) == first
+        assert get_followers.call_count == 2
+
+    def test_stop_early_not_cached(self):
+        '''Profiles are only cached once they've all been retrieved'''
+        self.instance.client.get_followers.side_effect = self.pages([[1, 2], [3]])
+        next(self.instance.followers('testuser'))
+        assert self.cache.lookup('followers', 'testuser.bsky.social') is None
+
+    def test_incremental_refresh(self):
+        '''An expired cache is refreshed until already cached entries are reached'''
+        get_followers = self.instance.client.get_followers
+        get_followers.side_effect = self.pages([[3, 4], [5, 6]])
+        list(self.instance.followers('testuser'))
+
+        self.cache.ttl = 0
+        get_followers.reset_mock()
+        get_followers.side_effect = self.pages([[1, 2], [3, 4], [5, 6]])
+
+        result = list(self.instance.followers('testuser'))
+        assert [p.did for p in result] == [f"did:plc:user{n}" for n in range(1, 7)]
+        assert get_followers.call_count == 2
+
+    def test_full_refresh(self):
+        '''A full refresh replaces the cached entries'''
+        get_followers = self.instance.client.get_followers
+        get_followers.side_effect = self.pages([[3, 4]])
+        list(self.instance.followers('testuser'))
+
+        self.cache.ttl = 0
+        self.cache.refresh = GraphCache.FULL
+        get_followers.side_effect = self.pages([[1, 3]])
+
+        assert [p.did for p in self.instance.followers('testuser')] == \
+            ['did:plc:user1', 'did:plc:user3']
+        assert [p.did for p in self.instance._cached_profiles(
+            'followers', 'did:plc:subject')] == ['did:plc:user1', 'did:plc:user3']
@@ -0,0 +1,152 @@
+'''Handle resolution tests'''
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import atproto_client
+import pytest
+
+from base_test import BaseTest
+from bluesky import normalize_handle
+from handles import HandleResolver, HandleStore
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=R0903 (too-few-public-methods)
+
+
+class TestHandleResolver:
+    '''Test the HandleResolver class'''
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        '''Create a resolver that records the handles it resolves'''
+        self.path = str(tmp_path / 'handles.sqlite')
+        self.resolved = []
+        self.lock = threading.Lock()
+
+    def resolve(self, handle):
+        '''Resolve handles, those starting with nobody don't exist'''
+        with self.lock:
+            self.resolved.append(handle)
+        return None if handle.startswith('nobody') else f"did:plc:{handle}"
+
+    def test_resolve_cached(self):
+        '''Test handles are resolved once, case insensitively'''
+        resolver = HandleResolver(self.resolve)
+        assert resolver.resolve('Alice.bsky.social') == 'did:plc:alice.bsky.social'
+        assert resolver.resolve('alice.bsky.social') == 'did:plc:alice.bsky.social'
+        assert self.resolved == ['alice.bsky.social']
+        assert resolver.handle_of('did:plc:alice.bsky.social') == 'alice.bsky.social'
+
+    def test_resolve_many(self):
+        '''Test a batch is resolved concurrently, only resolving unknown handles'''
+        resolver = HandleResolver(self.resolve, max_workers=4)
+        resolver.put('known.bsky.social', 'did:plc:known')
+        handles = ['known.bsky.social', 'nobody.bsky.social'] + \
+                  [f"user{i}.bsky.social" for i in range(20)]
+        dids = resolver.resolve_many(handles)
+
+        assert dids['known.bsky.social'] == 'did:plc:known'
+        assert dids['nobody.bsky.social'] is None
+        assert dids['user7.bsky.social'] == 'did:plc:user7.bsky.social'
+        assert sorted(self.resolved) == sorted(handles[1:])
+
+        # Handles that don't exist are resolved again
+        resolver.resolve_many(handles)
+        assert len(self.resolved) == len(handles)
+
+    def test_expiry(self):
+        '''Test mappings are resolved again after the TTL'''
+        resolver = HandleResolver(self.resolve, ttl=0.01)
+        resolver.resolve('alice.bsky.social')
+        time.sleep(0.02)
+        assert resolver.handle_of('did:plc:alice.bsky.social') is None
+        resolver.resolve('alice.bsky.social')
+        assert self.resolved == ['alice.bsky.social'] * 2
+
+    def test_store(self):
+        '''Test mappings are kept in the on-disk store between resolvers'''
+        HandleResolver(self.resolve, store=HandleStore(self.path)).resolve_many(
+            ['alice.bsky.social', 'bob.bsky.social'])
+
+        resolver = HandleResolver(self.resolve, store=HandleStore(self.path))
+        assert resolver.resolve_many(['alice.bsky.social', 'bob.bsky.social']) == \
+            {'alice.bsky.social': 'did:plc:alice.bsky.social',
+             'bob.bsky.social': 'did:plc:bob.bsky.social'}
+        assert resolver.handle_of('did:plc:bob.bsky.social') == 'bob.bsky.social'
+        assert len(self.resolved) == 2
+
+    def test_store_expiry(self):
+        '''Test stored mappings older than the TTL are ignored'''
+        store = HandleStore(self.path, ttl=-1)
+        store.put_many([('alice.bsky.social', 'did:plc:alice')])
+        assert not store.get_dids(['alice.bsky.social'])
+        assert store.get_handle('did:plc:alice') is None
+
+
+class TestProfileDids(BaseTest):
+    '''Test BlueSky handle resolution'''
+    def test_profile_did(self):
+        '''Test handles are resolved with resolveHandle and remembered'''
+        rsp = MagicMock()
+        rsp.did = 'did:plc:someone'
+        with patch.object(self.instance.client, 'resolve_handle',
+                          return_value=rsp) as resolve:
+            assert self.instance.profile_did('someone') == 'did:plc:someone'
+            assert self.instance.profile_did('@someone.bsky.social') == \
+                'did:plc:someone'
+            resolve.assert_called_once_with('someone.bsky.social')
+
+    def test_profile_did_not_found(self):
+        '''Test unknown handles resolve to None'''
+        with patch.object(self.instance.client, 'resolve_handle',
+                          side_effect=atproto_client.exceptions.BadRequestError(
+                              MagicMock())):
+            assert self.instance.profile_did('nobody') is None
+
+    def test_profile_dids(self):
+        '''Test DIDs are passed through and profiles provide mappings'''
+        profile = MagicMock()
+        profile.did = 'did:plc:known'
+        profile.handle = 'known.bsky.social'
+        self.instance.client.app.bsky.actor.get_profiles.return_value.profiles = \
+            [profile]
+        self.instance.get_profiles(['known'])
+
+        with patch.object(self.instance.client, 'resolve_handle') as resolve:
+            assert self.instance.profile_dids(['known', 'did:plc:other']) == \
+                {'known': 'did:plc:known', 'did:plc:other': 'did:plc:other'}
+            resolve.assert_not_called()
+
+
+class TestNormalizeHandle:
+    '''Test the normalize_handle decorator'''
+    class Example:
+        '''A class with decorated methods'''
+        handle = 'me.bsky.social'
+
+        def normalize_handle_value(self, handle):
+            '''Mark normalized handles'''
+            return f"normalized {handle or self.handle}"
+
+        @normalize_handle
+        def method(self, first, handle=None, last=None):
+            '''A method with a handle argument'''
+            return first, handle, last
+
+    @pytest.mark.parametrize('args, kwargs, expected', [
+        ((1,), {}, (1, 'normalized me.bsky.social', None)),
+        ((1, 'h'), {}, (1, 'normalized h', None)),
+        ((1, 'h', 3), {}, (1, 'normalized h', 3)),
+        ((1,), {'handle': 'h'}, (1, 'normalized h', None)),
+        ((), {'first': 1, 'handle': 'h', 'last': 3}, (1, 'normalized h', 3)),
+        ((1,), {'last': 3}, (1, 'normalized me.bsky.social', 3))])
+    def test_normalize_handle(self, args, kwargs, expected):
+        '''Test the handle argument is normalized however it's given'''
+        assert self.Example().method(*args, **kwargs) == expected
+
+    def test_signature_not_rebound(self):
+        '''Test the signature isn't inspected on each call'''
+        with patch('inspect.signature') as signature:
+            self.Example().method(1, 'h')
+            signature.assert_not_called()
@@ -0,0 +1,205 @@
+'''Image preparation tests'''
+
+import copy
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from atproto_client.models.blob_ref import BlobRef
+
+import images
+from base_test import BaseTest
+from images import ImageCache
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=W0212 (protected-access)
+
+
+class FakeImage:
+    '''Stands in for wand's Image. A source image blob is b"WIDTHxHEIGHT" with an
+       optional b" alpha" and b" rotated". The encoded size is proportional to
+       the number of pixels, raised to the given power.'''
+    bytes_per_pixel = {'jpeg': 0.25, 'png': 1.0}
+    power = 1.0
+    decodes = 0
+    encodes = []
+
+    def __init__(self, blob=None):
+        FakeImage.decodes += 1
+        size, *flags = blob.decode().split()
+        self.width, self.height = (int(n) for n in size.split('x'))
+        self.alpha_channel = 'alpha' in flags
+        self.rotated = 'rotated' in flags
+        self.stripped = False
+        self.format = None
+        self.compression_quality = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def auto_orient(self):
+        '''Turn the image upright'''
+        if self.rotated:
+            self.width, self.height = self.height, self.width
+            self.rotated = False
+
+    def strip(self):
+        '''Remove the metadata'''
+        self.stripped = True
+
+    def clone(self):
+        '''Copy the image'''
+        return copy.copy(self)
+
+    def resize(self, width, height, filter=None):  # pylint: disable=W0622
+        '''Resize the image'''
+        assert filter == 'lanczos'
+        self.width, self.height = width, height
+
+    def make_blob(self):
+        '''Encode the image'''
+        assert self.stripped and not self.rotated
+        size = int((self.width * self.height) ** self.power *
+                   self.bytes_per_pixel[self.format])
+        FakeImage.encodes.append((self.width, self.height, self.format, size))
+        return b'x' * size
+
+
+class TestDownsize:
+    '''Test images are downsized in few encodes'''
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        '''Use the fake wand Image'''
+        monkeypatch.setattr(images, 'wand_image', SimpleNamespace(Image=FakeImage))
+        monkeypatch.setattr(FakeImage, 'encodes', [])
+        monkeypatch.setattr(FakeImage, 'decodes', 0)
+
+    def test_small(self):
+        '''Test a small image is encoded once at its own size'''
+        image = images.downsize(b'800x600')
+        assert (image.width, image.height) == (800, 600)
+        assert len(image.data) == 800 * 600 // 4
+        assert FakeImage.encodes == [(800, 600, 'jpeg', 120000)]
+
+    def test_max_dimension(self):
+        '''Test large images are limited to the dimensions Bluesky shows'''
+        image = images.downsize(b'6000x4000')
+        assert (image.width, image.height) == (2000, 1333)
+        assert len(FakeImage.encodes) == 1
+
+    def test_rotated(self):
+        '''Test the real aspect ratio of an image that needs turning upright'''
+        image = images.downsize(b'1200x900 rotated')
+        assert (image.width, image.height) == (900, 1200)
+
+    @pytest.mark.parametrize('source, power', [(b'2000x1500', 1.0),
+                                               (b'1900x1900 alpha', 1.0),
+                                               (b'2000x1000', 1.15),
+                                               (b'2000x1500', 0.9)])
+    def test_converges(self, source, power, monkeypatch):
+        '''Test images are made to fit, filling most of the limit, in a few
+           encodes of the one decoded image'''
+        monkeypatch.setattr(FakeImage, 'power', power)
+        monkeypatch.setattr(FakeImage, 'bytes_per_pixel', {'jpeg': 1.5, 'png': 2.0})
+        image = images.downsize(source)
+        assert images.MAX_SIZE * images.TARGET_FILL <= len(image.data) <= \
+            images.MAX_SIZE
+        assert len(FakeImage.encodes) <= 4
+        assert FakeImage.decodes == 1
+        width, height = (int(n) for n in source.split()[0].split(b'x'))
+        assert image.width / image.height == pytest.approx(width / height, rel=0.01)
+        assert FakeImage.encodes[-1][2] == ('png' if b'alpha' in source else 'jpeg')
+
+    def test_too_big(self):
+        '''Test an image that can't be made small enough'''
+        with pytest.raises(ValueError):
+            images.downsize(b'2000x1500', max_size=0)
+        assert len(FakeImage.encodes) == images.MAX_ENCODES
+
+    def test_cache(self, tmp_path):
+        '''Test prepared images are cached by their content'''
+        cache = ImageCache(str(tmp_path / 'images.sqlite'))
+        for name, content in (('a.jpg', b'4000x3000'), ('b.jpg', b'4000x3000'),
+                              ('c.jpg', b'3000x4000')):
+            (tmp_path / name).write_bytes(content)
+
+        first = images.prepare(str(tmp_path / 'a.jpg'), cache)
+        assert images.prepare(str(tmp_path / 'b.jpg'), cache) == first
+        assert FakeImage.decodes == 1
+        assert images.prepare(str(tmp_path / 'c.jpg'), cache).height == 2000
+        assert FakeImage.decodes == 2
+
+
+class TestPostImages(BaseTest):
+    '''Test posting images'''
+    @pytest.fixture(autouse=True)
+    def setup_images(self, setup, monkeypatch, tmp_path):
+        '''Use the fake wand Image, taking ENCODE_TIME to encode, and upload blobs
+           taking UPLOAD_TIME'''
+        monkeypatch.setattr(images, 'wand_image', SimpleNamespace(Image=SlowImage))
+        self.instance.client.upload_blob.side_effect = self.upload_blob
+        self.files = []
+        for i, size in enumerate(('800x600', '600x800', '1000x1000', '300x200',
+                                  '400x400')):
+            path = tmp_path / f"{i}.jpg"
+            path.write_bytes(size.encode())
+            self.files.append(str(path))
+
+    @staticmethod
+    def upload_blob(data):
+        '''Return a blob reference for the uploaded data'''
+        time.sleep(UPLOAD_TIME)
+        return SimpleNamespace(blob=BlobRef(mime_type='image/jpeg', size=len(data),
+                                            ref=f"ref{len(data)}"))
+
+    def embedded(self):
+        '''Return the images embedded in the post'''
+        args, kwargs = self.instance.client.send_post.call_args
+        assert args == ('text',)
+        return kwargs['embed'].images
+
+    def test_one(self):
+        '''Test a single image is posted with its aspect ratio'''
+        self.instance.post_image('text', self.files[0], None)
+        [image] = self.embedded()
+        assert (image.aspect_ratio.width, image.aspect_ratio.height) == (800, 600)
+        assert image.alt == ''
+
+    def test_concurrent(self, monkeypatch):
+        '''Test images are prepared and uploaded concurrently, in order'''
+        # Preparing the fake images sleeps so it runs in parallel on one CPU too
+        monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+        start = time.monotonic()
+        self.instance.post_images('text', self.files[:4], ['First', 'Second'])
+        elapsed = time.monotonic() - start
+
+        embedded = self.embedded()
+        assert [(i.aspect_ratio.width, i.aspect_ratio.height) for i in embedded] == \
+            [(800, 600), (600, 800), (1000, 1000), (300, 200)]
+        assert [i.alt for i in embedded] == ['First', 'Second', '', '']
+        assert [i.image.size for i in embedded] == \
+            [800 * 600 // 4, 600 * 800 // 4, 1000 * 1000 // 4, 300 * 200 // 4]
+        # Each image takes ENCODE_TIME + UPLOAD_TIME
+        assert elapsed < 2 * (ENCODE_TIME + UPLOAD_TIME)
+
+    @pytest.mark.parametrize('count, alts', [(0, None), (5, None), (1, ['a', 'b'])])
+    def test_invalid(self, count, alts):
+        '''Test the number of images and alt-texts is checked'''
+        with pytest.raises(ValueError):
+            self.instance.post_images('text', self.files[:count], alts)
+        self.instance.client.send_post.assert_not_called()
+
+
+ENCODE_TIME = 0.3
+UPLOAD_TIME = 0.3
+
+
+class SlowImage(FakeImage):
+    '''A FakeImage that takes ENCODE_TIME to encode'''
+    def make_blob(self):
+        time.sleep(ENCODE_TIME)
+        return super().make_blob()
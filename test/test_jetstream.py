@@ -0,0 +1,236 @@
+'''Jetstream notification streaming tests'''
+
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from websockets.asyncio.server import serve
+
+import dateparse
+import jetstream
+import outputformat
+from async_bluesky import AsyncBlueSky
+from commandlineparser import Command
+from jetstream import Jetstream
+from msgcmd import MsgCmd
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+
+ME = 'did:plc:me'
+OTHER = 'did:plc:other'
+MY_POST = f"at://{ME}/app.bsky.feed.post/3lbx2post"
+THEIR_POST = f"at://{OTHER}/app.bsky.feed.post/3lbx2theirs"
+
+
+def commit(time_us, did, collection, record, operation='create'):
+    '''Return a Jetstream commit message'''
+    return {'did': did, 'time_us': time_us, 'kind': 'commit',
+            'commit': {'rev': f"rev{time_us}", 'operation': operation,
+                       'collection': collection, 'rkey': f"rkey{time_us}",
+                       'record': {'$type': collection,
+                                  'createdAt': '2024-11-28T09:15:42.123Z',
+                                  **record},
+                       'cid': f"cid{time_us}"}}
+
+
+# Messages as relayed by Jetstream, in stream order
+FRAMES = [
+    commit(1000, 'did:plc:a', jetstream.LIKE,
+           {'subject': {'uri': MY_POST, 'cid': 'c'}}),
+    commit(1001, 'did:plc:b', jetstream.LIKE,
+           {'subject': {'uri': THEIR_POST, 'cid': 'c'}}),
+    {'did': 'did:plc:c', 'time_us': 1002, 'kind': 'identity',
+     'identity': {'did': 'did:plc:c', 'handle': 'c.bsky.social', 'seq': 1}},
+    commit(1003, 'did:plc:d', jetstream.REPOST,
+           {'subject': {'uri': MY_POST, 'cid': 'c'}}),
+    commit(1004, 'did:plc:e', jetstream.FOLLOW, {'subject': ME}),
+    commit(1005, 'did:plc:f', jetstream.FOLLOW, {'subject': OTHER}),
+    commit(1006, ME, jetstream.LIKE, {'subject': {'uri': MY_POST, 'cid': 'c'}}),
+    commit(1007, 'did:plc:g', jetstream.POST,
+           {'text': 'A reply',
+            'reply': {'root': {'uri': MY_POST, 'cid': 'c'},
+                      'parent': {'uri': MY_POST, 'cid': 'c'}}}),
+    commit(1008, 'did:plc:h', jetstream.POST,
+           {'text': 'A quote',
+            'embed': {'$type': jetstream.RECORD_WITH_MEDIA_EMBED,
+                      'record': {'record': {'uri': MY_POST, 'cid': 'c'}},
+                      'media': {}}}),
+    commit(1009, 'did:plc:i', jetstream.POST,
+           {'text': '@me.bsky.social hello',
+            'facets': [{'index': {'byteStart': 0, 'byteEnd': 15},
+                        'features': [{'$type': jetstream.MENTION_FEATURE,
+                                      'did': ME}]}]}),
+    commit(1010, 'did:plc:j', jetstream.LIKE, {}, operation='delete'),
+    commit(1011, 'did:plc:k', jetstream.POST, {'text': 'Unrelated'})]
+
+EXPECTED = [(1000, 'like', MY_POST), (1003, 'repost', MY_POST),
+            (1004, 'follow', None), (1007, 'reply', MY_POST),
+            (1008, 'quote', MY_POST), (1009, 'mention', None)]
+
+
+class FrameServer:
+    '''A local stand-in for Jetstream that replays the recorded frames from the
+       cursor requested, running its own event loop in a thread. Each connection
+       closes after drop_after frames if set.'''
+    def __init__(self, frames, drop_after=None):
+        self.frames = frames
+        self.drop_after = drop_after
+        self.paths = []
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.stop = None
+        self.port = None
+        self.thread = threading.Thread(target=self.loop.run_until_complete,
+                                       args=(self.serve(),), daemon=True)
+
+    async def handler(self, websocket):
+        '''Replay the frames from the cursor'''
+        self.paths.append(websocket.request.path)
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(
+                websocket.request.path).query)
+        cursor = int(query.get('cursor', [0])[0])
+        sent = 0
+        for frame in self.frames:
+            if frame['time_us'] >= cursor:
+                await websocket.send(json.dumps(frame))
+                sent += 1
+                if self.drop_after and sent >= self.drop_after:
+                    return
+        await websocket.wait_closed()
+
+    async def serve(self):
+        '''Serve until stopped'''
+        self.stop = asyncio.Event()
+        async with serve(self.handler, '127.0.0.1', 0) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.ready.set()
+            await self.stop.wait()
+
+    def __enter__(self):
+        self.thread.start()
+        self.ready.wait()
+        return f"ws://127.0.0.1:{self.port}/subscribe"
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.stop.set)
+        self.thread.join()
+        self.loop.close()
+
+
+async def take(agen, count):
+    '''Return the first count items of the given async generator'''
+    items = []
+    async for item in agen:
+        items.append(item)
+        if len(items) >= count:
+            break
+    await agen.aclose()
+    return items
+
+
+@pytest.mark.parametrize('frame, expected', [
+    (frame, next(((reason, subject) for time_us, reason, subject in EXPECTED
+                  if time_us == frame['time_us']), None))
+    for frame in FRAMES])
+def test_to_notification(frame, expected):
+    '''Test which messages notify the user'''
+    notif = jetstream.to_notification(frame, ME)
+    if expected:
+        assert (notif.reason, notif.subject_uri) == expected
+        assert notif.uri == f"at://{frame['did']}/{frame['commit']['collection']}/" \
+                            f"rkey{frame['time_us']}"
+        assert notif.created_at == '2024-11-28T09:15:42.123Z'
+    else:
+        assert notif is None
+
+
+def test_subscribe_url():
+    '''Test the collections and cursor are requested'''
+    stream = Jetstream('wss://example.com/subscribe', [jetstream.LIKE], cursor=12)
+    assert stream.subscribe_url() == \
+        'wss://example.com/subscribe?wantedCollections=app.bsky.feed.like&cursor=12'
+
+
+def test_notifications():
+    '''Test notifications are picked out of the replayed stream'''
+    with FrameServer(FRAMES) as url:
+        stream = Jetstream(url)
+        notifs = asyncio.run(take(stream.notifications(ME), len(EXPECTED)))
+    assert [(n.time_us, n.reason, n.subject_uri) for n in notifs] == EXPECTED
+    assert stream.cursor == 1009
+
+
+def test_reasons():
+    '''Test only notifications for the requested reasons are yielded'''
+    with FrameServer(FRAMES) as url:
+        notifs = asyncio.run(take(Jetstream(url).notifications(
+                ME, reasons=['follow', 'mention']), 2))
+    assert [n.reason for n in notifs] == ['follow', 'mention']
+
+
+def test_resume():
+    '''Test a dropped stream is resumed from the last message without repeats'''
+    with FrameServer(FRAMES, drop_after=4) as url:
+        start = time.monotonic()
+        notifs = asyncio.run(take(Jetstream(url, reconnect_delay=0)
+                                  .notifications(ME), len(EXPECTED)))
+    assert [(n.time_us, n.reason, n.subject_uri) for n in notifs] == EXPECTED
+    assert time.monotonic() - start < 1
+
+
+def test_resume_cursor():
+    '''Test reconnections ask for the stream from the last message'''
+    server = FrameServer(FRAMES, drop_after=5)
+    with server as url:
+        asyncio.run(take(Jetstream(url, reconnect_delay=0).events(), 9))
+    assert [urllib.parse.parse_qs(urllib.parse.urlparse(path).query).get('cursor')
+            for path in server.paths] == [None, ['1004']]
+
+
+class TestWatch:
+    '''Test the msg watch command'''
+    def command(self, url, output_format=outputformat.TEXT):
+        '''Return a MsgCmd that watches the given stream'''
+        bs = MagicMock()
+        bs.profile_did.return_value = ME
+        bs.get_profiles.side_effect = lambda dids: {
+                did: SimpleNamespace(handle=f"{did[8:]}.bsky.social",
+                                     display_name=None) for did in dids}
+        bs.at_uri_to_http_url.side_effect = lambda uri: f"https://{uri[5:]}"
+        config = MagicMock()
+        config.get.return_value = url
+        config.getint.return_value = AsyncBlueSky.MAX_CONCURRENCY
+        ns = SimpleNamespace(format=output_format, fields=None,
+                             cmd=Command('watch', func_args=lambda ns: ns.args))
+        return MsgCmd(bs, ns, config)
+
+    def test_watch(self, capsys):
+        '''Test notifications are printed as they arrive'''
+        with FrameServer(FRAMES) as url:
+            cmd = self.command(url)
+            cmd.ns.args = (['reply'], 1, None)
+            cmd.run()
+        assert capsys.readouterr().out.splitlines() == [
+            'Profile: @g.bsky.social',
+            'Profile Link: https://bsky.app/profile/g.bsky.social',
+            'Reason: reply',
+            f"Date: {dateparse.humanise_date_string('2024-11-28T09:15:42.123Z')}",
+            f"Post Link: https://{MY_POST[5:]}",
+            'Text: A reply',
+            '-----']
+
+    def test_watch_jsonl(self, capfd):
+        '''Test formatted notifications'''
+        with FrameServer(FRAMES) as url:
+            cmd = self.command(url, outputformat.JSONL)
+            cmd.ns.args = (None, 2, 1004)
+            cmd.run()
+        records = [json.loads(line) for line in capfd.readouterr().out.splitlines()]
+        assert [(r['author_handle'], r['reason'], r['time_us'])
+                for r in records] == [('e.bsky.social', 'follow', 1004),
+                                      ('g.bsky.social', 'reply', 1007)]
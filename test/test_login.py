@@ -5,6 +5,7 @@ import atproto_core
 import pytest
 from partial_failure import PartialFailure
 from bluesky import BlueSky
+from retry import Retrier
 
 # pylint: disable=W0201 (attribute-defined-outside-init)
 
@@ -21,7 +22,8 @@ class TestBlueSkyLogin:
 
         with pytest.raises(IOError):
             self.instance = BlueSky(handle='@testuser.bsky.social',
-                                    password='testpassword')
+                                    password='testpassword',
+                                    retrier=Retrier(base_delay=0))
             # Have to touch .client to have BlueSky() attempt to login
             assert self.instance.client
 
@@ -36,7 +38,8 @@ class TestBlueSkyLogin:
 
         handle = '@testuser.bsky.social'
         password = 'testpassword'
-        self.instance = BlueSky(handle=handle, password=password)
+        self.instance = BlueSky(handle=handle, password=password,
+                                retrier=Retrier(base_delay=0))
 
         assert self.instance
         # Have to touch .client to have BlueSky() attempt to login
@@ -0,0 +1,188 @@
+'''Output format tests'''
+
+import csv
+import io
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from atproto_client import models
+
+import outputformat
+from commandlineparser import Command
+from postcmd import PostCmd
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+
+
+def make_profile(i):
+    '''Return a profile view'''
+    return SimpleNamespace(handle=f"user{i}.bsky.social", did=f"did:plc:user{i}",
+                           display_name=f"User, \"{i}\"", created_at=None,
+                           description="Line one\nLine\ttwo")
+
+
+def make_post(i):
+    '''Return a post view'''
+    return SimpleNamespace(uri=f"at://did:plc:user{i}/app.bsky.feed.post/rkey{i}",
+                           author=make_profile(i), like_count=i, repost_count=0,
+                           reply_count=0, reply=None,
+                           record=SimpleNamespace(created_at="2024-11-28T09:15:42Z",
+                                                  text=f"Post {i}"))
+
+
+class Unrequested:
+    '''A record whose unrequested fields must not be extracted'''
+    handle = 'someone.bsky.social'
+
+    def __getattr__(self, name):
+        raise AssertionError(f"{name} was extracted")
+
+
+class TestFormatters:
+    '''Test the formatters'''
+    def formatter(self, output_format, fields=None):
+        '''Return a formatter writing to self.stream'''
+        self.stream = io.StringIO()
+        return outputformat.create(output_format, fields, self.stream)
+
+    def test_text(self):
+        '''Test commands print text themselves'''
+        assert outputformat.create(outputformat.TEXT) is None
+
+    def test_invalid_format(self):
+        '''Test an unknown format'''
+        with pytest.raises(ValueError):
+            outputformat.create('xml', stream=io.StringIO())
+
+    def test_jsonl(self):
+        '''Test each record is a JSON object on its own line'''
+        formatter = self.formatter(outputformat.JSONL)
+        for i in range(3):
+            formatter.write('post', make_post(i))
+        formatter.close()
+
+        lines = self.stream.getvalue().splitlines()
+        assert len(lines) == 3
+        record = json.loads(lines[1])
+        assert record['url'] == 'https://bsky.app/profile/did:plc:user1/post/rkey1'
+        assert record['author_display_name'] == 'User, "1"'
+        assert record['reply_root_uri'] is None
+        # Fields given by the command are only shown when given
+        assert 'follows' not in record
+
+    def test_requested_fields(self):
+        '''Test only the requested fields are extracted and written'''
+        formatter = self.formatter(outputformat.JSONL, ['handle'])
+        formatter.write('profile', Unrequested())
+        assert json.loads(self.stream.getvalue()) == \
+            {'handle': 'someone.bsky.social'}
+
+    def test_unknown_field(self):
+        '''Test requesting a field a record doesn't have'''
+        formatter = self.formatter(outputformat.CSV, ['handle', 'colour'])
+        with pytest.raises(ValueError, match='colour'):
+            formatter.write('profile', make_profile(1))
+
+    @pytest.mark.parametrize('output_format, delimiter',
+                             [(outputformat.CSV, ','), (outputformat.TSV, '\t')])
+    def test_csv(self, output_format, delimiter):
+        '''Test CSV and TSV rows round trip, with a header for each kind'''
+        formatter = self.formatter(output_format, None)
+        formatter.write('profile', make_profile(1))
+        formatter.write('profile', make_profile(2))
+        formatter.write('reposter', make_profile(3), count=2,
+                        post_uris=['at://a', 'at://b'])
+        formatter.close()
+
+        rows = list(csv.reader(io.StringIO(self.stream.getvalue()),
+                               delimiter=delimiter))
+        assert rows[0] == list(outputformat.FIELDS['profile'])
+        assert rows[2] == ['user2.bsky.social', 'did:plc:user2', 'User, "2"', '',
+                           'Line one\nLine\ttwo', 'https://bsky.app/profile/'
+                           'user2.bsky.social']
+        assert rows[3] == ['handle', 'did', 'display_name', 'count', 'post_uris']
+        assert rows[4][3:] == ['2', 'at://a at://b']
+        assert delimiter in self.stream.getvalue().splitlines()[0]
+
+
+class TestFormattedCommands:
+    '''Test commands write formatted records'''
+    def command(self, cls, name, output_format, fields=None):
+        '''Return a command object writing the given format'''
+        self.bs = MagicMock()
+        ns = SimpleNamespace(format=output_format, fields=fields,
+                             cmd=Command(name, func_args=lambda ns: ns.args))
+        return cls(self.bs, ns, None)
+
+    def test_gets(self, capfd):
+        '''Test streaming posts through the buffered stdout'''
+        cmd = self.command(PostCmd, 'gets', outputformat.JSONL, 'uri,like_count')
+        self.bs.get_posts.return_value = (make_post(i) for i in range(1000))
+        cmd.ns.args = (None, None, None, None)
+        cmd.run()
+
+        lines = capfd.readouterr().out.splitlines()
+        assert len(lines) == 1000
+        assert json.loads(lines[-1]) == \
+            {'uri': 'at://did:plc:user999/app.bsky.feed.post/rkey999',
+             'like_count': 999}
+
+    def test_get(self, capfd):
+        '''Test a post record, which has no repost or reply counts'''
+        cmd = self.command(PostCmd, 'get', outputformat.JSONL)
+        uri = 'at://did:plc:user1/app.bsky.feed.post/rkey1'
+        post = models.AppBskyFeedPost.GetRecordResponse(
+                uri=uri, cid='bafyreia',
+                value=models.AppBskyFeedPost.Record(
+                    text='Post 1', created_at='2024-11-28T09:15:42Z'))
+        post.likes = []
+        post.like_count = 0
+        self.bs.get_post.return_value = post
+        self.bs.get_profile.return_value = make_profile(1)
+        self.bs.at_uri_to_did_rkey.return_value = ('did:plc:user1', 'rkey1')
+        cmd.ns.args = (uri, None)
+        cmd.run()
+
+        record = json.loads(capfd.readouterr().out.splitlines()[0])
+        assert record['uri'] == uri
+        assert record['text'] == 'Post 1'
+        assert (record['like_count'], record['repost_count'],
+                record['reply_count']) == (0, None, None)
+
+    def test_likes(self, capfd):
+        '''Test likes refer to the post liked'''
+        cmd = self.command(PostCmd, 'likes', outputformat.TSV)
+        self.bs.get_post_likes.return_value = [
+            SimpleNamespace(actor=make_profile(1), created_at='2024-11-28')]
+        cmd.ns.args = ('at://post', False)
+        cmd.run()
+
+        assert capfd.readouterr().out.splitlines() == \
+            ['handle\tdid\tdisplay_name\tcreated_at\tpost_uri',
+             'user1.bsky.social\tdid:plc:user1\t"User, ""1"""\t2024-11-28\tat://post']
+
+    def test_search(self, capfd):
+        '''Test the follow details of searched posts'''
+        cmd = self.command(PostCmd, 'search', outputformat.CSV,
+                           'author_handle,follows,follower')
+        self.bs.search.return_value = [(make_post(1), {'user1.bsky.social'},
+                                        {'other.bsky.social'})]
+        cmd.ns.args = [SimpleNamespace(term='t', author=None, date_limit=None,
+                                       sort_order='top', is_follow=None,
+                                       is_follower=None)]
+        cmd.run()
+
+        assert capfd.readouterr().out.splitlines() == \
+            ['author_handle,follows,follower', 'user1.bsky.social,True,False']
+
+    def test_text(self, capsys):
+        '''Test the text output is unchanged'''
+        cmd = self.command(PostCmd, 'likes', outputformat.TEXT)
+        self.bs.get_post_likes.return_value = [
+            SimpleNamespace(actor=make_profile(1), created_at='2024-11-28')]
+        cmd.ns.args = ('at://post', False)
+        cmd.run()
+
+        assert capsys.readouterr().out == 'Liked By: User, "1" @user1.bsky.social\n'
@@ -0,0 +1,125 @@
+'''Read-ahead paginator tests'''
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from paginate import Paginator
+
+# pylint: disable=W0212 (protected-access)
+
+TIMEOUT = 5
+
+
+class Pages:
+    '''A list of the given number of pages'''
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.fetched = []
+        self.changed = threading.Condition()
+
+    def fetch(self, cursor):
+        '''Return the page at the given cursor'''
+        index = int(cursor or 0)
+        if index == self.fail_at:
+            raise IOError("Mocked")
+        with self.changed:
+            self.fetched.append(index)
+            self.changed.notify_all()
+        return SimpleNamespace(items=[index],
+                               cursor=str(index + 1) if index + 1 < self.count
+                               else None)
+
+    def wait_fetched(self, count):
+        '''Wait until the given number of pages have been fetched'''
+        with self.changed:
+            assert self.changed.wait_for(lambda: len(self.fetched) >= count,
+                                         TIMEOUT)
+
+
+def read_ahead_threads():
+    '''Return the read-ahead threads that are running'''
+    return [t for t in threading.enumerate() if t.name == 'paginator']
+
+
+@pytest.mark.parametrize('read_ahead', [0, 1, 3])
+def test_pages(read_ahead):
+    '''Test every page is yielded in order'''
+    pages = Pages(5)
+    with Paginator(pages.fetch, read_ahead=read_ahead) as paginator:
+        assert [rsp.items[0] for rsp in paginator] == [0, 1, 2, 3, 4]
+    assert pages.fetched == [0, 1, 2, 3, 4]
+
+
+def test_cursor():
+    '''Test pagination starts at the given cursor'''
+    pages = Pages(5)
+    assert [rsp.items[0] for rsp in Paginator(pages.fetch, cursor='3')] == [3, 4]
+
+
+def test_overlap():
+    '''Test the next pages are fetched while the caller works on a page'''
+    pages = Pages(6)
+    with Paginator(pages.fetch, read_ahead=2) as paginator:
+        for rsp in paginator:
+            # Both pages ahead are fetched before we take the next one
+            pages.wait_fetched(min(rsp.items[0] + 3, 6))
+
+
+def test_bounded():
+    '''Test the read-ahead stays at most read_ahead pages ahead of the caller'''
+    pages = Pages(20)
+    with Paginator(pages.fetch, read_ahead=2) as paginator:
+        for consumed, _ in enumerate(paginator, 1):
+            pages.wait_fetched(min(consumed + 2, 20))
+            assert len(pages.fetched) == min(consumed + 2, 20)
+
+
+def test_stop_early():
+    '''Test the read-ahead stops when the caller stops'''
+    pages = Pages(1000)
+    with Paginator(pages.fetch, read_ahead=2) as paginator:
+        for rsp in paginator:
+            if rsp.items[0] == 3:
+                pages.wait_fetched(6)
+                break
+    assert paginator._thread is None
+    assert not read_ahead_threads()
+    # The 4 pages taken and the 2 ahead, none once it's closed
+    assert len(pages.fetched) == 6
+
+
+def test_generator_closed():
+    '''Test closing a generator that's iterating the pages stops the read-ahead'''
+    pages = Pages(1000)
+
+    def items():
+        with Paginator(pages.fetch, read_ahead=2) as paginator:
+            for rsp in paginator:
+                yield from rsp.items
+
+    gen = items()
+    assert next(gen) == 0
+    gen.close()
+    assert not read_ahead_threads()
+    assert len(pages.fetched) <= 3
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_exception(read_ahead):
+    '''Test an exception fetching a page is raised when that page is reached'''
+    pages = Pages(5, fail_at=2)
+    seen = []
+    with pytest.raises(IOError):
+        with Paginator(pages.fetch, read_ahead=read_ahead) as paginator:
+            for rsp in paginator:
+                seen.extend(rsp.items)
+    assert seen == [0, 1]
+
+
+def test_invalid_read_ahead():
+    '''Test the read-ahead depth is checked'''
+    with pytest.raises(ValueError):
+        Paginator(Pages(1).fetch, read_ahead=-1)
@@ -0,0 +1,176 @@
+'''Post store and incremental author feed sync tests'''
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from atproto import models
+
+from async_bluesky import AsyncBlueSky
+from base_test import BaseTest
+from bluesky import ALL_POST, ORIGINAL_POST
+from poststore import PostStore
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+# pylint: disable=W0212 (protected-access)
+
+HANDLE = 'testuser.bsky.social'
+DID = 'did:plc:testuser'
+
+
+def make_view(day, repost=False, likes=0):
+    '''Return a feed view of a post made at midnight UTC on the given day of
+       November 2024, or a repost made then of someone else's post'''
+    date = f"2024-11-{day:02d}T00:00:00.000Z"
+    did, handle = ('did:plc:other', 'other.bsky.social') if repost else (DID, HANDLE)
+    reason = models.AppBskyFeedDefs.ReasonRepost(
+            by=models.AppBskyActorDefs.ProfileViewBasic(did=DID, handle=HANDLE),
+            indexed_at=date) if repost else None
+    return models.AppBskyFeedDefs.FeedViewPost(
+            post=models.AppBskyFeedDefs.PostView(
+                uri=f"at://{did}/app.bsky.feed.post/day{day}", cid='cid',
+                author=models.AppBskyActorDefs.ProfileViewBasic(did=did,
+                                                                handle=handle),
+                record=models.AppBskyFeedPost.Record(text=f"Day {day}",
+                                                     created_at=date),
+                indexed_at=date, like_count=likes),
+            reason=reason)
+
+
+class TestPostStore(BaseTest):
+    '''Test syncing author feeds to the post store'''
+    PAGE_SIZE = 2
+
+    @pytest.fixture(autouse=True)
+    def setup_store(self, setup, tmp_path):
+        '''Give the BlueSky instance a post store and an author feed of posts
+           made every other day'''
+        self.store = PostStore(str(tmp_path / 'posts.sqlite'))
+        self.instance._post_store = self.store
+        self.instance.resolver.put(HANDLE, DID)
+        self.feed = [make_view(day) for day in (9, 7, 5, 3, 1)]
+        self.pages = []
+        self.fail_at = None
+        self.instance.client.get_author_feed.side_effect = self.get_author_feed
+
+    def get_author_feed(self, actor, cursor=None):
+        '''Return a page of the author feed'''
+        assert actor == HANDLE
+        start = int(cursor or 0)
+        if self.fail_at is not None and start >= self.fail_at:
+            raise IOError("Giving up")
+        self.pages.append(start)
+        end = start + self.PAGE_SIZE
+        return SimpleNamespace(feed=self.feed[start:end],
+                               cursor=str(end) if end < len(self.feed) else None)
+
+    def texts(self, **kwargs):
+        '''Return the texts of the posts returned by get_posts()'''
+        return [post.record.text for post in self.instance.get_posts(**kwargs)]
+
+    def test_since_last(self):
+        '''Test only new posts are returned, fetching only newer pages'''
+        assert self.texts(since_last=True) == \
+            ['Day 9', 'Day 7', 'Day 5', 'Day 3', 'Day 1']
+        assert self.pages == [0, 2, 4]
+
+        self.pages.clear()
+        assert not self.texts(since_last=True)
+        assert self.pages == [0]
+
+        self.feed[:0] = [make_view(day) for day in (15, 13, 11)]
+        self.pages.clear()
+        assert self.texts(since_last=True) == ['Day 15', 'Day 13', 'Day 11']
+        assert self.pages == [0, 2]
+        assert self.store.get_state(DID).newest_uri == \
+            f"at://{DID}/app.bsky.feed.post/day15"
+
+    def test_stored_then_since_last(self):
+        '''Test syncing for stored posts doesn't move the since_last checkpoint'''
+        assert self.texts(since_last=True) == \
+            ['Day 9', 'Day 7', 'Day 5', 'Day 3', 'Day 1']
+
+        self.feed[:0] = [make_view(day) for day in (13, 11)]
+        assert self.texts(stored=True) == \
+            ['Day 13', 'Day 11', 'Day 9', 'Day 7', 'Day 5', 'Day 3', 'Day 1']
+        assert self.texts(since_last=True) == ['Day 13', 'Day 11']
+        assert not self.texts(since_last=True)
+
+    def test_stored(self):
+        '''Test stored posts are filtered and limited like fetched posts'''
+        self.feed.insert(1, make_view(8, repost=True))
+        fetched = self.texts(date_limit_str='2024-11-04', post_filter=ALL_POST)
+        self.pages.clear()
+
+        assert self.texts(date_limit_str='2024-11-04', post_filter=ALL_POST,
+                          stored=True) == fetched == ['Day 9', 'Day 8', 'Day 7',
+                                                      'Day 5']
+        assert self.texts(stored=True, post_filter=ORIGINAL_POST,
+                          date_limit_str='2024-11-04', count_limit=2) == \
+            ['Day 9', 'Day 7']
+        reposted = list(self.instance.get_posts(stored=True, post_filter=ALL_POST,
+                                                date_limit_str='2024-11-04'))[1]
+        assert reposted.repost_date == '2024-11-08T00:00:00.000Z'
+        # The first sync went back to the date limit, the others only fetched the
+        # newest page
+        assert self.pages == [0, 2, 4, 0, 0]
+
+    def test_older_date_limit(self):
+        '''Test a date limit older than the stored feed fetches back to it'''
+        assert self.texts(stored=True, date_limit_str='2024-11-06') == \
+            ['Day 9', 'Day 7']
+        self.pages.clear()
+
+        assert self.texts(stored=True, date_limit_str='2024-11-02') == \
+            ['Day 9', 'Day 7', 'Day 5', 'Day 3']
+        assert self.pages == [0, 2, 4]
+        self.pages.clear()
+
+        assert self.texts(stored=True, date_limit_str='2024-11-04') == \
+            ['Day 9', 'Day 7', 'Day 5']
+        assert self.pages == [0]
+
+    def test_refresh(self):
+        '''Test the refresh period updates the counts of recent posts'''
+        self.store.refresh = 3 * 86400
+        self.instance.sync_posts()
+        self.feed[1] = make_view(7, likes=5)
+        self.feed[2] = make_view(5, likes=5)
+        self.pages.clear()
+
+        assert [post.like_count for post in self.instance.get_posts(stored=True)] \
+            == [0, 5, 0, 0, 0]
+        assert self.pages == [0, 2]
+
+    def test_interrupted(self):
+        '''Test an interrupted sync doesn't move the checkpoint'''
+        self.fail_at = 2
+        with pytest.raises(IOError):
+            self.instance.sync_posts()
+        assert self.store.get_state(DID) is None
+
+        self.fail_at = None
+        assert self.instance.sync_posts() is None
+        assert len(list(self.store.views(DID))) == 5
+
+    def test_async_stored(self):
+        '''Test the async get_posts() reads stored posts too'''
+        async_bs = AsyncBlueSky(self.instance)
+        try:
+            posts = list(async_bs.iterate(async_bs.get_posts(stored=True)))
+        finally:
+            async_bs.close()
+        assert [post.record.text for post in posts] == \
+            ['Day 9', 'Day 7', 'Day 5', 'Day 3', 'Day 1']
+
+    def test_no_store(self):
+        '''Test syncing without a configured post store'''
+        self.instance._post_store = None
+        with pytest.raises(ValueError):
+            self.texts(since_last=True)
+
+    def test_unknown_user(self):
+        '''Test syncing the feed of a user that doesn't exist'''
+        with patch.object(self.instance, 'profile_did', return_value=None):
+            with pytest.raises(ValueError):
+                self.instance.sync_posts('nobody')
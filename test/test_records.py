@@ -0,0 +1,95 @@
+'''Lean record tests'''
+
+import io
+from types import SimpleNamespace
+
+import pytest
+
+import benchmark
+import outputformat
+from base_test import BaseTest
+from records import LikeLite, PostLite, ProfileLite
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+
+
+def test_slots():
+    '''Test the records have no per instance dict'''
+    for record in (ProfileLite(did='did:plc:a', handle='a.bsky.social'),
+                   PostLite(uri='at://a', created_at='2024-11-28T09:15:42Z',
+                            text='Text'),
+                   LikeLite(created_at='2024-11-28T09:15:42Z')):
+        assert not hasattr(record, '__dict__')
+        with pytest.raises(AttributeError):
+            record.other = 1
+
+
+def test_fields():
+    '''Test records are created from their fields and their values'''
+    profile = ProfileLite(did='did:plc:a', handle='a.bsky.social')
+    assert profile.values() == ['did:plc:a', 'a.bsky.social', None, None, None]
+    assert ProfileLite.from_values(profile.values()).handle == 'a.bsky.social'
+    with pytest.raises(TypeError):
+        ProfileLite(did='did:plc:a', name='a')
+
+
+def test_from_models():
+    '''Test the fields the commands print are taken from the models'''
+    profile = ProfileLite.from_profile(benchmark.model_profile(7))
+    assert (profile.did, profile.handle, profile.display_name, profile.description) \
+        == ('did:plc:' + '7'.zfill(24), 'user7.bsky.social', 'User 7',
+            'The profile of user 7')
+
+    model = benchmark.model_post(3)
+    model.reply = SimpleNamespace(root=SimpleNamespace(uri='at://root'))
+    model.repost_date = '2024-12-01T00:00:00Z'
+    post = PostLite.from_post(model)
+    assert (post.uri, post.author.handle, post.record.text, post.record.created_at,
+            post.like_count, post.reply.root.uri, post.repost_date) == \
+        (model.uri, 'user3.bsky.social', 'Post number 3', model.record.created_at,
+         3, 'at://root', '2024-12-01T00:00:00Z')
+    assert PostLite.from_post(post) is post
+
+    like = LikeLite.from_like(benchmark.model_like(5))
+    assert (like.actor.handle, like.created_at) == \
+        ('user5.bsky.social', benchmark.model_like(5).created_at)
+
+
+@pytest.mark.parametrize('kind, model, lean', [
+    ('profile', benchmark.model_profile(1), ProfileLite.from_profile),
+    ('post', benchmark.model_post(2), PostLite.from_post),
+    ('like', benchmark.model_like(3), LikeLite.from_like)])
+def test_formatted(kind, model, lean):
+    '''Test a lean record is formatted the same as its model'''
+    stream = io.StringIO()
+    formatter = outputformat.create(outputformat.JSONL, stream=stream)
+    formatter.write(kind, model)
+    formatter.write(kind, lean(model))
+    formatter.flush()
+    first, second = stream.getvalue().splitlines()
+    assert first == second
+
+
+class TestLean(BaseTest):
+    '''Test the generators' lean mode'''
+    def test_get_mutuals(self):
+        '''Test lean mutuals are ProfileLite records'''
+        follows = [benchmark.model_profile(i) for i in range(4)]
+        followers = [benchmark.model_profile(i) for i in range(2, 6)]
+        self.instance.client.get_follows.return_value = SimpleNamespace(
+                follows=follows, cursor=None)
+        self.instance.client.get_followers.return_value = SimpleNamespace(
+                followers=followers, cursor=None)
+        mutuals = list(self.instance.get_mutuals('someone.bsky.social', 'both',
+                                                 lean=True))
+        assert sorted(p.handle for p in mutuals) == ['user2.bsky.social',
+                                                     'user3.bsky.social']
+        assert all(isinstance(p, ProfileLite) for p in mutuals)
+
+    def test_get_post_likes(self):
+        '''Test lean likes are LikeLite records'''
+        self.instance.client.get_likes.return_value = SimpleNamespace(
+                likes=[benchmark.model_like(1)], cursor=None)
+        [like] = self.instance.get_post_likes('at://post', lean=True)
+        assert isinstance(like, LikeLite)
+        assert like.actor.handle == 'user1.bsky.social'
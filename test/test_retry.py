@@ -0,0 +1,166 @@
+'''Retrier tests'''
+
+import asyncio
+import configparser
+import time
+from unittest.mock import MagicMock
+
+import atproto_client
+import atproto_core
+import pytest
+
+from partial_failure import PartialFailure
+from retry import CircuitBreaker, CircuitOpenError, Retrier, RetryPolicy
+
+# pylint: disable=W0201 (attribute-defined-outside-init)
+
+
+def rate_limit_error(headers):
+    '''Create a 429 error with the given response headers'''
+    response = MagicMock()
+    response.status_code = 429
+    response.headers = headers
+    return atproto_client.exceptions.RequestException(response)
+
+
+class TestRetrier:
+    '''Test the Retrier class'''
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        '''Create a Retrier that doesn't wait between attempts'''
+        self.errors = []
+        self.retrier = Retrier(max_attempts=5, base_delay=0,
+                               on_error=self.errors.append)
+
+    def test_call_succeeds(self):
+        '''Test the result is returned without retries'''
+        fn = MagicMock(return_value=42)
+        assert self.retrier.call(fn, 1, key='value') == 42
+        fn.assert_called_once_with(1, key='value')
+        assert not self.errors
+
+    def test_call_partial_failure(self):
+        '''Test failures are retried until the call succeeds'''
+        fn = MagicMock(side_effect=PartialFailure(5, 42))
+        assert self.retrier.call(fn) == 42
+        assert fn.call_count == 5
+        assert len(self.errors) == 4
+
+    def test_call_exception_limit(self):
+        '''Test IOError is raised after max_attempts failures'''
+        fn = MagicMock(side_effect=atproto_core.exceptions.AtProtocolError('Mocked'))
+        with pytest.raises(IOError, match='Giving up'):
+            self.retrier.call(fn)
+        assert fn.call_count == 5
+
+    @pytest.mark.parametrize('ex', [
+        atproto_client.exceptions.BadRequestError(MagicMock()),
+        atproto_client.exceptions.UnauthorizedError(MagicMock()),
+        atproto_client.exceptions.ModelError('Mocked')])
+    def test_call_not_retried(self, ex):
+        '''Test errors that won't succeed if repeated are raised immediately'''
+        fn = MagicMock(side_effect=ex)
+        with pytest.raises(type(ex)):
+            self.retrier.call(fn)
+        assert fn.call_count == 1
+        # They're the caller's to handle, not logged or counted as failures
+        assert not self.errors
+        assert self.retrier.breaker.failures == 0
+
+    def test_call_non_atproto_exception(self):
+        '''Test non atproto exceptions aren't retried'''
+        fn = MagicMock(side_effect=ValueError('Mocked'))
+        with pytest.raises(ValueError):
+            self.retrier.call(fn)
+        assert fn.call_count == 1
+        assert not self.errors
+
+    def test_call_async(self):
+        '''Test async calls are retried'''
+        attempts = PartialFailure(3, 42)
+
+        async def fn():
+            return attempts()
+        assert asyncio.run(self.retrier.call_async(fn)) == 42
+        assert attempts.num_exceptions == 3
+
+    def test_rate_limit_reset(self):
+        '''Test rate limited requests wait until the reset time'''
+        ex = rate_limit_error({'ratelimit-reset': str(time.time() + 10)})
+        assert 9 < self.retrier.rate_limit_delay(ex) <= 10
+
+    def test_rate_limit_retry_after(self):
+        '''Test the retry-after header is used if there is no reset time'''
+        assert self.retrier.rate_limit_delay(
+            rate_limit_error({'retry-after': '7'})) == 7
+
+    def test_rate_limit_capped(self):
+        '''Test the rate limit wait is capped'''
+        self.retrier.max_rate_limit_wait = 5
+        ex = rate_limit_error({'ratelimit-reset': str(time.time() + 3600)})
+        assert self.retrier.rate_limit_delay(ex) == 5
+
+    def test_rate_limit_no_headers(self):
+        '''Test rate limits without a reset time use the normal backoff'''
+        assert self.retrier.rate_limit_delay(rate_limit_error({})) is None
+        assert self.retrier.rate_limit_delay(
+            atproto_core.exceptions.AtProtocolError('Mocked')) is None
+
+    def test_backoff_bounds(self):
+        '''Test the backoff grows exponentially up to the maximum delay'''
+        policy = RetryPolicy(base_delay=1, max_delay=8)
+        for attempt, limit in enumerate([1, 2, 4, 8, 8, 8]):
+            for _ in range(20):
+                assert 0 <= policy.delay(attempt) <= limit
+
+    def test_from_config(self):
+        '''Test the [retry] config section'''
+        config = configparser.ConfigParser()
+        config.read_string('[retry]\nmax_attempts = 3\nmax_delay = 2\n'
+                           'breaker_threshold = 4\n')
+        retrier = Retrier.from_config(config)
+        policy = retrier.policy(atproto_core.exceptions.AtProtocolError('Mocked'))
+        assert policy.max_attempts == 3
+        assert policy.max_delay == 2
+        assert retrier.breaker.threshold == 4
+
+
+class TestCircuitBreaker:
+    '''Test the CircuitBreaker class'''
+    def test_opens_after_threshold(self):
+        '''Test requests fail immediately once the circuit is open'''
+        retrier = Retrier(max_attempts=3, base_delay=0,
+                          breaker=CircuitBreaker(threshold=5, cooldown=60))
+        fn = MagicMock(side_effect=atproto_core.exceptions.AtProtocolError('Mocked'))
+        with pytest.raises(IOError):
+            retrier.call(fn)
+        with pytest.raises(CircuitOpenError):
+            retrier.call(fn)
+        assert fn.call_count == 5
+
+        # A success before the threshold resets the count
+        fn = MagicMock(side_effect=PartialFailure(3, 42))
+        retrier.breaker.success()
+        assert retrier.call(fn) == 42
+        assert retrier.breaker.failures == 0
+
+    def test_half_open(self):
+        '''Test a trial request is allowed after the cooldown'''
+        breaker = CircuitBreaker(threshold=2, cooldown=0.01)
+        breaker.failure()
+        breaker.failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+        time.sleep(0.02)
+        breaker.check()
+        # The trial failed, the circuit re-opens
+        breaker.failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+        time.sleep(0.02)
+        breaker.check()
+        breaker.success()
+        breaker.check()
+        assert breaker.failures == 0
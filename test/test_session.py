@@ -0,0 +1,211 @@
+'''Test saving and resuming the authenticated session between runs'''
+import json
+import os
+import stat
+from unittest.mock import patch, MagicMock
+
+import atproto
+import atproto_core
+import httpx
+import pytest
+from atproto_client.client.session import Session
+
+from async_bluesky import AsyncBlueSky
+from bluesky import BlueSky
+from cassette import replay_token
+from retry import Retrier
+from session import SessionFile
+from transport import Transport
+
+# pylint: disable=W0212 (protected-access)
+
+
+class TestSessionFile:
+    '''Test the SessionFile class'''
+    def test_load_missing(self, tmp_path):
+        '''No saved session returns None'''
+        assert SessionFile(tmp_path / "session").load() is None
+
+    def test_save_load(self, tmp_path):
+        '''A saved session is loaded back and only readable by the user'''
+        path = tmp_path / "session"
+        SessionFile(path).save("first:::session")
+        SessionFile(path).save("second")
+
+        assert SessionFile(path).load() == "second"
+        assert stat.S_IMODE(os.stat(path).st_mode) == SessionFile.MODE
+
+    def test_save_tightens_permissions(self, tmp_path):
+        '''An existing world readable file has its permissions restricted'''
+        path = tmp_path / "session"
+        path.write_text("old")
+        os.chmod(path, 0o644)
+
+        SessionFile(path).save("new")
+        assert stat.S_IMODE(os.stat(path).st_mode) == SessionFile.MODE
+
+    def test_clear(self, tmp_path):
+        '''Clearing removes the session, clearing twice is fine'''
+        path = tmp_path / "session"
+        SessionFile(path).save("session")
+        SessionFile(path).clear()
+        SessionFile(path).clear()
+        assert SessionFile(path).load() is None
+
+
+class TestBlueSkyResumeSession:
+    '''Test BlueSky resuming a saved session instead of logging in'''
+    HANDLE = '@testuser.bsky.social'
+
+    @pytest.fixture
+    def session_path(self, tmp_path):
+        '''Path of a session file containing a saved session'''
+        path = tmp_path / "session"
+        SessionFile(path).save("saved session")
+        return path
+
+    @staticmethod
+    def saved_session(handle='testuser.bsky.social'):
+        '''Mock the session imported from the session file'''
+        saved = MagicMock()
+        saved.handle = handle
+        saved.did = 'did:plc:testuser'
+        return saved
+
+    @patch('atproto.Client')
+    def test_resume_valid_session(self, mock_client, session_path):
+        '''An unexpired session is resumed without logging in or refreshing'''
+        client = mock_client.return_value
+        client._import_session_string.return_value = self.saved_session()
+        client._should_refresh_session.return_value = False
+
+        assert BlueSky(self.HANDLE, 'password', session_path=session_path).client
+        client._import_session_string.assert_called_once_with("saved session")
+        client._refresh_and_set_session.assert_not_called()
+        client.login.assert_not_called()
+
+    @patch('atproto.Client')
+    def test_resume_expired_session(self, mock_client, session_path):
+        '''An expired session is refreshed rather than logging in again'''
+        client = mock_client.return_value
+        client._import_session_string.return_value = self.saved_session()
+        client._should_refresh_session.return_value = True
+
+        assert BlueSky(self.HANDLE, 'password', session_path=session_path).client
+        client._refresh_and_set_session.assert_called_once()
+        client.login.assert_not_called()
+
+    @patch('atproto.Client')
+    def test_refresh_failure_logs_in(self, mock_client, session_path):
+        '''Fall back to logging in when the refresh fails'''
+        client = mock_client.return_value
+        client._import_session_string.return_value = self.saved_session()
+        client._should_refresh_session.return_value = True
+        client._refresh_and_set_session.side_effect = \
+            atproto_core.exceptions.AtProtocolError('Mocked Exception')
+
+        assert BlueSky(self.HANDLE, 'password', session_path=session_path).client
+        client.login.assert_called_once_with(self.HANDLE, 'password')
+
+    @patch('atproto.Client')
+    def test_other_users_session_logs_in(self, mock_client, session_path):
+        '''A session saved for a different user is not used'''
+        client = mock_client.return_value
+        client._import_session_string.return_value = \
+            self.saved_session('someoneelse.bsky.social')
+
+        assert BlueSky(self.HANDLE, 'password', session_path=session_path).client
+        client.login.assert_called_once_with(self.HANDLE, 'password')
+
+    @patch('atproto.Client')
+    def test_no_session_logs_in(self, mock_client, tmp_path):
+        '''Without a saved session we login'''
+        client = mock_client.return_value
+
+        assert BlueSky(self.HANDLE, 'password',
+                       session_path=tmp_path / "session").client
+        client._import_session_string.assert_not_called()
+        client.login.assert_called_once_with(self.HANDLE, 'password')
+
+    @pytest.mark.parametrize("event, saved", [(atproto.SessionEvent.CREATE, True),
+                                              (atproto.SessionEvent.REFRESH, True),
+                                              (atproto.SessionEvent.IMPORT, False)])
+    def test_session_change_saves(self, tmp_path, event, saved):
+        '''New and refreshed sessions are saved, imported ones aren't rewritten'''
+        path = tmp_path / "session"
+        instance = BlueSky(self.HANDLE, 'password', session_path=path)
+        new_session = MagicMock()
+        new_session.export.return_value = "new session"
+
+        instance._session_changed_callback()(event, new_session)
+        assert (SessionFile(path).load() == "new session") == saved
+
+
+class MockTransport(Transport):
+    '''Transport settings that send requests to the given fake server'''
+    def __init__(self, server):
+        super().__init__()
+        self.server = server
+
+    def http_transport(self):
+        return httpx.MockTransport(self.server)
+
+    def async_http_transport(self):
+        return httpx.MockTransport(self.server)
+
+
+def save_session(path, did, token):
+    '''Save a session of the given user DID and token in the given file'''
+    SessionFile(path).save(Session('testuser.bsky.social', did, token, token,
+                                   'https://bsky.social').encode())
+
+
+def test_resume_then_post(tmp_path):
+    '''Test a resumed session can post without logging in, to the user's repo'''
+    did = 'did:plc:testuser'
+    token = replay_token({'scope': 'com.atproto.access', 'sub': did,
+                          'iat': 1700000000})
+    path = tmp_path / "session"
+    save_session(path, did, token)
+    requests = []
+
+    def server(request):
+        requests.append(request)
+        assert request.url.path == '/xrpc/com.atproto.repo.createRecord'
+        assert json.loads(request.content)['repo'] == did
+        return httpx.Response(200, json={
+            'uri': f"at://{did}/app.bsky.feed.post/3kabc", 'cid': 'bafyreia'})
+
+    instance = BlueSky('testuser.bsky.social', 'password', session_path=path,
+                       retrier=Retrier(max_attempts=1, base_delay=0),
+                       transport=MockTransport(server))
+    assert instance.post_text('Hello') == f"at://{did}/app.bsky.feed.post/3kabc"
+    assert len(requests) == 1
+
+
+def test_async_refresh_saves(tmp_path):
+    '''Test a session refreshed by the async client is saved for the next run'''
+    did = 'did:plc:testuser'
+    token = replay_token({'scope': 'com.atproto.access', 'sub': did,
+                          'iat': 1700000000})
+    new_token = replay_token({'scope': 'com.atproto.access', 'sub': did,
+                              'iat': 1700000001})
+    path = tmp_path / "session"
+    save_session(path, did, token)
+
+    def server(request):
+        assert request.url.path == '/xrpc/com.atproto.server.refreshSession'
+        return httpx.Response(200, json={
+            'accessJwt': new_token, 'refreshJwt': new_token,
+            'handle': 'testuser.bsky.social', 'did': did})
+
+    instance = BlueSky('testuser.bsky.social', 'password', session_path=path,
+                       retrier=Retrier(max_attempts=1, base_delay=0),
+                       transport=MockTransport(server))
+    async_instance = AsyncBlueSky(instance)
+    try:
+        client = async_instance.run(async_instance.client())
+        async_instance.run(client._refresh_and_set_session())
+    finally:
+        async_instance.close()
+    assert Session.decode(SessionFile(path).load()).access_jwt == new_token
@@ -0,0 +1,33 @@
+'''SQLite store base class tests'''
+
+import pytest
+
+from sqlitestore import SQLiteStore
+
+
+class Store(SQLiteStore):
+    '''A store of one table'''
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY)",)
+
+
+def test_schema(tmp_path):
+    '''Test the schema is created in WAL mode, and only once'''
+    path = str(tmp_path / 'store.sqlite')
+    store = Store(path)
+    with store._connect() as db:     # pylint: disable=W0212 (protected-access)
+        db.execute("INSERT INTO items VALUES ('a')")
+    store = Store(path)
+    with store._connect() as db:     # pylint: disable=W0212 (protected-access)
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert db.execute("SELECT name FROM items").fetchall() == [('a',)]
+
+
+def test_rollback(tmp_path):
+    '''Test a connection that fails isn't committed'''
+    store = Store(str(tmp_path / 'store.sqlite'))
+    with pytest.raises(ValueError):
+        with store._connect() as db:     # pylint: disable=W0212 (protected-access)
+            db.execute("INSERT INTO items VALUES ('a')")
+            raise ValueError("Mocked")
+    with store._connect() as db:     # pylint: disable=W0212 (protected-access)
+        assert not db.execute("SELECT name FROM items").fetchall()
@@ -0,0 +1,53 @@
+'''Startup import time tests'''
+
+import sys
+
+import pytest
+
+import startup
+
+# The modules bs.py imports at startup, except usercmd which needs Python 3.12
+BS_MODULES = ('bluesky, cleanup, commandlineparser, graphcache, handles, images, '
+              'jetstream, lazyimport, outputformat, poststore, profilecache, retry, '
+              'postcmd, likecmd, msgcmd, repocmd, shared, dateparse, wcwidth')
+
+
+def test_parse_importtime():
+    '''Test -X importtime output is parsed'''
+    imports = startup.parse_importtime(
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       185 |        185 |     atproto_core\n'
+        'import time:       303 |        488 |   atproto_core.exceptions\n'
+        'import time:      2994 |      36464 | retry\n'
+        'usage: bs.py\n')
+    assert [(i.name, i.self_us, i.cumulative_us, i.depth) for i in imports] == [
+        ('atproto_core', 185, 185, 2), ('atproto_core.exceptions', 303, 488, 1),
+        ('retry', 2994, 36464, 0)]
+
+
+def test_deferred():
+    '''Test the slow modules aren't imported until a command needs them'''
+    _, imports = startup.measure(['-c', f"import {BS_MODULES}"], repeat=1)
+    assert not startup.deferred_imports(imports)
+    assert 'bluesky' in {i.name for i in imports}
+
+
+def test_lazy_import():
+    '''Test a deferred module is loaded when it's first used'''
+    _, imports = startup.measure(
+            ['-c', 'import dateparse; dateparse.parse("2024-11-05")'], repeat=1)
+    assert startup.deferred_imports(imports) == ['dateutil.parser', 'dateutil.tz',
+                                                 'tzlocal']
+
+
+def test_budget():
+    '''Test the modules bs.py imports at startup load within the budget, on any
+       Python version'''
+    total, _ = startup.measure(['-c', f"import {BS_MODULES}"], repeat=3)
+    assert total / 1000 <= startup.DEFAULT_BUDGET_MS
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason='bs.py needs Python 3.12')
+def test_bs_budget():
+    '''Test bs.py --help starts within the budget'''
+    assert startup.main(['--repeat', '3']) == 0
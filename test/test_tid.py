@@ -0,0 +1,48 @@
+'''Test encoding and decoding of TIDs'''
+
+import datetime
+
+import pytest
+
+import tid
+
+
+class TestTid:
+    '''Test the tid module'''
+    def test_to_datetime(self):
+        '''Decode the example TID from the AT Protocol specification'''
+        assert tid.to_datetime("3jzfcijpj2z2a") == datetime.datetime(
+            2023, 6, 30, 15, 3, 1, 887007, tzinfo=datetime.timezone.utc)
+
+    @pytest.mark.parametrize("clock_id", [0, 1, 1023])
+    def test_round_trip(self, clock_id):
+        '''A datetime encoded as a TID decodes back to the same datetime'''
+        dt = datetime.datetime(2024, 5, 1, 12, 0, 0, 123456,
+                               tzinfo=datetime.timezone.utc)
+        value = tid.from_datetime(dt, clock_id)
+        assert tid.is_tid(value)
+        assert tid.to_datetime(value) == dt
+        assert tid.decode(value) & 0x3ff == clock_id
+
+    def test_sort_order(self):
+        '''TIDs sort in the same order as their datetimes'''
+        now = datetime.datetime.now(datetime.timezone.utc)
+        tids = [tid.from_datetime(now - datetime.timedelta(seconds=i))
+                for i in range(100)]
+        assert tids == sorted(tids, reverse=True)
+
+    @pytest.mark.parametrize("value", ["", "1", "3jzfcijpj2z2", "3jzfcijpj2z2aa",
+                                       "3jzfcijpj2z21", "zzzzzzzzzzzzz",
+                                       "3JZFCIJPJ2Z2A"])
+    def test_invalid(self, value):
+        '''Invalid TIDs raise ValueError'''
+        assert not tid.is_tid(value)
+        with pytest.raises(ValueError):
+            tid.to_datetime(value)
+
+    def test_rkey_to_datetime(self):
+        '''The datetime is read from the record key of an at:// URI'''
+        assert tid.rkey_to_datetime(
+            "at://did:plc:abc/app.bsky.feed.like/3jzfcijpj2z2a") == \
+            tid.to_datetime("3jzfcijpj2z2a")
+        assert tid.rkey_to_datetime("at://did:plc:abc/app.bsky.feed.like/1") is None
@@ -0,0 +1,56 @@
+'''timestamp module tests'''
+
+from datetime import datetime, timedelta, timezone
+
+import dateutil
+import pytest
+
+import timestamp
+
+
+class TestTimestamp:
+    '''Test timestamp parsing and date cutoffs'''
+    @pytest.mark.parametrize('value', [
+        '2024-11-28T09:15:42.123Z',
+        '2024-11-28T09:15:42Z',
+        '2024-11-28T09:15:42.123456+00:00',
+        '2024-11-28T09:15:42.1-05:00',
+        '2024-11-28T09:15:42.123456789Z',
+        '2024-11-28T09:15:42',
+        '2024-11-28',
+        '20241128T091542Z'])
+    def test_parse(self, value):
+        '''Test timestamps are parsed the same as dateutil's ISO parser'''
+        assert timestamp.parse(value) == dateutil.parser.isoparse(value)
+
+    def test_parse_invalid(self):
+        '''Test invalid timestamps raise ValueError'''
+        with pytest.raises(ValueError):
+            timestamp.parse('not a date')
+
+    def test_parse_memoized(self):
+        '''Test repeated timestamps are only parsed once'''
+        timestamp.parse.cache_clear()
+        for _ in range(3):
+            timestamp.parse('2024-11-28T09:15:42.123Z')
+        info = timestamp.parse.cache_info()
+        assert (info.hits, info.misses) == (2, 1)
+
+    @pytest.mark.parametrize('newer', [0, 1, 2, 7, 50, 63, 99, 100])
+    def test_cutoff(self, newer):
+        '''Test the cutoff is found by dating O(log n) items'''
+        now = datetime.now(timezone.utc)
+        items = [now - timedelta(minutes=i) for i in range(100)]
+        dated = []
+
+        def key(item):
+            dated.append(item)
+            return item
+
+        limit = now - timedelta(minutes=newer - 0.5)
+        assert timestamp.cutoff(items, limit, key) == newer
+        assert len(dated) <= 8
+
+    def test_cutoff_empty(self):
+        '''Test an empty page'''
+        assert timestamp.cutoff([], datetime.now(timezone.utc), lambda item: item) == 0
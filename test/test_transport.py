@@ -0,0 +1,128 @@
+'''HTTP transport settings tests'''
+
+import asyncio
+import configparser
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+import transport
+from bluesky import BlueSky
+from retry import Retrier
+from transport import Transport
+
+# pylint: disable=W0212 (protected-access)
+
+
+def make_config(text):
+    '''Return a config parsed from the given text'''
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    return config
+
+
+def test_from_config():
+    '''Test the settings are read from the [transport] section'''
+    settings = Transport.from_config(make_config('''
+[transport]
+max_connections = 16
+max_keepalive_connections = 8
+keepalive_expiry = 60
+http2 = no
+gzip = false
+connect_timeout = 2.5
+read_timeout = 20
+'''))
+    assert settings == Transport(16, 8, 60.0, False, False, 2.5, 20.0)
+
+
+def test_defaults():
+    '''Test the defaults are used without a [transport] section'''
+    assert Transport.from_config(make_config('')) == Transport()
+
+
+@pytest.mark.parametrize('kwargs', [{'max_connections': 0},
+                                    {'max_connections': 4,
+                                     'max_keepalive_connections': 5},
+                                    {'keepalive_expiry': 0},
+                                    {'read_timeout': -1}])
+def test_invalid(kwargs):
+    '''Test invalid settings are rejected'''
+    with pytest.raises(ValueError):
+        Transport(**kwargs)
+
+
+def test_request():
+    '''Test the atproto request's httpx client has the pool and timeouts'''
+    request = Transport(max_connections=7, max_keepalive_connections=3,
+                        keepalive_expiry=9, http2=False, connect_timeout=2,
+                        read_timeout=12).request()
+    client = request._client
+    assert client.timeout == httpx.Timeout(12, connect=2)
+    pool = client._transport._pool
+    assert (pool._max_connections, pool._max_keepalive_connections,
+            pool._keepalive_expiry, pool._http2) == (7, 3, 9, False)
+    client.close()
+
+
+def test_async_request():
+    '''Test the atproto async request only has our httpx client, so there's no
+       default client left unclosed'''
+    with patch.object(httpx, 'AsyncClient', wraps=httpx.AsyncClient) as client_class:
+        request = Transport(read_timeout=12).async_request()
+    assert client_class.call_count == 1
+    assert request._client.timeout == httpx.Timeout(12, connect=5)
+    assert request._additional_headers == {}
+    asyncio.run(request.close())
+    assert request._client.is_closed
+
+
+@pytest.mark.parametrize('gzip, encoding', [(True, 'gzip, deflate'),
+                                            (False, 'identity')])
+def test_gzip(gzip, encoding):
+    '''Test compressed responses are asked for unless gzip is off'''
+    sent = []
+
+    def server(request):
+        sent.append(request)
+        return httpx.Response(200, json={})
+
+    request = Transport(gzip=gzip).request(httpx.MockTransport(server))
+    request.get('https://bsky.social/xrpc/app.bsky.actor.getProfile')
+    assert sent[0].headers['accept-encoding'] == encoding
+
+
+def test_http2_unavailable():
+    '''Test HTTP/2 is only used when the h2 package is installed'''
+    with patch.object(transport.importlib.util, 'find_spec', return_value=None):
+        assert not Transport(http2=True).http2_available()
+    assert not Transport(http2=False).http2_available()
+
+
+def test_client_shared():
+    '''Test threads that need the client at the same time share one client'''
+    with patch('atproto.Client') as client_class:
+        def login(*_):
+            time.sleep(0.05)
+        client_class.return_value.login.side_effect = login
+        bs = BlueSky('testuser.bsky.social', 'password',
+                     retrier=Retrier(base_delay=0),
+                     transport=Transport(max_connections=4,
+                                         max_keepalive_connections=4))
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(bs.client))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert client_class.call_count == 1
+    assert client_class.return_value.login.call_count == 1
+    assert len(clients) == 4
+    assert all(client is client_class.return_value for client in clients)
+    request = client_class.call_args.kwargs['request']
+    assert request._client._transport._pool._max_connections == 4
@@ -0,0 +1,72 @@
+"""Encode and decode AT Protocol TIDs (timestamp identifiers)
+
+A TID is the record key used for likes, posts, reposts etc. It is 13
+base32-sortable characters encoding a 64 bit integer: the top bit is always 0,
+the next 53 bits are microseconds since the UNIX epoch and the last 10 bits are
+a clock identifier. The creation time of a record can therefore be read from
+its record key without fetching the record."""
+from datetime import datetime, timedelta, timezone
+
+TID_LENGTH = 13
+CLOCK_ID_BITS = 10
+ALPHABET = "234567abcdefghijklmnopqrstuvwxyz"
+_VALUES = {c: i for i, c in enumerate(ALPHABET)}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def decode(tid):
+    """Return the integer value of the given TID. Raise ValueError if it isn't
+       a valid TID"""
+    if len(tid) != TID_LENGTH:
+        raise ValueError(f"Invalid TID `{tid}`: expected {TID_LENGTH} characters")
+
+    value = 0
+    for c in tid:
+        try:
+            value = (value << 5) | _VALUES[c]
+        except KeyError:
+            raise ValueError(f"Invalid TID `{tid}`: unexpected character "
+                             f"`{c}`") from None
+
+    if value >> 63:
+        raise ValueError(f"Invalid TID `{tid}`: top bit is set")
+    return value
+
+
+def encode(value):
+    """Return the TID string for the given integer value"""
+    chars = []
+    for _ in range(TID_LENGTH):
+        chars.append(ALPHABET[value & 0x1f])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def is_tid(tid):
+    """Indicate whether the given string is a valid TID"""
+    try:
+        decode(tid)
+        return True
+    except ValueError:
+        return False
+
+
+def to_datetime(tid):
+    """Return the UTC datetime encoded in the given TID"""
+    return _EPOCH + timedelta(microseconds=decode(tid) >> CLOCK_ID_BITS)
+
+
+def from_datetime(dt, clock_id=0):
+    """Return a TID for the given timezone aware datetime"""
+    microseconds = (dt - _EPOCH) // timedelta(microseconds=1)
+    return encode((microseconds << CLOCK_ID_BITS) | clock_id)
+
+
+def rkey_to_datetime(at_uri):
+    """Return the creation datetime encoded in the record key of the given
+       at:// URI or None if the record key is not a TID"""
+    rkey = at_uri.rsplit("/", 1)[-1]
+    try:
+        return to_datetime(rkey)
+    except ValueError:
+        return None
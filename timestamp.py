@@ -0,0 +1,36 @@
+"""Parse AT Protocol timestamps quickly and find date cutoffs in pages of items
+
+AT Protocol datetimes are ISO 8601 strings such as 2024-11-28T09:15:42.123Z,
+which datetime.fromisoformat() parses far faster than dateutil. Anything it
+doesn't accept falls back to dateutil's ISO parser. Results are memoized since
+the same timestamps are often parsed several times, e.g. for each notification
+about the same post."""
+
+import bisect
+import functools
+from datetime import datetime
+
+from lazyimport import lazy_import
+
+dateutil_parser = lazy_import("dateutil.parser")
+
+CACHE_SIZE = 8192
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse(value):
+    """Return the datetime of the given ISO 8601 string. Raise ValueError if it
+       isn't a valid date"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil_parser.isoparse(value)
+
+
+def cutoff(items, date_limit, key):
+    """Return the index of the first of the given items, newest first, that is
+       older than date_limit, or len(items) if none are. key(item) returns the
+       datetime of an item. Only O(log n) items are dated, the pages of author
+       feeds, likes and notifications are all in reverse chronological order."""
+    return bisect.bisect_left(range(len(items)), True,
+                              key=lambda i: key(items[i]) < date_limit)
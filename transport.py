@@ -0,0 +1,132 @@
+"""HTTP connection pool and transport settings of the API clients
+
+atproto gives each client an httpx client with default settings. A Transport
+builds the httpx clients with the connection pool size, keep-alive, HTTP/2,
+gzip and timeouts of the [transport] config section. One client and its pool
+is shared by every thread of a BlueSky instance, see BlueSky.client, and the
+async client of AsyncBlueSky gets its own with the same settings. HTTP/2 is
+used when the h2 package is installed."""
+
+import importlib.util
+import logging
+from dataclasses import dataclass
+
+from lazyimport import lazy_import
+
+atproto_client = lazy_import("atproto_client")
+httpx = lazy_import("httpx")
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+
+
+@dataclass
+class Transport:
+    """Connection pool and transport settings. Idle connections are kept open
+       for keepalive_expiry seconds. gzip asks for compressed responses.
+       HTTP/2 is only used if it's available, see http2_available()."""
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY
+    http2: bool = True
+    gzip: bool = True
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+
+    def __post_init__(self):
+        if self.max_connections < 1:
+            raise ValueError(f"Invalid max connections: {self.max_connections}")
+        if not 0 <= self.max_keepalive_connections <= self.max_connections:
+            raise ValueError(f"Invalid max keep-alive connections: "
+                             f"{self.max_keepalive_connections}. Expected 0 to "
+                             f"{self.max_connections}.")
+        for name in ("keepalive_expiry", "connect_timeout", "read_timeout"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"Invalid {name.replace('_', ' ')}: "
+                                 f"{getattr(self, name)}")
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a Transport from the [transport] section of the given config"""
+        def get(name, default):
+            return config.getfloat("transport", name, fallback=default)
+
+        return cls(max_connections=config.getint(
+                       "transport", "max_connections",
+                       fallback=DEFAULT_MAX_CONNECTIONS),
+                   max_keepalive_connections=config.getint(
+                       "transport", "max_keepalive_connections",
+                       fallback=DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+                   keepalive_expiry=get("keepalive_expiry",
+                                        DEFAULT_KEEPALIVE_EXPIRY),
+                   http2=config.getboolean("transport", "http2", fallback=True),
+                   gzip=config.getboolean("transport", "gzip", fallback=True),
+                   connect_timeout=get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+                   read_timeout=get("read_timeout", DEFAULT_READ_TIMEOUT))
+
+    def http2_available(self):
+        """Return whether HTTP/2 is enabled and httpx can use it, which needs
+           the h2 package"""
+        if not self.http2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logging.getLogger(__name__).debug(
+                    "HTTP/2 unavailable, install httpx[http2] to use it")
+            return False
+        return True
+
+    def limits(self):
+        """Return the httpx connection pool limits"""
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    def timeout(self):
+        """Return the httpx timeouts. Writes and waiting for a connection from
+           the pool time out like reads."""
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def headers(self):
+        """Return the headers sent with every request"""
+        return {"Accept-Encoding": "gzip, deflate" if self.gzip else "identity"}
+
+    def http_transport(self):
+        """Return an httpx transport with a connection pool of these settings"""
+        return httpx.HTTPTransport(limits=self.limits(),
+                                   http2=self.http2_available())
+
+    def async_http_transport(self):
+        """Return an async httpx transport with a connection pool of these
+           settings"""
+        return httpx.AsyncHTTPTransport(limits=self.limits(),
+                                        http2=self.http2_available())
+
+    # pylint: disable=W0212 (protected-access)
+    # atproto doesn't provide a way to give its requests an httpx client
+    def request(self, http_transport=None):
+        """Return an atproto Request whose httpx client uses the given
+           transport, a pooled http_transport() by default"""
+        request = atproto_client.request.Request()
+        request._client.close()
+        request._client = httpx.Client(
+                follow_redirects=True, timeout=self.timeout(),
+                headers=self.headers(),
+                transport=http_transport or self.http_transport())
+        return request
+
+    def async_request(self, http_transport=None):
+        """Return an atproto AsyncRequest whose httpx client uses the given
+           async transport, a pooled async_http_transport() by default"""
+        # AsyncRequest() creates an httpx client that could only be closed from
+        # the event loop, so initialize it without one and give it ours
+        request_cls = atproto_client.request.AsyncRequest
+        request = request_cls.__new__(request_cls)
+        atproto_client.request.RequestBase.__init__(request)
+        request._client = httpx.AsyncClient(
+                follow_redirects=True, timeout=self.timeout(),
+                headers=self.headers(),
+                transport=http_transport or self.async_http_transport())
+        return request
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """BlueSky command line interface: User command class"""
 
+import os
+
 import wcwidth
 import dateparse
 from basecmd import BaseCmd
@@ -38,44 +40,69 @@ class UserCmd(BaseCmd):
         for profile in self.bs.followers(handle):
             self.print_profile(profile, full=full)
 
-    def mutuals(self, handle, flag, full):
+    def mutuals(self, handle, flag, full, run_size=None):
         """If flag == both print the users that the given user follows and who
            are also followers of the given user
            If flag == follows-not-followers print entries of users that the user
            follows who don't follow back.
            If flag = followers-not-follows print entries of users that follow
-           this user that this user does not follow back"""
-        for profile in self.bs.get_mutuals(handle, flag):
+           this user that this user does not follow back
+           If run_size, or the [mutuals] run_size config value, is set at most
+           that many users of each side are held in memory and the rest are
+           spilled to [mutuals] spill_dir, or the system temporary directory"""
+        if run_size is None:
+            run_size = self.config.getint("mutuals", "run_size", fallback=None)
+        spill_dir = self.config.get("mutuals", "spill_dir", fallback=None)
+        for profile in self.bs.get_mutuals(
+                handle, flag, lean=True, run_size=run_size,
+                spill_dir=os.path.expanduser(spill_dir) if spill_dir else None):
             self.print_profile(profile, full=full)
 
-    def reposters(self, handle, date_limit, full):
+    def reposters(self, handle, date_limit, full, stored=False, top=None):
         """Print the user handles of the users that have reposted posts by the
-           given user handle. Optionally print the count of times each user has
-           reposted the user's posts"""
+           given user handle, most reposts first. Optionally print the count of
+           times each user has reposted the user's posts or only the top N
+           users"""
         total = 0
-        for repost_info in self.bs.get_reposters(handle, date_limit):
-            if full:
+        max_concurrency = self.config.getint(
+                "concurrency", "requests",
+                fallback=self.bs.REPOSTERS_CONCURRENCY)
+        for repost_info in self.bs.get_reposters(handle, date_limit, stored=stored,
+                                                 top=top,
+                                                 max_concurrency=max_concurrency,
+                                                 lean=True):
+            if self.formatter:
+                self.formatter.write("reposter", repost_info["profile"],
+                                     count=repost_info["count"],
+                                     post_uris=repost_info["post_uris"])
+                total += repost_info["count"]
+            elif full:
                 self.print_profile(repost_info["profile"], full=full)
-                for post in repost_info["posts"]:
-                    print(f"Post Link: {self.bs.at_uri_to_http_url(post.uri)}")
+                for uri in repost_info["post_uris"]:
+                    print(f"Post Link: {self.bs.at_uri_to_http_url(uri)}")
                 total += repost_info["count"]
                 print(f"Repost Count: {repost_info["count"]}")
                 print()
             else:
                 print(f"@{repost_info["profile"].handle}")
-        if full:
-            print(f"Total Reposts: {total}")
+        if full or self.formatter:
+            self.print_summary(f"Total Reposts: {total}")
 
-    def likes(self, date_limit, count_limit, show_date, short=False):
+    def likes(self, date_limit, count_limit, show_date, short=False,
+              exact_date=False):
         """Print details of the likes submitted by the currently authenticated user,
            optionally limited by the supplied date."""
         for like in self.bs.get_likes(date_limit,
                                       count_limit=count_limit,
-                                      get_date=show_date):
+                                      get_date=show_date or exact_date,
+                                      exact_date=exact_date):
             self.print_like(like, short)
 
     def print_like(self, like, short):
         """Print details of the given like structure"""
+        if self.formatter:
+            self.formatter.write("liked_post", like)
+            return
         if short:
             print(self.profile_name(like.post.author))
             print(f"Post Link: {self.bs.at_uri_to_http_url(like.post.uri)}")